@@ -0,0 +1,112 @@
+"""
+Microbenchmark of BabbageFiscalDataset.aggregate_by_refs against the list-based
+implementation it replaced, checking that both give identical output.
+
+Run with:
+```
+DJANGO_SETTINGS_MODULE=budgetportal.settings \\
+    python bin/benchmark_aggregate_by_refs.py --cells 10000 --groups 500
+```
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import django  # noqa: E402
+
+django.setup()
+
+from budgetportal import openspending  # noqa: E402
+from budgetportal.openspending import BabbageFiscalDataset  # noqa: E402
+
+
+def list_based_aggregate_by_refs(aggregate_refs, cells):
+    """The previous implementation, rescanning all cells for every group"""
+    aggregated_cells = list()
+    unique_reference_combos = list()
+    for cell in cells:
+        combo = tuple(cell[aggregate_refs[x]] for x in range(len(aggregate_refs)))
+        if combo not in unique_reference_combos:
+            unique_reference_combos.append(combo)
+
+    for unique_ref_combo in unique_reference_combos:
+        value_sum = 0
+        count_sum = 0
+        ex_cell = {}
+        for cell in cells:
+            if all(
+                cell[aggregate_refs[i]] == unique_ref_combo[i]
+                for i in range(len(aggregate_refs))
+            ):
+                if not ex_cell:
+                    for i in range(len(aggregate_refs)):
+                        ex_cell[aggregate_refs[i]] = cell[aggregate_refs[i]]
+                value_sum += cell["value.sum"]
+                count_sum += cell["_count"]
+        ex_cell["value.sum"] = value_sum
+        ex_cell["_count"] = count_sum
+        aggregated_cells.append(ex_cell)
+    return aggregated_cells
+
+
+def make_cells(cell_count, group_count, floats):
+    refs = ["department.department", "budget_phase.budget_phase", "year.year"]
+    cells = []
+    for i in range(cell_count):
+        group = random.randrange(group_count)
+        value = random.randrange(10**9)
+        cells.append(
+            {
+                refs[0]: "Department %d" % (group // 4),
+                refs[1]: "Phase %d" % (group % 4),
+                refs[2]: 2015 + group % 3,
+                "programme.programme": "Programme %d" % i,
+                "value.sum": value / 7.0 if floats else value,
+                "_count": 1,
+            }
+        )
+    return refs, cells
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cells", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--floats", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(0)
+    refs, cells = make_cells(args.cells, args.groups, args.floats)
+
+    implementations = [("list-based", list_based_aggregate_by_refs)]
+    if openspending.numpy is not None:
+        implementations.append(
+            ("dict-keyed + numpy", BabbageFiscalDataset.aggregate_by_refs)
+        )
+    threshold = openspending.NUMPY_AGGREGATION_THRESHOLD
+    openspending.NUMPY_AGGREGATION_THRESHOLD = float("inf")
+    implementations.append(("dict-keyed", BabbageFiscalDataset.aggregate_by_refs))
+
+    expected = json.dumps(list_based_aggregate_by_refs(refs, cells))
+    for name, fn in implementations:
+        if name == "dict-keyed + numpy":
+            openspending.NUMPY_AGGREGATION_THRESHOLD = threshold
+        else:
+            openspending.NUMPY_AGGREGATION_THRESHOLD = float("inf")
+        identical = json.dumps(fn(refs, cells)) == expected
+        seconds = min(
+            timeit.repeat(lambda: fn(refs, cells), number=1, repeat=args.repeat)
+        )
+        print(
+            "%-20s %10.2fms  identical output: %s" % (name, seconds * 1000, identical)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark of the six ranked package_search queries behind
+Department.get_contributed_datasets, run one after the other as before and
+concurrently with package_search_many, against a fake CKAN with a fixed
+latency. Checks that both give the datasets in the same order.
+
+Run with:
+```
+DJANGO_SETTINGS_MODULE=budgetportal.settings \\
+    python bin/benchmark_contributed_datasets.py --latency 300
+```
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import django  # noqa: E402
+
+django.setup()
+
+from budgetportal import datasets  # noqa: E402
+from budgetportal.datasets import package_search_many  # noqa: E402
+
+QUERY_COUNT = 6
+
+
+class FakeCKAN:
+    """Answers each query with its own packages after `latency` seconds"""
+
+    def __init__(self, latency, packages_per_query):
+        self.latency = latency
+        self.action = self
+        self.results = {}
+        for i in range(QUERY_COUNT):
+            # Broader queries also match many of the narrower queries' packages
+            names = random.sample(range(packages_per_query * 2), packages_per_query)
+            self.results["query %d" % i] = [make_package(n) for n in names]
+
+    def package_search(self, q, fq, rows):
+        time.sleep(self.latency)
+        return {"count": len(self.results[fq]), "results": self.results[fq]}
+
+
+def make_package(n):
+    return {
+        "name": "dataset-%d" % n,
+        "title": "Dataset %d" % n,
+        "state": "active",
+        "metadata_created": "2019-01-01T00:00:00",
+        "metadata_modified": "2019-01-01T00:00:00",
+        "author": "Author",
+        "author_email": "author@example.com",
+        "license_title": "CC-BY",
+        "organization": {"name": "contributor"},
+        "groups": [],
+        "resources": [],
+    }
+
+
+def rank(responses):
+    packages = OrderedDict()
+    for response in responses:
+        for package in response["results"]:
+            if package["name"] not in packages:
+                packages[package["name"]] = datasets.Dataset.from_package(package)
+    return [dataset.slug for dataset in packages.values()]
+
+
+def sequential(queries):
+    return rank(datasets.ckan.action.package_search(**q) for q in queries)
+
+
+def concurrent(queries):
+    return rank(package_search_many(queries))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=300, help="milliseconds")
+    parser.add_argument("--packages", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(0)
+    datasets.ckan = FakeCKAN(args.latency / 1000, args.packages)
+    queries = [
+        {"q": "", "fq": "query %d" % i, "rows": 1000} for i in range(QUERY_COUNT)
+    ]
+
+    expected = sequential(queries)
+    for name, fn in [("sequential", sequential), ("concurrent", concurrent)]:
+        identical = fn(queries) == expected
+        seconds = min(timeit.repeat(lambda: fn(queries), number=1, repeat=args.repeat))
+        print("%-20s %10.2fms  identical order: %s" % (name, seconds * 1000, identical))
+
+
+if __name__ == "__main__":
+    main()
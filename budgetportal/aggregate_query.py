@@ -0,0 +1,144 @@
+"""
+Canonical forms of OpenSpending aggregate queries.
+
+Callers build cuts like `ref + ':"value"'` or `ref + ":" + value`, in whatever
+order is convenient. AggregateQuery parses those into Cut objects and renders
+them in one canonical form, so that logically identical queries produce the same
+aggregate URL and hence share a cache entry.
+"""
+import logging
+import re
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+BARE_VALUE_RE = re.compile(r"^-?\d+$")
+# A value of a set of cut values: quoted parts may contain semicolons
+CUT_VALUE_RE = re.compile(r'(?:"[^"]*"|[^;"])+')
+
+
+class InvalidCut(ValueError):
+    pass
+
+
+class Cut(namedtuple("Cut", ["ref", "values"])):
+    """
+    A cut of ref to any of values, which are held as strings without quotes.
+    """
+
+    @classmethod
+    def parse(cls, cut):
+        """
+        Parses the Babbage cut syntax ref:value, where value may be double
+        quoted and a set of values is separated by semicolons.
+        """
+        if isinstance(cut, Cut):
+            return cut
+        ref, _, value = cut.partition(":")
+        if not ref or not value:
+            raise InvalidCut("Can't parse cut %s" % cut)
+        values = CUT_VALUE_RE.findall(value)
+        if not values:
+            raise InvalidCut("Can't parse cut %s" % cut)
+        return cls(ref, frozenset(strip_quotes(v) for v in values))
+
+    def matches(self, value):
+        return cut_value(value) in self.values
+
+    def __str__(self):
+        return "%s:%s" % (self.ref, ";".join(quote(v) for v in sorted(self.values)))
+
+
+class AggregateQuery(namedtuple("AggregateQuery", ["cuts", "drilldowns", "order"])):
+    """
+    An aggregate query with its cuts deduplicated and sorted, and duplicate
+    drilldowns removed. Drilldown order is kept since the order of cells can
+    depend on it when no order is given.
+    """
+
+    @classmethod
+    def build(cls, cuts=None, drilldowns=None, order=None):
+        cuts = tuple(
+            sorted(
+                set(Cut.parse(cut) for cut in cuts or []),
+                key=lambda cut: (cut.ref, sorted(cut.values)),
+            )
+        )
+        if drilldowns:
+            drilldowns = tuple(dict.fromkeys(drilldowns))
+        else:
+            drilldowns = None
+        order = tuple(order) if order is not None else None
+        return cls(cuts, drilldowns, order)
+
+    def params(self):
+        params = {}
+        if self.cuts:
+            params["cut"] = "|".join(str(cut) for cut in self.cuts)
+        if self.drilldowns is not None:
+            params["drilldown"] = "|".join(self.drilldowns)
+        if self.order is not None:
+            params["order"] = "|".join(self.order)
+        return params
+
+
+class CanonicalKeyStats:
+    """
+    Counts how many distinct queries, as callers wrote them, map onto each
+    canonical query.
+    """
+
+    def __init__(self):
+        self._canonical_keys = {}
+        self._lock = threading.Lock()
+
+    def record(self, raw_key, canonical_key):
+        with self._lock:
+            raw_keys = self._canonical_keys.setdefault(canonical_key, set())
+            if raw_key in raw_keys:
+                return
+            raw_keys.add(raw_key)
+        if len(raw_keys) > 1:
+            logger.info("query %s collapsed into %s", raw_key, canonical_key)
+
+    def summary(self):
+        with self._lock:
+            raw_key_count = sum(len(keys) for keys in self._canonical_keys.values())
+            canonical_key_count = len(self._canonical_keys)
+        return {
+            "raw_keys": raw_key_count,
+            "canonical_keys": canonical_key_count,
+            "collapsed_keys": raw_key_count - canonical_key_count,
+        }
+
+
+canonical_key_stats = CanonicalKeyStats()
+
+
+def raw_key(cuts=None, drilldowns=None, order=None):
+    """The query as callers wrote it, the way aggregate URLs used to be keyed"""
+    return "cut=%s&drilldown=%s&order=%s" % (
+        "|".join(str(cut) for cut in cuts or []),
+        "|".join(drilldowns or []),
+        "|".join(order or []),
+    )
+
+
+def strip_quotes(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def quote(value):
+    if BARE_VALUE_RE.match(value) or '"' in value:
+        return value
+    return '"%s"' % value
+
+
+def cut_value(value):
+    """The string a cut value is compared to for a value in a cell or fact"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
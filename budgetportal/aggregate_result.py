@@ -0,0 +1,117 @@
+"""
+A compact form of OpenSpending aggregate results for caching.
+
+Only the cells and paging counts of a result are kept. Cells are stored column
+by column, each column as its distinct values and an array of indexes into them,
+which pickles (and compresses, in the FileBasedCache) far smaller and faster
+than a dict per cell. Cells are read back as Cell views onto the columns.
+Cells without a column's key are coded one past the column's last value, and
+don't have the key when read back.
+"""
+from array import array
+from collections.abc import MutableMapping
+
+RESULT_KEYS = ["total_cell_count", "page", "page_size"]
+
+_DELETED = object()
+
+
+class Cell(MutableMapping):
+    """
+    A row of a compact aggregate result, used like the dict it replaces.
+    Keys set on a cell that aren't columns of the result are kept on the cell.
+    """
+
+    __slots__ = ("_columns", "_index", "_extra")
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+        self._extra = None
+
+    def __getitem__(self, key):
+        if self._extra is not None and key in self._extra:
+            value = self._extra[key]
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        try:
+            value = self._columns[key][self._index]
+        except KeyError:
+            raise KeyError(key)
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._columns and (self._extra is None or key not in self._extra):
+            self._columns[key][self._index] = value
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        self[key]
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = _DELETED
+
+    def __iter__(self):
+        extra = self._extra or {}
+        for key, column in self._columns.items():
+            value = extra[key] if key in extra else column[self._index]
+            if value is not _DELETED:
+                yield key
+        for key, value in extra.items():
+            if key not in self._columns and value is not _DELETED:
+                yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def compact_result(aggregate_result):
+    """
+    Returns the columns of the cells of an aggregate API response, with the
+    response's paging counts.
+    """
+    cells = aggregate_result["cells"]
+    refs = list(dict.fromkeys(ref for cell in cells for ref in cell))
+    compact = {key: aggregate_result.get(key, None) for key in RESULT_KEYS}
+    compact["cell_count"] = len(cells)
+    compact["columns"] = {}
+    for ref in refs:
+        # Keyed by type too, so that equal values like 100 and 100.0 stay distinct
+        values = {}
+        codes = array("I")
+        missing = []
+        for i, cell in enumerate(cells):
+            if ref in cell:
+                value = cell[ref]
+                codes.append(values.setdefault((type(value), value), len(values)))
+            else:
+                codes.append(0)
+                missing.append(i)
+        for i in missing:
+            codes[i] = len(values)
+        compact["columns"][ref] = ([value for _, value in values], codes)
+    return compact
+
+
+def expand_result(compact):
+    """Returns an aggregate result with Cell views onto the compact columns"""
+    columns = {}
+    for ref, (values, codes) in compact["columns"].items():
+        values = values + [_DELETED]
+        columns[ref] = [values[code] for code in codes]
+    aggregate_result = {key: compact[key] for key in RESULT_KEYS}
+    aggregate_result["cells"] = [Cell(columns, i) for i in range(compact["cell_count"])]
+    return aggregate_result
+
+
+def is_compact(cached_result):
+    return "columns" in cached_result
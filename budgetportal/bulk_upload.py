@@ -436,6 +436,9 @@ def queue_actions(post_data):
                 }
             )
             action_count += 1
+    if action_count:
+        # Tasks run one at a time, so this runs once the uploads are done
+        queue_cache_warming()
     return action_count
 
 
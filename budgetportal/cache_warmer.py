@@ -0,0 +1,122 @@
+"""
+Warms the page caches by requesting the pages listed in the sitemaps and the
+JSON endpoints those pages load, in priority order.
+
+The page cache is kept per host and keyed by the request's host, so pages are
+requested over HTTP from CACHE_WARMER_BASE_URL rather than rendered in-process.
+"""
+import logging
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.urls import reverse
+
+from .concurrency import get_executor, imap_ordered
+from .models import FinancialYear, Government
+from .sitemaps import sitemaps
+
+logger = logging.getLogger(__name__)
+
+# The phase the treemap and preview pages load their data for
+JSON_PHASE_SLUG = "original"
+
+# Sections warmed when no priority is given, most visited first. "json" is the
+# data the treemap, preview and focus pages load; the rest are sitemap sections.
+DEFAULT_PRIORITY = [
+    "static",
+    "json",
+    "national_departments",
+    "provincial_departments",
+    "department_preview",
+    "focus",
+    "search_results",
+    "infrastructure_projects",
+]
+
+WarmResult = namedtuple("WarmResult", ["path", "status", "duration_ms"])
+
+
+def iter_json_paths():
+    for year in FinancialYear.get_available_years():
+        yield reverse("consolidated-json", args=[year.slug])
+        yield reverse("focus-json", args=[year.slug])
+        for sphere_slug in ("national", "provincial"):
+            yield reverse(
+                "treemaps-json",
+                kwargs={
+                    "financial_year_id": year.slug,
+                    "sphere_slug": sphere_slug,
+                    "phase_slug": JSON_PHASE_SLUG,
+                },
+            )
+        governments = Government.objects.filter(
+            sphere__financial_year=year
+        ).select_related("sphere")
+        for government in governments:
+            yield reverse(
+                "department-preview-json",
+                kwargs={
+                    "financial_year_id": year.slug,
+                    "sphere_slug": government.sphere.slug,
+                    "government_slug": government.slug,
+                    "phase_slug": JSON_PHASE_SLUG,
+                },
+            )
+
+
+def iter_sitemap_paths(section):
+    sitemap = sitemaps[section]()
+    for item in sitemap.items():
+        yield sitemap.location(item)
+
+
+def iter_paths(priority=None):
+    """
+    Yields the path of each page to warm once, section by section in the
+    given priority order.
+    """
+    seen = set()
+    for section in priority or DEFAULT_PRIORITY:
+        if section == "json":
+            paths = iter_json_paths()
+        elif section in sitemaps:
+            paths = iter_sitemap_paths(section)
+        else:
+            raise ValueError("Unknown cache warmer section %r" % section)
+        for path in paths:
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+
+def warm_path(base_url, path):
+    start = time.monotonic()
+    try:
+        response = settings.HTTP_SESSION.get(
+            base_url.rstrip("/") + path, timeout=settings.CACHE_WARMER_TIMEOUT
+        )
+        status = response.status_code
+    except Exception:
+        logger.exception("Failed to warm %s", path)
+        status = None
+    duration_ms = (time.monotonic() - start) * 1000
+    logger.info("Warmed %s: %s in %.0fms", path, status, duration_ms)
+    return WarmResult(path, status, duration_ms)
+
+
+def warm(base_url=None, priority=None):
+    """
+    Requests each page in priority order, at most CACHE_WARMER_CONCURRENCY at a
+    time, yielding a WarmResult for each as it is done.
+    """
+    base_url = base_url or settings.CACHE_WARMER_BASE_URL
+    if not base_url:
+        raise ValueError("Set CACHE_WARMER_BASE_URL or give a base_url to warm")
+    executor = get_executor("cache-warmer", settings.CACHE_WARMER_CONCURRENCY)
+    return imap_ordered(
+        executor,
+        lambda path: warm_path(base_url, path),
+        iter_paths(priority),
+        settings.CACHE_WARMER_CONCURRENCY,
+    )
@@ -0,0 +1,179 @@
+"""
+The CKAN API client used throughout the portal as settings.CKAN.
+"""
+import json
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from hashlib import sha1
+
+from budgetportal import instrumentation
+from budgetportal.upstreams import get_upstream, is_unavailable
+from ckanapi import RemoteCKAN
+from django.conf import settings
+from django.core.cache import cache, caches
+
+logger = logging.getLogger(__name__)
+
+# Actions that only read, whose last result can stand in while CKAN is down
+READ_ACTION_SUFFIXES = ("_show", "_list", "_search")
+# Read actions whose results are reused for the client's cache_ttl
+CACHED_ACTIONS = frozenset(["package_search", "package_show", "group_show"])
+# Changed whenever the cached results are invalidated, so that other processes
+# drop theirs too. Each process reads it at most every GENERATION_CHECK_INTERVAL
+# seconds.
+GENERATION_KEY = "ckan-cache-generation"
+GENERATION_CHECK_INTERVAL = 5
+
+
+class CKANClient(RemoteCKAN):
+    """
+    A RemoteCKAN whose action calls (ckan.action.package_show etc.) are
+    recorded as upstream calls and go through the ckan bulkhead and circuit
+    breaker. When CKAN is unavailable, read actions return the last result
+    they got for the same arguments, if there is one. Those results are kept
+    in the "fallback" cache.
+
+    Results of CACHED_ACTIONS are kept in this process for cache_ttl seconds.
+    Code that changes CKAN datasets must call invalidate_cache() afterwards.
+    """
+
+    def __init__(self, address, cache_ttl=0, cache_max_entries=500, **kwargs):
+        super().__init__(address, **kwargs)
+        self.response_cache = ResponseCache(cache_ttl, cache_max_entries)
+
+    def call_action(self, action, data_dict=None, *args, **kwargs):
+        if action in CACHED_ACTIONS:
+            key = cache_key(action, data_dict)
+            result = self.response_cache.get(key)
+            if result is not None:
+                instrumentation.record("ckan", action, 0, "hit")
+                return result
+            result = self._call_action(action, data_dict, *args, **kwargs)
+            self.response_cache.set(key, result)
+            return result
+        return self._call_action(action, data_dict, *args, **kwargs)
+
+    def _call_action(self, action, data_dict, *args, **kwargs):
+        is_read = action.endswith(READ_ACTION_SUFFIXES)
+        try:
+            with get_upstream("ckan").guard(), instrumentation.timed("ckan", action):
+                result = super().call_action(action, data_dict, *args, **kwargs)
+        except Exception as e:
+            if not is_read or not is_unavailable(e):
+                raise
+            result = caches["fallback"].get(fallback_key(action, data_dict))
+            if result is None:
+                raise
+            logger.warning("CKAN %s failed, using last result", action, exc_info=True)
+            return result
+        if is_read:
+            caches["fallback"].set(
+                fallback_key(action, data_dict), result, settings.UPSTREAM_FALLBACK_TTL
+            )
+        return result
+
+    def invalidate_cache(self):
+        self.response_cache.invalidate()
+
+
+class ResponseCache:
+    """
+    A bounded, least recently used cache of pickled responses, so that each
+    caller gets its own copy to modify. Entries are dropped after ttl seconds
+    or when the shared generation changes.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if not self.ttl:
+            return None
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            return None
+        stored_at, generation, pickled = entry
+        if (
+            time.monotonic() - stored_at > self.ttl
+            or generation != shared_generation.get()
+        ):
+            with self._lock:
+                self._entries.pop(key, None)
+            return None
+        return pickle.loads(pickled)
+
+    def set(self, key, result):
+        if not self.ttl:
+            return
+        entry = (
+            time.monotonic(),
+            shared_generation.get(),
+            pickle.dumps(result, pickle.HIGHEST_PROTOCOL),
+        )
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+        shared_generation.change()
+
+
+class SharedGeneration:
+    """
+    The generation of the cached responses, shared by all processes through the
+    cache but read from it at most every GENERATION_CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._value = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._checked_at is not None
+                and now - self._checked_at < GENERATION_CHECK_INTERVAL
+            ):
+                return self._value
+        value = cache.get(GENERATION_KEY)
+        with self._lock:
+            self._value = value
+            self._checked_at = now
+        return value
+
+    def change(self):
+        value = uuid.uuid4().hex
+        cache.set(GENERATION_KEY, value, None)
+        with self._lock:
+            self._value = value
+            self._checked_at = time.monotonic()
+
+
+shared_generation = SharedGeneration()
+
+
+def cache_key(action, data_dict):
+    """The action with its arguments in a canonical order"""
+    arguments = {k: v for k, v in (data_dict or {}).items() if v is not None}
+    return "%s %s" % (action, json.dumps(arguments, sort_keys=True, default=str))
+
+
+def fallback_key(action, data_dict):
+    arguments = cache_key(action, data_dict)
+    return "ckan-fallback-%s-%s" % (action, sha1(arguments.encode("utf-8")).hexdigest())
@@ -0,0 +1,100 @@
+"""
+Helpers for running independent remote calls concurrently.
+
+The gunicorn workers monkey-patch threading with gevent (see gunicorn.config.py)
+so these thread pools are effectively bounded greenlet pools in production.
+"""
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """
+    Runs each function in a copy of the submitting thread's context, so that
+    context variables like the request's upstream call log carry over.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+def get_executor(name, max_workers):
+    """
+    Returns a process-wide executor for the given name, creating it on first use.
+    """
+    with _executors_lock:
+        executor = _executors.get(name, None)
+        if executor is None:
+            executor = ContextExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = executor
+        return executor
+
+
+def imap_ordered(executor, fn, items, window):
+    """
+    Lazily yields fn(item) for each item, in the order of items.
+
+    At most `window` calls are in flight at any time, so results are only
+    held in memory once they are about to be consumed.
+    """
+    items = iter(items)
+    in_flight = deque()
+    for item in items:
+        in_flight.append(executor.submit(fn, item))
+        if len(in_flight) >= window:
+            break
+    while in_flight:
+        result = in_flight.popleft().result()
+        for item in items:
+            in_flight.append(executor.submit(fn, item))
+            break
+        yield result
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key so that only the first caller
+    runs the function while the others wait for and share its result.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -29,7 +29,15 @@ def generate_csv_response(data):
 
 
 def iter_items(cells, pseudo_buffer):
-    headers_list = cells[0].keys()
+    """
+    cells can be any iterable of dicts, e.g. a generator walking the pages
+    of an OpenSpending aggregate result. The header is taken from the first.
+    """
+    cells = iter(cells)
+    first_cell = next(cells, None)
+    if first_cell is None:
+        return
+    headers_list = first_cell.keys()
     headers_dict = {}
     writer = csv.DictWriter(pseudo_buffer, fieldnames=sorted(headers_list))
 
@@ -38,5 +46,6 @@ def iter_items(cells, pseudo_buffer):
         headers_dict[header] = header
     yield writer.writerow(headers_dict)
 
+    yield writer.writerow(first_cell)
     for dict_object in cells:
         yield writer.writerow(dict_object)
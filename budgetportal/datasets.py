@@ -1,11 +1,13 @@
 import logging
 import os
 import shutil
-from pprint import pformat
+import threading
+import time
 from tempfile import mkdtemp
 from urllib.parse import unquote, urlparse
 from urllib.request import urlretrieve
 
+from budgetportal.concurrency import ContextExecutor, SingleFlight
 from budgetportal.openspending import (
     AdjustedEstimatesOfExpenditure,
     EstimatesOfExpenditure,
@@ -18,6 +20,12 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 ckan = settings.CKAN
 
+# Page size when paging through all the packages matching a package_search
+PACKAGE_PAGE_SIZE = 1000
+# CKAN caps organization_list with all_fields at 25 organizations per call by
+# default (ckan.group_and_organization_list_all_fields_max)
+ORGANIZATION_PAGE_SIZE = 25
+
 
 class Dataset:
     """
@@ -105,17 +113,7 @@ class Dataset:
         return "/datasets/%s/%s" % (self.category.slug, self.slug)
 
     def get_organization(self):
-        org = ckan.action.organization_show(id=self.organization_slug)
-        return {
-            "name": org["title"],
-            "logo_url": org["image_display_url"],
-            "slug": org["name"],
-            "url": org["url"] if "url" in org else None,
-            "telephone": org["telephone"] if "telephone" in org else None,
-            "email": org["email"] if "email" in org else None,
-            "facebook": org["facebook_id"] if "facebook_id" in org else None,
-            "twitter": org["twitter_id"] if "twitter_id" in org else None,
-        }
+        return organization_directory.get(self.organization_slug)
 
     def get_resource(self, format, name=None):
         """
@@ -154,6 +152,7 @@ class Dataset:
                 "format": format,
             }
             result = ckan.action.resource_create(**resource_fields)
+            ckan.invalidate_cache()
             logger.info(
                 "Upload result: resource '%s' to package %s %r", name, self.slug, result
             )
@@ -167,21 +166,8 @@ class Dataset:
 
     @staticmethod
     def get_contributed_datasets():
-        query = {
-            "q": "",
-            "fq": '-organization:"national-treasury" AND (*:* NOT groups:["" TO *])',
-            "rows": 1000,
-        }
-        response = ckan.action.package_search(**query)
-        if response["count"] > 1000:
-            raise Exception("Time to add paging")
-        logger.info(
-            "query %s\nto ckan returned %d results",
-            pformat(query),
-            len(response["results"]),
-        )
-        for package in response["results"]:
-            yield Dataset.from_package(package)
+        fq = '-organization:"national-treasury" AND (*:* NOT groups:["" TO *])'
+        return iter_datasets_by_name(fq)
 
     def get_openspending_api(self):
         if self._openspending_api is not None:
@@ -203,7 +189,12 @@ class Dataset:
             "in-year-spending": InYearExpenditure,
         }
         api_class = api_class_mapping[self.category.slug]
-        self._openspending_api = api_class(api_resource["url"])
+        self._openspending_api = api_class(
+            api_resource["url"],
+            version=self.last_updated_date,
+            local_cube=self.category.slug
+            in settings.OPENSPENDING_LOCAL_CUBE_CATEGORIES,
+        )
         return self._openspending_api
 
     @staticmethod
@@ -284,16 +275,11 @@ class Category:
         )
 
     def get_datasets(self):
-        datasets = []
+        """Yields the datasets in this category, sorted by name"""
         if self.slug == "contributed":
-            datasets = Dataset.get_contributed_datasets()
+            return Dataset.get_contributed_datasets()
         else:
-            packages = ckan.action.group_package_show(id=self.slug, limit=1000)
-            if len(packages) == 1000:
-                raise Exception("Too many packages to list like this")
-            for package in packages:
-                datasets.append(Dataset.from_package(package))
-        return sorted(datasets, key=lambda d: d.name)
+            return iter_datasets_by_name('+groups:"%s"' % self.slug)
 
     def get_url_path(self):
         return "/datasets/%s" % self.slug
@@ -310,6 +296,239 @@ class Category:
         )
 
 
+class DepartmentDatasetIndex:
+    """
+    The National Treasury packages of each financial year and sphere, keyed by
+    government slug, department slug and group, so that finding a department's
+    dataset doesn't need a package_search of its own.
+
+    An index is fetched with a few paged package_search calls, and fetched
+    again once the number of packages or the latest metadata_modified among
+    them changes.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._builds = SingleFlight()
+
+    def get_packages(
+        self, financial_year_slug, sphere_slug, government_slug, department_slug, group
+    ):
+        """Returns matching packages, most recently modified first"""
+        key = (financial_year_slug, sphere_slug)
+        signature = index_signature(*key)
+        entry = self._indexes.get(key, None)
+        if entry is None or entry[0] != signature:
+            entry = self._builds.do(key, lambda: self._build(key, signature))
+        return entry[1].get((government_slug, department_slug, group), [])
+
+    def _build(self, key, signature):
+        index = {}
+        package_count = 0
+        for package in iter_packages(index_query(*key)):
+            package_count += 1
+            extras = {
+                extra["key"]: extra["value"] for extra in package.get("extras", [])
+            }
+            government_slug = extras.get("geographic_region_slug", None)
+            department_slug = extras.get("department_name_slug", None)
+            for group in package.get("groups", []):
+                index_key = (government_slug, department_slug, group["name"])
+                index.setdefault(index_key, []).append(package)
+        logger.info("indexed %d packages for %r", package_count, key)
+        with self._lock:
+            self._indexes[key] = (signature, index)
+        return signature, index
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+department_dataset_index = DepartmentDatasetIndex()
+
+
+def index_query(financial_year_slug, sphere_slug):
+    return {
+        "q": "",
+        "fq": (
+            '+organization:"national-treasury"'
+            '+vocab_financial_years:"%s"'
+            '+vocab_spheres:"%s"'
+        )
+        % (financial_year_slug, sphere_slug),
+        "sort": "metadata_modified desc, name asc",
+    }
+
+
+def index_signature(financial_year_slug, sphere_slug):
+    return search_signature(index_query(financial_year_slug, sphere_slug))
+
+
+def search_signature(query):
+    """
+    The number of packages matching a package_search query sorted by
+    metadata_modified descending, and when the first of them was modified.
+    Like other package_search results, this is cached for CKAN_CACHE_TTL
+    seconds.
+    """
+    response = ckan.action.package_search(rows=1, **query)
+    results = response["results"]
+    latest = results[0]["metadata_modified"] if results else None
+    return response.get("count", None), latest
+
+
+def iter_packages(query):
+    """Yields all the packages matching a package_search query, page by page"""
+    start = 0
+    while True:
+        response = ckan.action.package_search(
+            rows=PACKAGE_PAGE_SIZE, start=start, **query
+        )
+        results = response["results"]
+        for package in results:
+            yield package
+        start += len(results)
+        if len(results) < PACKAGE_PAGE_SIZE or start >= response.get("count", start):
+            return
+
+
+def iter_datasets_by_name(fq):
+    """
+    Yields the Datasets of the packages matching a package_search filter
+    query, sorted by name (the package title) like sorted() would.
+
+    The sort order is worked out from just the title and name of each
+    package. The full packages are then paged through in roughly that order
+    as sorted by CKAN, and each is yielded as soon as all those before it
+    have been, so only packages that arrive out of order are held back.
+    """
+    query = {"q": "", "fq": fq, "sort": "title_string asc, name asc"}
+    names = [
+        name
+        for title, name in sorted(
+            (package["title"], package["name"])
+            for package in iter_packages(dict(query, fl=["name", "title"]))
+        )
+    ]
+    pending = {}
+    position = 0
+    for package in iter_packages(query):
+        pending[package["name"]] = package
+        while position < len(names) and names[position] in pending:
+            yield Dataset.from_package(pending.pop(names[position]))
+            position += 1
+    # Packages removed or added between the two passes
+    for name in names[position:]:
+        if name in pending:
+            yield Dataset.from_package(pending.pop(name))
+    for package in sorted(pending.values(), key=lambda p: (p["title"], p["name"])):
+        yield Dataset.from_package(package)
+
+
+def package_search_many(queries):
+    """
+    Runs independent package_search queries, given as dicts of their
+    arguments, concurrently and returns their responses in the same order.
+    Each call runs its queries on a pool of up to CKAN_QUERY_CONCURRENCY
+    threads of its own, so that one request's queries don't wait behind
+    another's.
+    """
+    if not queries:
+        return []
+    with ContextExecutor(
+        max_workers=min(len(queries), settings.CKAN_QUERY_CONCURRENCY),
+        thread_name_prefix="ckan-queries",
+    ) as executor:
+        futures = [executor.submit(ckan.action.package_search, **q) for q in queries]
+        return [future.result() for future in futures]
+
+
+class OrganizationDirectory:
+    """
+    The fields of all CKAN organizations by slug, fetched together with
+    paged organization_list calls and fetched again once they are
+    CKAN_ORGANIZATIONS_TTL seconds old, so that listing many datasets doesn't
+    need an organization_show per dataset. Organizations created since then
+    are fetched individually.
+    """
+
+    def __init__(self):
+        self._organizations = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._loads = SingleFlight()
+
+    def get(self, slug):
+        loaded_at = self._loaded_at
+        if (
+            loaded_at is None
+            or time.monotonic() - loaded_at > settings.CKAN_ORGANIZATIONS_TTL
+        ):
+            self._loads.do("organizations", self._load)
+        organization = self._organizations.get(slug, None)
+        if organization is None:
+            logger.info("organization_show id=%s", slug)
+            organization = organization_fields(ckan.action.organization_show(id=slug))
+            with self._lock:
+                self._organizations[slug] = organization
+        return dict(organization)
+
+    def _load(self):
+        organizations = {}
+        offset = 0
+        while True:
+            page = ckan.action.organization_list(
+                all_fields=True,
+                include_extras=True,
+                limit=ORGANIZATION_PAGE_SIZE,
+                offset=offset,
+            )
+            for organization in page:
+                organizations[organization["name"]] = organization_fields(organization)
+            offset += len(page)
+            if len(page) < ORGANIZATION_PAGE_SIZE:
+                break
+        logger.info("loaded %d organizations", len(organizations))
+        with self._lock:
+            self._organizations = organizations
+            self._loaded_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._organizations = {}
+            self._loaded_at = None
+
+
+organization_directory = OrganizationDirectory()
+
+
+def organization_fields(org):
+    # organization_list returns custom fields as extras, while
+    # organization_show returns them alongside the core fields
+    org = dict({extra["key"]: extra["value"] for extra in org.get("extras", [])}, **org)
+    return {
+        "name": org["title"],
+        "logo_url": org["image_display_url"],
+        "slug": org["name"],
+        "url": org["url"] if "url" in org else None,
+        "telephone": org["telephone"] if "telephone" in org else None,
+        "email": org["email"] if "email" in org else None,
+        "facebook": org["facebook_id"] if "facebook_id" in org else None,
+        "twitter": org["twitter_id"] if "twitter_id" in org else None,
+    }
+
+
+def resource_fields(resource):
+    return {
+        "name": resource["name"],
+        "url": resource["url"],
+        "description": resource["description"],
+        "format": resource["format"],
+    }
+
+
 class PackageDeletedException(Exception):
     pass
 
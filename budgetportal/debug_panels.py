@@ -0,0 +1,25 @@
+from debug_toolbar.panels import Panel
+
+
+class UpstreamCallsPanel(Panel):
+    """Lists the calls to OpenSpending, CKAN and MapIt made for the request"""
+
+    title = "Upstream calls"
+    template = "debug_toolbar/panels/upstream_calls.html"
+
+    @property
+    def nav_subtitle(self):
+        stats = self.get_stats()
+        return "%d calls in %.1fms" % (
+            len(stats.get("calls", [])),
+            stats.get("total_ms", 0),
+        )
+
+    def generate_stats(self, request, response):
+        calls = getattr(request, "upstream_calls", [])
+        self.record_stats(
+            {
+                "calls": calls,
+                "total_ms": sum(call.duration_ms for call in calls),
+            }
+        )
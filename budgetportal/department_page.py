@@ -0,0 +1,312 @@
+"""
+The sections of a department page that come from CKAN and OpenSpending, and
+the DepartmentPageData they are stored as.
+
+Each section has the sources it is computed from: the Datasets it reads,
+identified by when they were last modified, and any other values it depends
+on. Some sections are cached individually by their sources. A department's
+stored page data is served as is, and is rebuilt in the background when the
+sources of any of its sections change.
+"""
+import json
+import logging
+from collections import OrderedDict, namedtuple
+from hashlib import sha1
+
+from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django_q.tasks import async_task
+
+from .datasets import (
+    Dataset,
+    get_expenditure_time_series_dataset,
+    get_in_year_spending_dataset,
+    resource_fields,
+)
+from .json_encoder import JSONEncoder
+from .models import Department, DepartmentPageData
+from .summaries import InYearSpending
+
+logger = logging.getLogger(__name__)
+
+Section = namedtuple("Section", ["get_data", "get_sources"])
+
+# Sections slow enough to compute that they're cached when not stored
+CACHED_SECTIONS = [
+    "expenditure_over_time",
+    "budget_actual",
+    "budget_actual_programmes",
+    "adjusted_budget_summary",
+]
+
+# How often viewing a department page checks its stored data against its sources
+REVALIDATE_INTERVAL = 600
+
+
+def department_page_sections(department, financial_years):
+    """
+    The sections of a department page by name. financial_years are dicts with
+    the "id" of each available financial year.
+    """
+    sphere_slug = department.government.sphere.slug
+    return OrderedDict(
+        [
+            (
+                "expenditure_over_time",
+                Section(
+                    department.get_expenditure_over_time,
+                    lambda: [
+                        department.get_estimates_of_econ_classes_expenditure_dataset(),
+                        Dataset.get_latest_cpi_resource(),
+                    ],
+                ),
+            ),
+            (
+                "budget_actual",
+                Section(
+                    department.get_expenditure_time_series_summary,
+                    lambda: [
+                        get_expenditure_time_series_dataset(sphere_slug),
+                        Dataset.get_latest_cpi_resource(),
+                        config.IN_YEAR_SPENDING_ENABLED,
+                    ],
+                ),
+            ),
+            (
+                "budget_actual_programmes",
+                Section(
+                    department.get_expenditure_time_series_by_programme,
+                    lambda: [get_expenditure_time_series_dataset(sphere_slug)],
+                ),
+            ),
+            (
+                "adjusted_budget_summary",
+                Section(
+                    department.get_adjusted_budget_summary,
+                    lambda: [department.get_adjusted_estimates_expenditure_dataset()],
+                ),
+            ),
+            (
+                "contributed_datasets",
+                Section(
+                    lambda: get_contributed_datasets_section(department),
+                    department.get_contributed_datasets_signature,
+                ),
+            ),
+            (
+                "department_budget",
+                Section(
+                    lambda: get_budget_documents_section(
+                        department, "budget-vote-documents"
+                    ),
+                    lambda: [
+                        department.get_dataset(group_name="budget-vote-documents")
+                    ],
+                ),
+            ),
+            (
+                "department_adjusted_budget",
+                Section(
+                    lambda: get_budget_documents_section(
+                        department, "adjusted-budget-vote-documents"
+                    ),
+                    lambda: [
+                        department.get_dataset(
+                            group_name="adjusted-budget-vote-documents"
+                        )
+                    ],
+                ),
+            ),
+            (
+                "budgeted_and_actual_comparison",
+                Section(
+                    lambda: get_in_year_spending_urls(department, financial_years),
+                    lambda: [
+                        get_in_year_spending_dataset(fy["id"]) for fy in financial_years
+                    ],
+                ),
+            ),
+        ]
+    )
+
+
+def page_section_functions(department, financial_years):
+    """
+    The functions computing the sections of a department page by name, with
+    CACHED_SECTIONS wrapped by cached_section, to pass to views.get_sections.
+    """
+    functions = OrderedDict()
+    for name, section in department_page_sections(department, financial_years).items():
+        if name in CACHED_SECTIONS:
+            functions[name] = cached_section(
+                department, name, section.get_data, section.get_sources
+            )
+        else:
+            functions[name] = section.get_data
+    return functions
+
+
+def cached_section(department, name, get_section, get_sources):
+    """
+    Wraps a department page section so that its data is cached for
+    PAGE_SECTION_CACHE_TTL seconds, keyed by the department, its financial
+    year and the sources of the section, which get_sources returns. A change
+    to one section's sources doesn't invalidate the other sections.
+    """
+
+    def get_cached_section():
+        sources = json.dumps(
+            [department.name] + [source_version(s) for s in get_sources()],
+            cls=JSONEncoder,
+        )
+        key = "department-page-section-%s-%s-%s-%s" % (
+            name,
+            department.pk,
+            department.get_financial_year().slug,
+            sha1(sources.encode("utf-8")).hexdigest(),
+        )
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["data"]
+        data = get_section()
+        cache.set(key, {"data": data}, settings.PAGE_SECTION_CACHE_TTL)
+        return data
+
+    get_cached_section.__name__ = name
+    return get_cached_section
+
+
+def source_version(source):
+    if isinstance(source, Dataset):
+        return [source.slug, source.last_updated_date]
+    return source
+
+
+def department_page_source_version(department, financial_years):
+    """
+    Changes whenever the sources of any of the department's page sections
+    change, whether in-year spending is enabled changes, or the available
+    financial years change, which is when its stored DepartmentPageData needs
+    to be rebuilt.
+    """
+    sections = department_page_sections(department, financial_years)
+    version = json.dumps(
+        [
+            [year["id"] for year in financial_years],
+            department.name,
+            config.IN_YEAR_SPENDING_ENABLED,
+            [
+                [name, [source_version(s) for s in section.get_sources()]]
+                for name, section in sections.items()
+            ],
+        ],
+        cls=JSONEncoder,
+    )
+    return sha1(version.encode("utf-8")).hexdigest()
+
+
+def build_department_page_data(department, financial_years):
+    """
+    Computes the department page sections as JSON to store as
+    DepartmentPageData, raising instead of leaving out sections that fail.
+    """
+    sections = department_page_sections(department, financial_years)
+    data = {name: section.get_data() for name, section in sections.items()}
+    return json.dumps(data, cls=JSONEncoder)
+
+
+def materialize(department, financial_years, force=False):
+    """
+    Stores the department's page data if its sources changed since it was
+    built, or if force is set. Returns "Built" or "Current".
+    """
+    version = department_page_source_version(department, financial_years)
+    page_data = DepartmentPageData.objects.filter(department=department).first()
+    if page_data and page_data.is_current(version) and not force:
+        return "Current"
+    DepartmentPageData.objects.update_or_create(
+        department=department,
+        defaults={
+            "format_version": DepartmentPageData.FORMAT_VERSION,
+            "source_version": version,
+            "data": build_department_page_data(department, financial_years),
+        },
+    )
+    return "Built"
+
+
+def get_materialized_sections(department):
+    """
+    Returns the stored department page sections, or None if there are none in
+    the current format. Computing the version of their sources takes several
+    upstream calls, so they're returned without checking it, and a check that
+    rebuilds them if their sources changed is queued instead.
+    """
+    page_data = DepartmentPageData.objects.filter(department=department).first()
+    if page_data is None or page_data.format_version != page_data.FORMAT_VERSION:
+        return None
+    queue_revalidation(department)
+    return json.loads(page_data.data)
+
+
+def queue_revalidation(department):
+    """
+    Queues a rebuild of the department's stored page data if its sources
+    changed, unless one was queued in the last REVALIDATE_INTERVAL seconds.
+    """
+    key = "department-page-revalidation-queued-%s" % department.pk
+    if cache.add(key, True, REVALIDATE_INTERVAL):
+        async_task(
+            "budgetportal.tasks.materialize_department_page",
+            department_id=department.pk,
+            task_name="Materialize %s" % department.get_url_path(),
+        )
+
+
+def get_contributed_datasets_section(department):
+    contributed_datasets = []
+    for dataset in department.get_contributed_datasets():
+        contributed_datasets.append(
+            {
+                "name": dataset.name,
+                "contributor": dataset.get_organization()["name"],
+                "url_path": dataset.get_url_path(),
+            }
+        )
+    return contributed_datasets if contributed_datasets else None
+
+
+def get_budget_documents_section(department, group_name):
+    dataset = department.get_dataset(group_name=group_name)
+    if not dataset:
+        return None
+    document_resource = dataset.get_resource(format="PDF")
+    if document_resource:
+        document_resource = resource_fields(document_resource)
+    tables_resource = dataset.get_resource(format="XLS") or dataset.get_resource(
+        format="XLSX"
+    )
+    if tables_resource:
+        tables_resource = resource_fields(tables_resource)
+    return {
+        "name": dataset.name,
+        "document": document_resource,
+        "tables": tables_resource,
+    }
+
+
+def get_in_year_spending_urls(department, financial_years):
+    urls = {}
+
+    for fy in financial_years:
+        department_obj = Department.objects.filter(
+            name=department.name,
+            government__sphere__slug="national",
+            government__sphere__financial_year__slug=fy["id"],
+        ).first()
+        year = fy["id"]
+        comparison_obj = InYearSpending(department_obj)
+        urls[year] = comparison_obj.get_detail_csv_url()
+
+    return urls
@@ -0,0 +1,92 @@
+"""
+The HTTP client shared by all calls to CKAN, the CKAN datastore, OpenSpending
+and MapIt, available as settings.HTTP_SESSION.
+
+One session keeps connections alive between calls, so each call doesn't pay
+for a new TCP and TLS handshake. The connection pools are safe to share between
+gevent greenlets, and calls block while a host's pool is exhausted, which caps
+the number of connections to each upstream host per worker process. The pools
+are sized to fit the upstream bulkheads using each host (see upstreams.py), so
+calls that got a bulkhead slot don't wait for a connection.
+
+Since the session is shared by unrelated upstreams, it doesn't keep cookies.
+"""
+import contextvars
+import time
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses worth retrying: the upstream or its proxy is briefly unavailable
+RETRY_STATUSES = (502, 503, 504)
+# Uploads with file bodies can't be replayed, so only reads are retried on status
+RETRY_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+
+# When the request being made must be done by, retries included
+_retry_deadline = contextvars.ContextVar("retry_deadline", default=None)
+
+
+class RejectAllCookies(DefaultCookiePolicy):
+    def set_ok(self, cookie, request):
+        return False
+
+
+class DeadlineRetry(Retry):
+    """
+    Retry that is exhausted once a retry, after its backoff, would start after
+    the deadline of the request being made.
+    """
+
+    def is_exhausted(self):
+        if super().is_exhausted():
+            return True
+        deadline = _retry_deadline.get()
+        return (
+            deadline is not None
+            and time.monotonic() + self.get_backoff_time() > deadline
+        )
+
+
+class PooledSession(requests.Session):
+    """
+    A requests Session with a default timeout, bounded per-host connection
+    pools, and retries with backoff for connection errors and for RETRY_METHODS
+    requests that get a RETRY_STATUSES response. Retries are only started
+    within retry_budget seconds of the start of the request.
+    """
+
+    def __init__(
+        self, timeout, retries, pool_maxsize, pool_hosts=10, retry_budget=None
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.retry_budget = retry_budget
+        self.cookies.set_policy(RejectAllCookies())
+        retry = DeadlineRetry(
+            total=retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_hosts,
+            pool_maxsize=pool_maxsize,
+            pool_block=True,
+            max_retries=retry,
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout", None) is None:
+            kwargs["timeout"] = self.timeout
+        if self.retry_budget is None:
+            return super().request(method, url, **kwargs)
+        token = _retry_deadline.set(time.monotonic() + self.retry_budget)
+        try:
+            return super().request(method, url, **kwargs)
+        finally:
+            _retry_deadline.reset(token)
@@ -0,0 +1,132 @@
+"""
+Records every call to an upstream service (OpenSpending, CKAN, the CKAN
+datastore, MapIt): which service and endpoint, whether it was answered from a
+cache, and how long it took.
+
+Calls are collected per request, for the Server-Timing header and the debug
+toolbar panel, and into rolling latency windows per service for the upstream
+metrics endpoint. Both are per worker process.
+"""
+import contextvars
+import math
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from contextlib import contextmanager
+
+# How many of the most recent calls per service the percentiles are taken over
+LATENCY_WINDOW = 1000
+
+UpstreamCall = namedtuple(
+    "UpstreamCall", ["service", "endpoint", "cache", "duration_ms", "detail"]
+)
+
+_request_calls = contextvars.ContextVar("upstream_calls", default=None)
+
+
+class LatencyWindows:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.window = window
+        self._durations = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, call):
+        with self._lock:
+            durations = self._durations.get(call.service, None)
+            if durations is None:
+                durations = deque(maxlen=self.window)
+                self._durations[call.service] = durations
+                self._counts[call.service] = {"calls": 0, "cached": 0}
+            durations.append(call.duration_ms)
+            counts = self._counts[call.service]
+            counts["calls"] += 1
+            if call.cache not in (None, "miss"):
+                counts["cached"] += 1
+
+    def summary(self):
+        with self._lock:
+            snapshot = {
+                service: (sorted(durations), dict(self._counts[service]))
+                for service, durations in self._durations.items()
+            }
+        summary = {}
+        for service, (durations, counts) in sorted(snapshot.items()):
+            summary[service] = dict(
+                counts,
+                window=len(durations),
+                p50=percentile(durations, 50),
+                p95=percentile(durations, 95),
+                p99=percentile(durations, 99),
+            )
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+
+
+latency_windows = LatencyWindows()
+
+
+def start_request():
+    """Starts collecting the calls made while handling a request"""
+    return _request_calls.set([])
+
+
+def end_request(token):
+    """Stops collecting and returns the calls made since start_request"""
+    calls = _request_calls.get()
+    _request_calls.reset(token)
+    return calls or []
+
+
+def record(service, endpoint, duration_ms, cache=None, detail=None):
+    call = UpstreamCall(service, endpoint, cache, duration_ms, detail)
+    calls = _request_calls.get()
+    if calls is not None:
+        calls.append(call)
+    latency_windows.add(call)
+
+
+@contextmanager
+def timed(service, endpoint, cache=None, detail=None):
+    """
+    Records the duration of the with block as a call. The yielded dict's
+    "cache" can be updated inside the block once the outcome is known.
+    """
+    outcome = {"cache": cache}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        record(service, endpoint, duration_ms, outcome["cache"], detail)
+
+
+def server_timing(calls):
+    """
+    Returns a Server-Timing header value with the total duration and number
+    of calls to each service. Concurrent calls are summed.
+    """
+    services = OrderedDict()
+    for call in calls:
+        totals = services.setdefault(call.service, {"dur": 0, "calls": 0, "cached": 0})
+        totals["dur"] += call.duration_ms
+        totals["calls"] += 1
+        if call.cache not in (None, "miss"):
+            totals["cached"] += 1
+    return ", ".join(
+        '%s;dur=%.1f;desc="%d calls, %d cached"'
+        % (service, totals["dur"], totals["calls"], totals["cached"])
+        for service, totals in services.items()
+    )
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(math.ceil(percent / 100.0 * len(sorted_values))))
+    return round(sorted_values[rank - 1], 1)
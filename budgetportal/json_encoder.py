@@ -2,6 +2,8 @@ import datetime
 import decimal
 import json
 
+from budgetportal.aggregate_result import Cell
+
 
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
@@ -9,4 +11,6 @@ class JSONEncoder(json.JSONEncoder):
             return str(o)
         if isinstance(o, (datetime.date, datetime.datetime)):
             return o.isoformat()
+        if isinstance(o, Cell):
+            return dict(o)
         return json.JSONEncoder.default(self, o)
@@ -0,0 +1,48 @@
+from budgetportal import tasks
+from budgetportal.models import FinancialYear
+from django.core.management.base import BaseCommand
+from django_q.tasks import async_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Store the CKAN and OpenSpending sections of the department pages of a "
+        "financial year, rebuilding those whose sources changed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "financial_year",
+            type=str,
+            nargs="?",
+            help="e.g. 2019-20. Defaults to the latest financial year.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild all the departments, even those that are current",
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue a background task instead of building them now",
+        )
+
+    def handle(self, *args, **options):
+        financial_year_slug = (
+            options["financial_year"] or FinancialYear.get_latest_year().slug
+        )
+        if options["queue"]:
+            async_task(
+                tasks.materialize_department_pages,
+                financial_year_slug=financial_year_slug,
+                force=options["force"],
+                task_name="Materialize department pages for %s" % financial_year_slug,
+            )
+            self.stdout.write("Queued %s" % financial_year_slug)
+        else:
+            statuses = tasks.materialize_department_pages(
+                financial_year_slug, force=options["force"]
+            )
+            for status, count in sorted(statuses.items()):
+                self.stdout.write("%s: %d" % (status, count))
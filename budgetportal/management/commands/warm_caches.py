@@ -0,0 +1,47 @@
+from budgetportal import cache_warmer, tasks
+from django.core.management.base import BaseCommand
+from django_q.tasks import async_task
+
+
+class Command(BaseCommand):
+    help = (
+        "Request the sitemap pages and the JSON they load so that they are cached, "
+        "printing how long each took"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--priority",
+            nargs="+",
+            metavar="SECTION",
+            help=(
+                "Sections to warm, in this order. Defaults to %s"
+                % " ".join(cache_warmer.DEFAULT_PRIORITY)
+            ),
+        )
+        parser.add_argument(
+            "--base-url", help="Defaults to the CACHE_WARMER_BASE_URL setting"
+        )
+        parser.add_argument(
+            "--queue",
+            action="store_true",
+            help="Queue a background task instead of warming them now",
+        )
+
+    def handle(self, *args, **options):
+        if options["queue"]:
+            async_task(
+                tasks.warm_caches,
+                priority=options["priority"],
+                base_url=options["base_url"],
+                task_name="Warm caches",
+            )
+            self.stdout.write("Queued")
+        else:
+            results = cache_warmer.warm(
+                base_url=options["base_url"], priority=options["priority"]
+            )
+            for result in results:
+                self.stdout.write(
+                    "%s %8.0fms %s" % (result.status, result.duration_ms, result.path)
+                )
@@ -0,0 +1,24 @@
+from budgetportal import instrumentation
+
+
+class UpstreamTimingMiddleware:
+    """
+    Collects the upstream calls made while handling each request, keeps them
+    on the request as request.upstream_calls for the debug toolbar, and
+    summarises them per service in a Server-Timing response header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = instrumentation.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            request.upstream_calls = instrumentation.end_request(token)
+        if request.upstream_calls:
+            response["Server-Timing"] = instrumentation.server_timing(
+                request.upstream_calls
+            )
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("budgetportal", "0071_auto_20230605_1521"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DepartmentPageData",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("format_version", models.PositiveIntegerField()),
+                ("source_version", models.CharField(max_length=40)),
+                ("data", models.TextField()),
+                ("built_at", models.DateTimeField(auto_now=True)),
+                (
+                    "department",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="page_data",
+                        to="budgetportal.Department",
+                    ),
+                ),
+            ],
+        ),
+    ]
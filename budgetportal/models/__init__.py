@@ -4,11 +4,11 @@ import uuid
 from collections import OrderedDict
 from datetime import datetime
 
-import requests
 from slugify import slugify
 
 import ckeditor.fields as ckeditor_fields
 from adminsortable.models import SortableMixin
+from budgetportal import instrumentation
 from budgetportal.blocks import DescriptionEmbedBlock, SectionBlock
 from budgetportal.datasets import Dataset
 from django.conf import settings
@@ -30,6 +30,7 @@ from .government import (
     Government,
     GovtFunction,
     Department,
+    DepartmentPageData,
     Programme,
     SPHERE_SLUG_CHOICES,
     NATIONAL_SLUG,
@@ -39,6 +40,7 @@ from .government import (
 
 logger = logging.getLogger(__name__)
 ckan = settings.CKAN
+http_session = settings.HTTP_SESSION
 
 MAPIT_POINT_API_URL = "https://mapit.code4sa.org/point/4326/{},{}"
 
@@ -160,12 +162,13 @@ class InfrastructureProjectPart(models.Model):
         if province_name == "cache-miss":
             logger.info(f"Coordinate Province Cache MISS for coordinate {key}")
             params = {"type": "PR"}
-            province_result = requests.get(
-                MAPIT_POINT_API_URL.format(
-                    coordinate["longitude"], coordinate["latitude"]
-                ),
-                params=params,
-            )
+            with instrumentation.timed("mapit", "point", "miss"):
+                province_result = http_session.get(
+                    MAPIT_POINT_API_URL.format(
+                        coordinate["longitude"], coordinate["latitude"]
+                    ),
+                    params=params,
+                )
             province_result.raise_for_status()
             r = province_result.json()
             list_of_objects_returned = list(r.values())
@@ -176,6 +179,7 @@ class InfrastructureProjectPart(models.Model):
             cache.set(key, province_name)
         else:
             logger.info(f"Coordinate Province Cache HIT for coordinate {key}")
+            instrumentation.record("mapit", "point", 0, "hit")
         return province_name
 
     @staticmethod
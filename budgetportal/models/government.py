@@ -1,8 +1,19 @@
 from autoslug import AutoSlugField
-from budgetportal.datasets import Dataset, get_expenditure_time_series_dataset
+from budgetportal import instrumentation
+from budgetportal.datasets import (
+    Dataset,
+    department_dataset_index,
+    get_expenditure_time_series_dataset,
+    package_search_many,
+    search_signature,
+)
+from budgetportal.openspending import aggregate_many
+from budgetportal.upstreams import get_upstream, is_unavailable
 from collections import OrderedDict
 from decimal import Decimal
+from hashlib import sha1
 from django.conf import settings
+from django.core.cache import cache, caches
 from django.db import models
 from partial_index import PartialIndex
 from pprint import pformat
@@ -10,11 +21,11 @@ from slugify import slugify
 from urllib.parse import quote
 import logging
 from django.urls import reverse
-import requests
 from constance import config
 
 logger = logging.getLogger(__name__)
 ckan = settings.CKAN
+http_session = settings.HTTP_SESSION
 
 NATIONAL_SLUG = "national"
 PROVINCIAL_SLUG = "provincial"
@@ -58,6 +69,7 @@ DIRECT_CHARGE_NRF = "Direct charge against the National Revenue Fund"
 URL_LENGTH_LIMIT = 2000
 
 CKAN_DATASTORE_URL = settings.CKAN_URL + "/api/3/action" "/datastore_search_sql"
+DATASTORE_PAGE_SIZE = 1000
 
 
 class FinancialYear(models.Model):
@@ -102,6 +114,43 @@ class FinancialYear(models.Model):
             return government, False
         return department, True
 
+    @classmethod
+    def get_closest_match_paths(
+        cls, years, sphere_slug, government_slug, department_slug
+    ):
+        """
+        Returns a dict from each year's slug to the URL path of the department
+        with these slugs in that year, or of its government if the department
+        isn't in that year, and whether it is an exact match.
+
+        This is get_closest_match for several years in one query. Years without
+        the government fall back to the year itself.
+        """
+        governments = (
+            Government.objects.filter(
+                sphere__financial_year__in=years,
+                sphere__slug=sphere_slug,
+                slug=government_slug,
+            )
+            .select_related("sphere__financial_year")
+            .annotate(
+                has_department=models.Exists(
+                    Department.objects.filter(
+                        government=models.OuterRef("pk"), slug=department_slug
+                    )
+                )
+            )
+        )
+        matches = {year.slug: (year.get_url_path(), False) for year in years}
+        for government in governments:
+            if government.has_department:
+                department = Department(government=government, slug=department_slug)
+                match = (department.get_url_path(), True)
+            else:
+                match = (government.get_url_path(), False)
+            matches[government.sphere.financial_year.slug] = match
+        return matches
+
     @classmethod
     def get_available_years(cls):
         years = list(cls.objects.filter(published=True).order_by("-slug")[:4])
@@ -293,7 +342,9 @@ class Department(models.Model):
             "tags": tags,
         }
         logger.info("Creating package with %r", dataset_fields)
-        return Dataset.from_package(ckan.action.package_create(**dataset_fields))
+        package = ckan.action.package_create(**dataset_fields)
+        ckan.invalidate_cache()
+        return Dataset.from_package(package)
 
     def get_latest_website_url(self):
         """Always return the latest available non-null URL, even for old departments."""
@@ -369,34 +420,24 @@ class Department(models.Model):
         If name isn't provided, still assume there's just one dataset
         in the specified group categorised to match this department.
         """
-        query = {
-            "q": "",
-            "fq": (
-                '+organization:"national-treasury"'
-                '+vocab_financial_years:"%s"'
-                '+vocab_spheres:"%s"'
-                '+extras_s_geographic_region_slug:"%s"'
-                '+extras_s_department_name_slug:"%s"'
-                '+groups:"%s"'
-            )
-            % (
-                self.government.sphere.financial_year.slug,
-                self.government.sphere.slug,
-                self.government.slug,
-                self.get_primary_department().slug,
-                group_name,
-            ),
-            "rows": 1,
-        }
+        packages = department_dataset_index.get_packages(
+            self.government.sphere.financial_year.slug,
+            self.government.sphere.slug,
+            self.government.slug,
+            self.get_primary_department().slug,
+            group_name,
+        )
         if name:
-            query["fq"] += '+name:"%s"' % name
-        response = ckan.action.package_search(**query)
+            packages = [p for p in packages if p["name"] == name]
         logger.info(
-            "query %s\nreturned %d results", pformat(query), len(response["results"])
+            "%s datasets for %s in %s: %d",
+            group_name,
+            self.slug,
+            self.government.slug,
+            len(packages),
         )
-        if response["results"]:
-            assert len(response["results"]) == 1
-            return Dataset.from_package(response["results"][0])
+        if packages:
+            return Dataset.from_package(packages[0])
 
     def _get_functions_query(self):
         function_names = [f.name for f in self.get_govt_functions()]
@@ -414,7 +455,33 @@ class Department(models.Model):
         # We use an OrderedDict like an Ordered Set to ensure we include each
         # match just once, and at the highest rank it came up in.
         datasets = OrderedDict()
+        queries = [
+            {"q": "", "fq": fq, "rows": 1000}
+            for fq in self._get_contributed_datasets_queries()
+        ]
+        for params, response in zip(queries, package_search_many(queries)):
+            logger.info(
+                "query %s\nto ckan returned %d results",
+                pformat(params),
+                len(response["results"]),
+            )
+            for package in response["results"]:
+                if package["name"] not in datasets:
+                    dataset = Dataset.from_package(package)
+                    datasets[package["name"]] = dataset
+        return datasets.values()
+
+    def get_contributed_datasets_signature(self):
+        """
+        Changes when any dataset that get_contributed_datasets could return
+        changes. The last two queries match all the datasets the others do.
+        """
+        return [
+            search_signature({"q": "", "fq": fq, "sort": "metadata_modified desc"})
+            for fq in self._get_contributed_datasets_queries()[-2:]
+        ]
 
+    def _get_contributed_datasets_queries(self):
         fq_org = '-organization:"national-treasury"'
         fq_group = '+(*:* NOT groups:["" TO *])'
         fq_year = self._get_financial_year_query()
@@ -430,19 +497,7 @@ class Department(models.Model):
             (fq_org, fq_group, fq_functions),
             (fq_org, fq_group, fq_no_functions),
         ]
-        for query in queries:
-            params = {"q": "", "fq": "".join(query), "rows": 1000}
-            response = ckan.action.package_search(**params)
-            logger.info(
-                "query %s\nto ckan returned %d results",
-                pformat(params),
-                len(response["results"]),
-            )
-            for package in response["results"]:
-                if package["name"] not in datasets:
-                    dataset = Dataset.from_package(package)
-                    datasets[package["name"]] = dataset
-        return datasets.values()
+        return ["".join(query) for query in queries]
 
     def get_estimates_of_econ_classes_expenditure_dataset(self, level=3):
         if (
@@ -536,20 +591,12 @@ class Department(models.Model):
             return None
 
     def get_expenditure_over_time(self):
-        cpi_year_slug, cpi_resource_id = Dataset.get_latest_cpi_resource()
-        base_year = get_base_year(cpi_year_slug)
         financial_year_start = self.get_financial_year().get_starting_year()
         financial_year_start_int = int(financial_year_start)
         financial_year_starts = [
             str(y)
             for y in range(financial_year_start_int - 4, financial_year_start_int + 3)
         ]
-        expenditure = {
-            "base_financial_year": FinancialYear.slug_from_year_start(str(base_year)),
-            "nominal": [],
-            "real": [],
-        }
-
         dataset = self.get_estimates_of_econ_classes_expenditure_dataset()
         if not dataset:
             return None
@@ -567,6 +614,12 @@ class Department(models.Model):
 
         if result["cells"]:
             cpi = get_cpi()
+            expenditure = {
+                "base_financial_year": cpi.base_financial_year,
+                "nominal": [],
+                "real": [],
+            }
+            nominals = []
             for idx, financial_year_start in enumerate(financial_year_starts):
                 phase = TRENDS_AND_ESTIMATES_PHASES[idx]
                 cell = [
@@ -576,28 +629,19 @@ class Department(models.Model):
                     == int(financial_year_start)
                     and c[openspending_api.get_phase_ref()] == phase
                 ][0]
-                nominal = cell["value.sum"]
-                expenditure["nominal"].append(
-                    {
-                        "financial_year": FinancialYear.slug_from_year_start(
-                            financial_year_start
-                        ),
-                        "amount": nominal,
-                        "phase": phase,
-                    }
-                )
-                expenditure["real"].append(
-                    {
-                        "financial_year": FinancialYear.slug_from_year_start(
-                            financial_year_start
-                        ),
-                        "amount": int(
-                            (Decimal(nominal) / cpi[financial_year_start]["index"])
-                            * 100
-                        ),
-                        "phase": phase,
-                    }
-                )
+                nominals.append(cell["value.sum"])
+            reals = cpi.deflate(nominals, financial_year_starts)
+            for idx, financial_year_start in enumerate(financial_year_starts):
+                for kind, amount in [("nominal", nominals[idx]), ("real", reals[idx])]:
+                    expenditure[kind].append(
+                        {
+                            "financial_year": FinancialYear.slug_from_year_start(
+                                financial_year_start
+                            ),
+                            "amount": amount,
+                            "phase": TRENDS_AND_ESTIMATES_PHASES[idx],
+                        }
+                    )
 
             return {
                 "expenditure": expenditure,
@@ -619,20 +663,38 @@ class Department(models.Model):
         if not openspending_api:
             return None
 
-        result_for_type_and_total = openspending_api.aggregate(
-            cuts=[
-                openspending_api.get_financial_year_ref()
-                + ":"
-                + self.get_financial_year().get_starting_year()
-            ],
-            drilldowns=[
-                openspending_api.get_adjustment_kind_ref(),
-                openspending_api.get_phase_ref(),
-                openspending_api.get_programme_name_ref(),
-                openspending_api.get_department_name_ref(),
-            ],
-            order=[openspending_api.get_adjustment_kind_ref()],
-        )
+        virements_resource = dataset.get_resource("CSV", name="Value of Virements")
+        queries = [
+            {
+                "cuts": [
+                    openspending_api.get_financial_year_ref()
+                    + ":"
+                    + self.get_financial_year().get_starting_year()
+                ],
+                "drilldowns": [
+                    openspending_api.get_adjustment_kind_ref(),
+                    openspending_api.get_phase_ref(),
+                    openspending_api.get_programme_name_ref(),
+                    openspending_api.get_department_name_ref(),
+                ],
+                "order": [openspending_api.get_adjustment_kind_ref()],
+            },
+            self._adjustments_by_programme_query(openspending_api),
+            self._adjustments_by_econ_class_query(openspending_api),
+            self._budget_special_appropriations_query(openspending_api),
+            self._budget_direct_charges_query(openspending_api),
+        ]
+        if not virements_resource:
+            queries.append(self._budget_virements_query(openspending_api))
+        results = aggregate_many([(openspending_api, query) for query in queries])
+        result_for_virements = None if virements_resource else results.pop()
+        (
+            result_for_type_and_total,
+            result_for_programmes,
+            result_for_econ_classes,
+            result_for_special_appropriations,
+            result_for_direct_charges,
+        ) = results
 
         result_for_type_and_total = openspending_api.filter_dept(
             result_for_type_and_total, self.name
@@ -676,15 +738,24 @@ class Department(models.Model):
                 "amount": total_adjusted,
                 "percentage": (float(total_adjusted) / float(total_voted)) * 100,
             },
-            "econ_classes": self._get_adjustments_by_econ_class(openspending_api),
-            "programmes": self._get_adjustments_by_programme(openspending_api),
+            "econ_classes": self._get_adjustments_by_econ_class(
+                openspending_api, result_for_econ_classes
+            ),
+            "programmes": self._get_adjustments_by_programme(
+                openspending_api, result_for_programmes
+            ),
             "virements": self._get_budget_virements(
-                openspending_api, dataset, total_voted
+                openspending_api,
+                virements_resource,
+                result_for_virements,
+                total_voted,
             ),
             "special_appropriation": self._get_budget_special_appropriations(
-                openspending_api, total_voted
+                openspending_api, result_for_special_appropriations, total_voted
+            ),
+            "direct_charges": self._get_budget_direct_charges(
+                openspending_api, result_for_direct_charges
             ),
-            "direct_charges": self._get_budget_direct_charges(openspending_api),
             "department_data_csv": csv_url(dept_aggregate_url),
             "dataset_detail_page": dataset.get_url_path(),
         }
@@ -728,9 +799,9 @@ class Department(models.Model):
 
         return by_type if by_type else None
 
-    def _get_adjustments_by_programme(self, openspending_api):
-        result_for_programmes = openspending_api.aggregate(
-            cuts=[
+    def _adjustments_by_programme_query(self, openspending_api):
+        return {
+            "cuts": [
                 openspending_api.get_financial_year_ref()
                 + ":"
                 + self.get_financial_year().get_starting_year(),
@@ -739,13 +810,15 @@ class Department(models.Model):
                 + ":"
                 + '"Adjustments - Total adjustments"',
             ],
-            drilldowns=[
+            "drilldowns": [
                 openspending_api.get_programme_name_ref(),
                 openspending_api.get_phase_ref(),
                 openspending_api.get_department_name_ref(),
             ],
-            order=[openspending_api.get_programme_name_ref()],
-        )
+            "order": [openspending_api.get_programme_name_ref()],
+        }
+
+    def _get_adjustments_by_programme(self, openspending_api, result_for_programmes):
         result_for_programmes = openspending_api.filter_dept(
             result_for_programmes, self.name
         )
@@ -761,9 +834,9 @@ class Department(models.Model):
         ]
         return programmes if programmes else None
 
-    def _get_adjustments_by_econ_class(self, openspending_api):
-        result_for_econ_classes = openspending_api.aggregate(
-            cuts=[
+    def _adjustments_by_econ_class_query(self, openspending_api):
+        return {
+            "cuts": [
                 openspending_api.get_financial_year_ref()
                 + ":"
                 + self.get_financial_year().get_starting_year(),
@@ -771,18 +844,19 @@ class Department(models.Model):
                 + ":"
                 + '"Adjustments - Total adjustments"',
             ],
-            drilldowns=[
+            "drilldowns": [
                 openspending_api.get_econ_class_2_ref(),
                 openspending_api.get_econ_class_3_ref(),
                 openspending_api.get_programme_name_ref(),
                 openspending_api.get_department_name_ref(),
             ],
-            order=[
+            "order": [
                 openspending_api.get_econ_class_2_ref(),
                 openspending_api.get_econ_class_3_ref(),
             ],
-        )
+        }
 
+    def _get_adjustments_by_econ_class(self, openspending_api, result_for_econ_classes):
         result_for_econ_classes = openspending_api.filter_dept(
             result_for_econ_classes, self.name
         )
@@ -857,20 +931,28 @@ class Department(models.Model):
 
         return total_voted, total_adjusted
 
-    def _get_budget_virements(self, openspending_api, dataset, total_voted):
-        virements_resource = dataset.get_resource("CSV", name="Value of Virements")
+    def _budget_virements_query(self, openspending_api):
+        return {
+            "cuts": [
+                openspending_api.get_financial_year_ref()
+                + ":"
+                + self.get_financial_year().get_starting_year(),
+                openspending_api.get_adjustment_kind_ref()
+                + ":"
+                + '"Adjustments - Virements and shifts due to savings"',
+            ],
+            "drilldowns": openspending_api.get_all_drilldowns(),
+        }
+
+    def _get_budget_virements(
+        self, openspending_api, virements_resource, result_for_virements, total_voted
+    ):
         if virements_resource:
-            sql = """
-                    SELECT "Value of Virements" FROM "{}"
-                    WHERE "department_name"='{}'
-                    """.format(
-                virements_resource["id"], self.name
+            value = get_virements_by_department(virements_resource["id"]).get(
+                self.name, None
             )
-            params = {"sql": sql}
-            result = requests.get(CKAN_DATASTORE_URL, params=params)
-            result.raise_for_status()
-            records = result.json()["result"]["records"]
-            value = records[0]["Value of Virements"]
+            if value is None:
+                return None
 
             virements = {
                 "label": "Value of virements",
@@ -878,18 +960,6 @@ class Department(models.Model):
                 "percentage": 100 * (float(value) / float(total_voted)),
             }
         else:
-            result_for_virements = openspending_api.aggregate(
-                cuts=[
-                    openspending_api.get_financial_year_ref()
-                    + ":"
-                    + self.get_financial_year().get_starting_year(),
-                    openspending_api.get_adjustment_kind_ref()
-                    + ":"
-                    + '"Adjustments - Virements and shifts due to savings"',
-                ],
-                drilldowns=openspending_api.get_all_drilldowns(),
-            )
-
             result_for_virements = openspending_api.filter_dept(
                 result_for_virements, self.name
             )
@@ -911,9 +981,9 @@ class Department(models.Model):
             }
         return virements if virements else None
 
-    def _get_budget_special_appropriations(self, openspending_api, total_voted):
-        result_for_special_appropriations = openspending_api.aggregate(
-            cuts=[
+    def _budget_special_appropriations_query(self, openspending_api):
+        return {
+            "cuts": [
                 openspending_api.get_financial_year_ref()
                 + ":"
                 + self.get_financial_year().get_starting_year(),
@@ -921,8 +991,12 @@ class Department(models.Model):
                 + ":"
                 + '"Special appropriation"',
             ],
-            drilldowns=[openspending_api.get_department_name_ref()],
-        )
+            "drilldowns": [openspending_api.get_department_name_ref()],
+        }
+
+    def _get_budget_special_appropriations(
+        self, openspending_api, result_for_special_appropriations, total_voted
+    ):
         result_for_special_appropriations = openspending_api.filter_dept(
             result_for_special_appropriations, self.name
         )
@@ -941,22 +1015,24 @@ class Department(models.Model):
         else:
             return None
 
-    def _get_budget_direct_charges(self, openspending_api):
-        result_for_direct_charges = openspending_api.aggregate(
-            cuts=[
+    def _budget_direct_charges_query(self, openspending_api):
+        return {
+            "cuts": [
                 openspending_api.get_financial_year_ref()
                 + ":"
                 + self.get_financial_year().get_starting_year(),
                 openspending_api.get_programme_name_ref() + ":" + DIRECT_CHARGE_NRF,
             ],
-            drilldowns=[
+            "drilldowns": [
                 openspending_api.get_phase_ref(),
                 openspending_api.get_subprogramme_name_ref(),
                 openspending_api.get_department_name_ref(),
                 openspending_api.get_adjustment_kind_ref(),
             ],
-            order=[openspending_api.get_subprogramme_name_ref()],
-        )
+            "order": [openspending_api.get_subprogramme_name_ref()],
+        }
+
+    def _get_budget_direct_charges(self, openspending_api, result_for_direct_charges):
         result_for_direct_charges = openspending_api.filter_dept(
             result_for_direct_charges, self.name
         )
@@ -982,7 +1058,7 @@ class Department(models.Model):
                             / float(cell["value.sum"])
                         ) * 100
 
-        return subprog_dict.values() if subprog_dict else None
+        return list(subprog_dict.values()) if subprog_dict else None
 
     def get_all_budget_totals_by_year_and_phase(self):
         """Returns the total for each year:phase combination from the expenditure time series dataset."""
@@ -1212,8 +1288,6 @@ class Department(models.Model):
         )
 
     def get_expenditure_time_series_summary(self):
-        cpi_year_slug, cpi_resource_id = Dataset.get_latest_cpi_resource()
-        base_year = get_base_year(cpi_year_slug)
         financial_year_start = self.get_financial_year().get_starting_year()
         financial_year_start_int = int(financial_year_start)
         financial_year_starts = [
@@ -1260,6 +1334,7 @@ class Department(models.Model):
 
         if result_cells:
             cpi = get_cpi()
+            found_cells = []
             for financial_year_start in financial_year_starts:
                 for phase in EXPENDITURE_TIME_SERIES_PHASES:
                     cells = [
@@ -1270,32 +1345,22 @@ class Department(models.Model):
                         and c[openspending_api.get_phase_ref()] == phase
                     ]
                     if cells:
-                        cell = cells[0]
-                        nominal = cell["value.sum"]
-                        expenditure["nominal"].append(
-                            {
-                                "financial_year": FinancialYear.slug_from_year_start(
-                                    financial_year_start
-                                ),
-                                "amount": nominal,
-                                "phase": phase,
-                            }
-                        )
-                        expenditure["real"].append(
-                            {
-                                "financial_year": FinancialYear.slug_from_year_start(
-                                    financial_year_start
-                                ),
-                                "amount": int(
-                                    (
-                                        Decimal(nominal)
-                                        / cpi[financial_year_start]["index"]
-                                    )
-                                    * 100
-                                ),
-                                "phase": phase,
-                            }
-                        )
+                        found_cells.append((financial_year_start, phase, cells[0]))
+            nominals = [cell["value.sum"] for _, _, cell in found_cells]
+            reals = cpi.deflate(nominals, [start for start, _, _ in found_cells])
+            for (financial_year_start, phase, _), nominal, real in zip(
+                found_cells, nominals, reals
+            ):
+                for kind, amount in [("nominal", nominal), ("real", real)]:
+                    expenditure[kind].append(
+                        {
+                            "financial_year": FinancialYear.slug_from_year_start(
+                                financial_year_start
+                            ),
+                            "amount": amount,
+                            "phase": phase,
+                        }
+                    )
 
             missing_phases_count = {}
             found = False
@@ -1328,9 +1393,7 @@ class Department(models.Model):
 
             expenditure.update(
                 {
-                    "base_financial_year": FinancialYear.slug_from_year_start(
-                        str(base_year)
-                    ),
+                    "base_financial_year": cpi.base_financial_year,
                     "in_year_spending_enabled": config.IN_YEAR_SPENDING_ENABLED,
                     "department_name": self.name,
                 }
@@ -1526,7 +1589,8 @@ class Department(models.Model):
 
             return {
                 "notices": notices,
-                "programmes": programmes.values(),  # FIXME need to add sorting with python3
+                # FIXME need to add sorting with python3
+                "programmes": list(programmes.values()),
                 "dataset_detail_page": dataset.get_url_path(),
             }
         else:
@@ -1577,6 +1641,38 @@ class Programme(models.Model):
         return "<%s %s>" % (self.__class__.__name__, self.get_url_path())
 
 
+class DepartmentPageData(models.Model):
+    """
+    The sections of a department page that come from CKAN and OpenSpending,
+    stored as JSON by the materialize_department_pages task so that the page
+    can be rendered from one row.
+
+    A row is only used while its format_version is FORMAT_VERSION. It is
+    rebuilt when its source_version no longer matches the current version of
+    the sources it was built from, which is checked in the background.
+    """
+
+    # Increase this when the sections stored for a page change
+    FORMAT_VERSION = 1
+
+    department = models.OneToOneField(
+        Department, on_delete=models.CASCADE, related_name="page_data"
+    )
+    format_version = models.PositiveIntegerField()
+    source_version = models.CharField(max_length=40)
+    data = models.TextField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    def is_current(self, source_version):
+        return (
+            self.format_version == self.FORMAT_VERSION
+            and self.source_version == source_version
+        )
+
+    def __str__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.department.get_url_path())
+
+
 # https://stackoverflow.com/questions/35633037/search-for-document-in-solr-where-a-multivalue-field-is-either-empty
 # -or-has-a-sp
 def none_selected_query(vocab_name):
@@ -1599,20 +1695,62 @@ def get_base_year(cpi_year_slug):
     return int(cpi_year_slug[:4]) - 1
 
 
+class CPIIndex(dict):
+    """
+    The rows of a CPI resource by financial year start, each with the price
+    "index" of that year relative to the base year, where it is 100.
+    """
+
+    def __init__(self, resource_id, base_year, rows):
+        super().__init__(rows)
+        self.resource_id = resource_id
+        self.base_year = base_year
+
+    @property
+    def base_financial_year(self):
+        return FinancialYear.slug_from_year_start(str(self.base_year))
+
+    def deflate(self, amounts, financial_year_starts):
+        """
+        Returns nominal amounts in the given financial years (starting year
+        strings, like "2019") as whole amounts in base year prices.
+        """
+        return [
+            int((Decimal(amount) / self[financial_year_start]["index"]) * 100)
+            for amount, financial_year_start in zip(amounts, financial_year_starts)
+        ]
+
+
 def get_cpi():
+    """
+    Returns the CPIIndex of the latest CPI resource. It is computed once per
+    resource and then shared by the whole process.
+    """
+    global _cpi_index
     cpi_year_slug, cpi_resource_id = Dataset.get_latest_cpi_resource()
     base_year = get_base_year(cpi_year_slug)
+    cpi_index = _cpi_index
+    if (
+        cpi_index is None
+        or cpi_index.resource_id != cpi_resource_id
+        or cpi_index.base_year != base_year
+    ):
+        cpi_index = build_cpi_index(cpi_resource_id, base_year)
+        _cpi_index = cpi_index
+    return cpi_index
+
 
+_cpi_index = None
+
+
+def build_cpi_index(cpi_resource_id, base_year):
     sql = """
     SELECT "Year", "CPI" FROM "{}"
     ORDER BY "Year"
     """.format(
         cpi_resource_id
     )
-    params = {"sql": sql}
-    result = requests.get(CKAN_DATASTORE_URL, params=params)
-    result.raise_for_status()
-    cpi = result.json()["result"]["records"]
+    cpi = [dict(cell) for cell in datastore_search_sql(sql)]
     base_year_index = None
     for idx, cell in enumerate(cpi):
         financial_year_start = cell["Year"][:4]
@@ -1624,10 +1762,66 @@ def get_cpi():
         cpi[idx]["index"] = cpi[idx + 1]["index"] / (1 + Decimal(cpi[idx + 1]["CPI"]))
     for idx in range(base_year_index + 1, len(cpi)):
         cpi[idx]["index"] = cpi[idx - 1]["index"] * (1 + Decimal(cpi[idx]["CPI"]))
-    cpi_dict = {}
-    for cell in cpi:
-        cpi_dict[cell["financial_year_start"]] = cell
-    return cpi_dict
+    return CPIIndex(
+        cpi_resource_id,
+        base_year,
+        [(cell["financial_year_start"], cell) for cell in cpi],
+    )
+
+
+def datastore_search_sql(sql):
+    """
+    Returns the records of a CKAN datastore SQL query. When the datastore is
+    unavailable, the records last returned for the same query, kept in the
+    "fallback" cache, are used.
+    """
+    key = "datastore-sql-%s" % sha1(sql.encode("utf-8")).hexdigest()
+    try:
+        with get_upstream("ckan-datastore").guard(), instrumentation.timed(
+            "ckan-datastore", "datastore_search_sql"
+        ):
+            result = http_session.get(CKAN_DATASTORE_URL, params={"sql": sql})
+            result.raise_for_status()
+    except Exception as e:
+        records = caches["fallback"].get(key) if is_unavailable(e) else None
+        if records is None:
+            raise
+        logger.warning("Datastore query failed, using last result", exc_info=True)
+        return records
+    records = result.json()["result"]["records"]
+    caches["fallback"].set(key, records, settings.UPSTREAM_FALLBACK_TTL)
+    return records
+
+
+def get_virements_by_department(resource_id):
+    """
+    Returns the Value of Virements of each department in a virements resource,
+    by department name. The whole resource is loaded with paged
+    datastore_search calls and cached for CKAN_CACHE_TTL seconds.
+    """
+    key = "virements-%s" % resource_id
+    virements = cache.get(key)
+    if virements is not None:
+        return virements
+    virements = {}
+    offset = 0
+    while True:
+        response = ckan.action.datastore_search(
+            resource_id=resource_id,
+            fields=["department_name", "Value of Virements"],
+            limit=DATASTORE_PAGE_SIZE,
+            offset=offset,
+        )
+        records = response["records"]
+        for record in records:
+            virements.setdefault(
+                record["department_name"], record["Value of Virements"]
+            )
+        offset += len(records)
+        if len(records) < DATASTORE_PAGE_SIZE:
+            break
+    cache.set(key, virements, settings.CKAN_CACHE_TTL)
+    return virements
 
 
 def get_vocab_map():
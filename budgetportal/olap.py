@@ -0,0 +1,240 @@
+"""
+An in-process stand-in for the OpenSpending aggregate API.
+
+The fact table of a cube is downloaded once through the Babbage facts endpoint
+into dictionary-encoded columns backed by arrays. Aggregate queries are then
+answered locally by evaluating each cut once per distinct value of its column
+and grouping the matching rows by their drilldown codes.
+
+Cubes are held per process and reloaded when the version they were loaded for
+(the CKAN package's metadata_modified) changes.
+"""
+import logging
+import math
+import threading
+from array import array
+from itertools import compress, repeat
+
+from budgetportal import instrumentation
+from budgetportal.aggregate_query import AggregateQuery, InvalidCut
+from budgetportal.concurrency import get_executor, imap_ordered
+from budgetportal.upstreams import get_upstream
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+http_session = settings.HTTP_SESSION
+
+FACTS_PAGE_SIZE = 10000
+
+_cubes = {}
+_cube_locks = {}
+_cubes_lock = threading.Lock()
+
+
+class LocalCube:
+    def __init__(self, refs, measure_refs):
+        self.refs = list(refs)
+        self.measure_refs = list(measure_refs)
+        self.fact_count = 0
+        self.codes = {ref: array("I") for ref in self.refs}
+        self.values = {ref: [] for ref in self.refs}
+        self.measures = {ref: [] for ref in self.measure_refs}
+        self._value_codes = {ref: {} for ref in self.refs}
+
+    def extend(self, facts):
+        for fact in facts:
+            for ref in self.refs:
+                value = fact.get(ref, None)
+                value_codes = self._value_codes[ref]
+                code = value_codes.get(value, None)
+                if code is None:
+                    code = len(self.values[ref])
+                    value_codes[value] = code
+                    self.values[ref].append(value)
+                self.codes[ref].append(code)
+            for ref in self.measure_refs:
+                self.measures[ref].append(fact.get(ref, None))
+            self.fact_count += 1
+
+    def freeze(self):
+        """
+        Packs measure columns into arrays once all facts are loaded. Columns
+        with nulls stay lists, since arrays can't hold them.
+        """
+        for ref, column in self.measures.items():
+            if any(v is None for v in column):
+                continue
+            if all(isinstance(v, int) for v in column):
+                self.measures[ref] = array("q", column)
+            else:
+                self.measures[ref] = array("d", column)
+        self._value_codes = None
+
+    def selection(self, cuts):
+        """
+        Returns a mask of the rows matching all cuts, or None if there are no cuts.
+        """
+        mask = None
+        try:
+            cuts = AggregateQuery.build(cuts=cuts).cuts
+        except InvalidCut as e:
+            raise UnsupportedQuery(str(e))
+        for cut in cuts:
+            if cut.ref not in self.codes:
+                raise UnsupportedQuery("Unknown cut ref %s" % cut.ref)
+            matching_codes = {
+                code
+                for code, value in enumerate(self.values[cut.ref])
+                if cut.matches(value)
+            }
+            column = self.codes[cut.ref]
+            if mask is None:
+                mask = bytearray(code in matching_codes for code in column)
+            else:
+                mask = bytearray(
+                    selected and code in matching_codes
+                    for selected, code in zip(mask, column)
+                )
+        return mask
+
+    def aggregate(self, cuts=None, drilldowns=None, order=None):
+        drilldowns = list(drilldowns or [])
+        for ref in drilldowns:
+            if ref not in self.codes:
+                raise UnsupportedQuery("Unknown drilldown ref %s" % ref)
+        mask = self.selection(cuts)
+
+        if drilldowns:
+            keys = zip(*[self.codes[ref] for ref in drilldowns])
+        else:
+            keys = repeat((), self.fact_count)
+        rows = zip(keys, zip(*[self.measures[ref] for ref in self.measure_refs]))
+        if mask is not None:
+            rows = compress(rows, mask)
+
+        totals = {}
+        for key, measures in rows:
+            total = totals.get(key, None)
+            if total is None:
+                totals[key] = [1] + list(measures)
+            else:
+                total[0] += 1
+                for i, value in enumerate(measures, 1):
+                    # Like SQL SUM, nulls are skipped and all nulls total null
+                    if value is None:
+                        continue
+                    if total[i] is None:
+                        total[i] = value
+                    else:
+                        total[i] += value
+
+        cells = []
+        for key, total in totals.items():
+            cell = {ref: self.values[ref][code] for ref, code in zip(drilldowns, key)}
+            for ref, value in zip(self.measure_refs, total[1:]):
+                cell[ref + ".sum"] = value
+            cell["_count"] = total[0]
+            cells.append(cell)
+        if not drilldowns and not cells:
+            # Like the SQL SUM Babbage uses, totalling no rows gives null
+            cell = {ref + ".sum": None for ref in self.measure_refs}
+            cell["_count"] = 0
+            cells.append(cell)
+
+        sort_cells(cells, order or drilldowns)
+        return {
+            "cells": cells,
+            "total_cell_count": len(cells),
+            "page": 1,
+            "page_size": len(cells),
+        }
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def orders_by_text(cells, order):
+    """
+    Whether any ref in order has text values. Babbage sorts those with the
+    database's collation, which orders case and accents differently from
+    sort_cells.
+    """
+    refs = [ref_order.partition(":")[0] for ref_order in order]
+    return any(isinstance(cell.get(ref, None), str) for cell in cells for ref in refs)
+
+
+def sort_cells(cells, order):
+    for ref_order in reversed(order):
+        ref, _, direction = ref_order.partition(":")
+        if cells and ref not in cells[0]:
+            raise UnsupportedQuery("Unknown order ref %s" % ref)
+        cells.sort(
+            key=lambda cell: (cell[ref] is None, cell[ref]),
+            reverse=direction.lower() == "desc",
+        )
+
+
+def load_cube(api, session=http_session):
+    """Downloads the whole fact table of a BabbageFiscalDataset into a LocalCube"""
+    refs = set()
+    for dimension in api.model["dimensions"].values():
+        for attribute in dimension["attributes"].values():
+            refs.add(attribute["ref"])
+    measure_refs = [m["ref"] for m in api.model["measures"].values()]
+    cube = LocalCube(sorted(refs), measure_refs)
+
+    fields = "|".join(cube.refs + cube.measure_refs)
+    url = api.cube_url + "facts/"
+
+    def get_page(page):
+        with get_upstream("openspending").guard(), instrumentation.timed(
+            "openspending", "facts", detail=url
+        ):
+            response = session.get(
+                url,
+                params={"fields": fields, "page": page, "pagesize": FACTS_PAGE_SIZE},
+            )
+            response.raise_for_status()
+        return response.json()
+
+    first_page = get_page(1)
+    cube.extend(first_page["data"])
+    page_size = first_page.get("page_size") or FACTS_PAGE_SIZE
+    page_count = int(math.ceil(first_page["total_fact_count"] / float(page_size)))
+    executor = get_executor(
+        "openspending-pages", settings.OPENSPENDING_PAGE_CONCURRENCY
+    )
+    for page in imap_ordered(
+        executor,
+        get_page,
+        range(2, page_count + 1),
+        settings.OPENSPENDING_PAGE_CONCURRENCY,
+    ):
+        cube.extend(page["data"])
+    cube.freeze()
+    logger.info("loaded %d facts from %s", cube.fact_count, api.cube_url)
+    return cube
+
+
+def is_loaded(api):
+    entry = _cubes.get(api.cube_url, None)
+    return entry is not None and entry[0] == api.version
+
+
+def get_cube(api):
+    """
+    Returns the LocalCube for the api's cube, loading it if it isn't loaded yet
+    or was loaded for a different version of the dataset.
+    """
+    with _cubes_lock:
+        if is_loaded(api):
+            return _cubes[api.cube_url][1]
+        lock = _cube_locks.setdefault(api.cube_url, threading.Lock())
+
+    with lock:
+        if is_loaded(api):
+            return _cubes[api.cube_url][1]
+        cube = load_cube(api, session=api.session)
+        _cubes[api.cube_url] = (api.version, cube)
+        return cube
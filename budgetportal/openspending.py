@@ -3,35 +3,70 @@ Abstracts away some of the mechanics of querying OpenSpending and some of the
 conventions of how we name fields in our Fiscal Data Packages.
 """
 import logging
+import math
 import random
 import re
-from collections import OrderedDict
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
 from hashlib import sha1
-from urllib.parse import urlencode
+from itertools import chain
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import requests
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from budgetportal import instrumentation, olap
+from budgetportal.aggregate_query import (
+    AggregateQuery,
+    InvalidCut,
+    canonical_key_stats,
+    raw_key,
+)
+from budgetportal.aggregate_result import compact_result, expand_result, is_compact
+from budgetportal.concurrency import (
+    ContextExecutor,
+    SingleFlight,
+    get_executor,
+    imap_ordered,
+)
+from budgetportal.upstreams import UpstreamUnavailable, get_upstream, is_unavailable
 from django.conf import settings
 from django.core.cache import cache
+from django_q.tasks import async_task
 
 logger = logging.getLogger(__name__)
+http_session = settings.HTTP_SESSION
 
 PAGE_SIZE = 10000
 
+# How long a worker may hold the lock on fetching an aggregate url, and how often
+# other workers check whether it has been cached in the meantime
+FETCH_LOCK_TIMEOUT = 60
+FETCH_LOCK_POLL_INTERVAL = 0.2
+
+# The single grouping pass dominates, so NumPy only pays off for large inputs
+NUMPY_AGGREGATION_THRESHOLD = PAGE_SIZE
+
 
 class BabbageFiscalDataset:
-    def __init__(self, model_url):
-        self.session = requests.Session()
+    def __init__(self, model_url, version=None, local_cube=False):
+        """
+        version identifies the revision of the dataset, e.g. the CKAN package's
+        metadata_modified. With local_cube, aggregate queries are answered from
+        a copy of the fact table held in this process, reloaded when the
+        version changes.
+        """
+        self.session = http_session
+        self.version = version
+        self.local_cube = local_cube
 
         self.cube_url = cube_url(model_url)
-        model_result = self.session.get(model_url)
-        logger.info(
-            "request to %s took %dms",
-            model_url,
-            model_result.elapsed.microseconds / 1000,
-        )
-        model_result.raise_for_status()
-        self.model = model_result.json()["model"]
+        self.model = model_registry.get(model_url, version, session=self.session)
 
     def get_dimension(self, hierarchy_name, level=0):
         return self.model["hierarchies"][hierarchy_name]["levels"][level]
@@ -54,44 +89,128 @@ class BabbageFiscalDataset:
         return [c for c in cells if c[filter_ref] != filter_exclusion_value]
 
     def aggregate_url(self, cuts=None, drilldowns=None, order=None):
+        """
+        Cuts can be Cut objects or strings like ref:value or ref:"value".
+        Equivalent queries give the same URL, whatever the order and quoting
+        of their cuts.
+        """
+        query = AggregateQuery.build(cuts=cuts, drilldowns=drilldowns, order=order)
         params = {"pagesize": PAGE_SIZE}
-
         if settings.BUST_OPENSPENDING_CACHE:
             params["cache_bust"] = random.randint(1, 1000000)
-        if cuts is not None and cuts:
-            params["cut"] = "|".join(cuts)
-        if drilldowns is not None:
-            params["drilldown"] = "|".join(drilldowns)
-        if order is not None:
-            params["order"] = "|".join(order)
+        params.update(query.params())
         url = self.cube_url + "aggregate/"
         sorted_params = OrderedDict(sorted(params.items(), key=lambda t: t[0]))
+        canonical_key_stats.record(
+            self.cube_url + "?" + raw_key(cuts, drilldowns, order),
+            self.cube_url + "?" + urlencode(sorted(query.params().items())),
+        )
         return url + "?" + urlencode(sorted_params)
 
     def aggregate(self, cuts=None, drilldowns=None, order=None):
-        url = self.aggregate_url(cuts=cuts, drilldowns=drilldowns, order=order)
-        cached_result = cache.get(cache_key(url))
-        if cached_result:
-            logger.info("cache HIT for %s", url)
-            aggregate_result = cached_result
-        else:
-            logger.info("cache MISS for %s", url)
-            aggregate_result = self.session.get(url)
-            logger.info(
-                "request %s took %dms",
-                aggregate_result.url,
-                aggregate_result.elapsed.microseconds / 1000,
-            )
-            aggregate_result.raise_for_status()
-            aggregate_result = aggregate_result.json()
-            if len(aggregate_result["cells"]) >= PAGE_SIZE:
-                raise Exception(
-                    "Potentially more than one page of results"
-                    " - perhaps we should start paging"
+        """
+        Returns the result of the query with the cells of all its pages. Use
+        iter_aggregate_cells to walk a large result without holding all its
+        pages in memory.
+        """
+        if self.local_cube:
+            try:
+                with instrumentation.timed("openspending", "aggregate", "local"):
+                    return olap.get_cube(self).aggregate(
+                        cuts=cuts, drilldowns=drilldowns, order=order
+                    )
+            except (
+                olap.UnsupportedQuery,
+                UpstreamUnavailable,
+                requests.RequestException,
+            ):
+                logger.exception(
+                    "Falling back to the aggregate API for %s", self.cube_url
                 )
-            cache.set(cache_key(url), aggregate_result)
+        url = self.aggregate_url(cuts=cuts, drilldowns=drilldowns, order=order)
+        cached_entry = get_cached_entry(cache_key(url))
+        if cached_entry is None:
+            derived_result = self.timed_derive_aggregate(cuts, drilldowns, order)
+            if derived_result is not None:
+                return derived_result
+        return self.aggregate_all_pages(url, cuts, drilldowns, cached_entry)
+
+    def cached_aggregate(self, cuts=None, drilldowns=None, order=None):
+        """
+        Returns what aggregate() would if it can be answered without waiting on
+        OpenSpending, otherwise None.
+        """
+        if self.local_cube:
+            if olap.is_loaded(self):
+                return self.aggregate(cuts=cuts, drilldowns=drilldowns, order=order)
+            return None
+        url = self.aggregate_url(cuts=cuts, drilldowns=drilldowns, order=order)
+        cached_entry = get_cached_entry(cache_key(url))
+        if cached_entry is None:
+            return self.timed_derive_aggregate(cuts, drilldowns, order)
+        if aggregate_page_count(cached_entry["result"]) != 1:
+            return None
+        return self.aggregate_all_pages(url, cuts, drilldowns, cached_entry)
+
+    def aggregate_all_pages(self, url, cuts, drilldowns, cached_entry=None):
+        pages = iter_aggregate_pages(
+            url, session=self.session, cached_entry=cached_entry
+        )
+        aggregate_result = next(pages)
+        aggregate_result["cells"] = list(aggregate_result["cells"])
+        for page in pages:
+            aggregate_result["cells"].extend(page["cells"])
+        if aggregate_page_count(aggregate_result) == 1:
+            cached_queries.add(self.cube_url, cuts, drilldowns, url)
         return aggregate_result
 
+    def timed_derive_aggregate(self, cuts, drilldowns, order):
+        with instrumentation.timed("openspending", "aggregate", "derived"):
+            return self.derive_aggregate(cuts, drilldowns, order)
+
+    def derive_aggregate(self, cuts=None, drilldowns=None, order=None):
+        """
+        Answers the query from the cached result of a broader query of this cube,
+        if there is one, by filtering its cells by the cuts it lacks and
+        re-aggregating them by drilldowns. Returns None otherwise, or when the
+        query is ordered by text, which Babbage sorts with the database's
+        collation. Without an order, cells are sorted by their drilldowns in
+        code point order, so text drilldowns differing only in case or accents
+        can be ordered differently from Babbage.
+        """
+        superset = cached_queries.find_superset(self.cube_url, cuts, drilldowns)
+        if superset is None:
+            return None
+        url, cached_entry, extra_cuts = superset
+        logger.info("deriving aggregate from cached %s", url)
+        if (
+            time.time() - cached_entry["fetched_at"]
+            > settings.OPENSPENDING_CACHE_SOFT_TTL
+        ):
+            queue_refresh(url)
+
+        cells = [
+            cell
+            for cell in cached_entry["result"]["cells"]
+            if all(cut.matches(cell[cut.ref]) for cut in extra_cuts)
+        ]
+        cells = self.aggregate_by_refs(list(drilldowns or []), cells)
+        if order and olap.orders_by_text(cells, order):
+            return None
+        if not drilldowns and not cells:
+            cells = [{"value.sum": None, "_count": 0}]
+        try:
+            # Babbage orders cells by their drilldowns when no order is given
+            olap.sort_cells(cells, order or drilldowns or [])
+        except olap.UnsupportedQuery:
+            return None
+        return {
+            "cells": cells,
+            "total_cell_count": len(cells),
+            "page": 1,
+            "page_size": len(cells),
+        }
+
     def filter_dept(self, result, dept_name):
         filtered_results = []
         for budget in result["cells"]:
@@ -102,42 +221,84 @@ class BabbageFiscalDataset:
     @staticmethod
     def aggregate_by_refs(aggregate_refs, cells):
         """Simulates a basic version of aggregation via Open Spending API
-        Accepts a list of cells and a list of any number of column references."""
+        Accepts a list of cells and a list of any number of column references.
+
+        Cells are grouped in a single pass keyed on their values for the
+        references. Aggregated cells are returned in the order each group
+        first appears in cells."""
+
+        if numpy is not None and len(cells) >= NUMPY_AGGREGATION_THRESHOLD:
+            aggregated_cells = aggregate_by_refs_numpy(aggregate_refs, cells)
+            if aggregated_cells is not None:
+                return aggregated_cells
 
-        aggregated_cells = list()
-        unique_reference_combos = list()
+        aggregated_cells = {}
         for cell in cells:
-            combo = tuple(cell[aggregate_refs[x]] for x in range(len(aggregate_refs)))
-            if combo not in unique_reference_combos:
-                unique_reference_combos.append(combo)
-
-        for unique_ref_combo in unique_reference_combos:
-            value_sum = 0
-            count_sum = 0
-            ex_cell = {}
-            for cell in cells:
-                full_ref_match = compare_equal_indices(
-                    cell, aggregate_refs, unique_ref_combo
-                )
-                if full_ref_match:
-                    if not ex_cell:
-                        ex_cell = {}
-                        for i in range(len(aggregate_refs)):
-                            ex_cell[aggregate_refs[i]] = cell[aggregate_refs[i]]
-                    value_sum += cell["value.sum"]
-                    count_sum += cell["_count"]
-            ex_cell["value.sum"] = value_sum
-            ex_cell["_count"] = count_sum
-            aggregated_cells.append(ex_cell)
-        return aggregated_cells
-
-
-def compare_equal_indices(array_one_wrapper_object, array_one, array_two):
-    all_values_match = True
-    for i in range(len(array_one)):
-        if array_one_wrapper_object[array_one[i]] != array_two[i]:
-            all_values_match = False
-    return all_values_match
+            combo = tuple(cell[ref] for ref in aggregate_refs)
+            ex_cell = aggregated_cells.get(combo, None)
+            if ex_cell is None:
+                ex_cell = {ref: cell[ref] for ref in aggregate_refs}
+                ex_cell["value.sum"] = 0
+                ex_cell["_count"] = 0
+                aggregated_cells[combo] = ex_cell
+            ex_cell["value.sum"] += cell["value.sum"]
+            ex_cell["_count"] += cell["_count"]
+        return list(aggregated_cells.values())
+
+
+def aggregate_by_refs_numpy(aggregate_refs, cells):
+    """
+    The same as BabbageFiscalDataset.aggregate_by_refs but summing with NumPy.
+
+    Returns None when the values can't be summed by NumPy with exactly the
+    same result as Python, e.g. when ints and floats are mixed, so that the
+    caller can fall back to summing in Python.
+    """
+    group_codes = {}
+    first_cells = []
+    codes = []
+    for cell in cells:
+        combo = tuple(cell[ref] for ref in aggregate_refs)
+        code = group_codes.get(combo, None)
+        if code is None:
+            code = len(first_cells)
+            group_codes[combo] = code
+            first_cells.append(cell)
+        codes.append(code)
+    codes = numpy.array(codes, dtype=numpy.intp)
+
+    value_sums = numpy_group_sums(codes, [c["value.sum"] for c in cells], first_cells)
+    if value_sums is None:
+        return None
+    count_sums = numpy_group_sums(codes, [c["_count"] for c in cells], first_cells)
+    if count_sums is None:
+        return None
+
+    aggregated_cells = []
+    for code, first_cell in enumerate(first_cells):
+        ex_cell = {ref: first_cell[ref] for ref in aggregate_refs}
+        ex_cell["value.sum"] = value_sums[code]
+        ex_cell["_count"] = count_sums[code]
+        aggregated_cells.append(ex_cell)
+    return aggregated_cells
+
+
+def numpy_group_sums(codes, values, groups):
+    value_types = set(type(v) for v in values)
+    if value_types == {int}:
+        # Sum in int64 only when no partial sum can possibly overflow
+        if max(abs(v) for v in values) * len(values) >= 2**63:
+            return None
+        dtype = numpy.int64
+    elif value_types == {float}:
+        dtype = numpy.float64
+    else:
+        return None
+    sums = numpy.zeros(len(groups), dtype=dtype)
+    # add.at is unbuffered and adds in order, giving the same float results
+    # as adding one by one in Python
+    numpy.add.at(sums, codes, numpy.array(values, dtype=dtype))
+    return sums.tolist()
 
 
 class EstimatesOfExpenditure(BabbageFiscalDataset):
@@ -284,6 +445,425 @@ class ExpenditureTimeSeries(AdjustedEstimatesOfExpenditure):
     pass
 
 
+def aggregate_many(queries):
+    """
+    Runs independent aggregate queries, given as (BabbageFiscalDataset, query)
+    pairs where query holds the keyword arguments to aggregate(), and returns
+    their results in the same order.
+
+    Queries that can be answered from the cache are answered immediately and
+    the rest are fetched concurrently, on a pool of up to
+    OPENSPENDING_QUERY_CONCURRENCY threads of this call's own, so that one
+    request's queries don't wait behind another's.
+    """
+    results = [None] * len(queries)
+    uncached = []
+    for i, (openspending_api, query) in enumerate(queries):
+        results[i] = openspending_api.cached_aggregate(**query)
+        if results[i] is None:
+            uncached.append(i)
+    if not uncached:
+        return results
+    with ContextExecutor(
+        max_workers=min(len(uncached), settings.OPENSPENDING_QUERY_CONCURRENCY),
+        thread_name_prefix="openspending-queries",
+    ) as executor:
+        futures = {
+            i: executor.submit(queries[i][0].aggregate, **queries[i][1])
+            for i in uncached
+        }
+        for i, future in futures.items():
+            results[i] = future.result()
+    return results
+
+
+class CachedQueryIndex:
+    """
+    Remembers, per cube, which aggregate queries this process has seen complete
+    single-page results for, so that narrower queries can be derived from them
+    while those results are still in the cache.
+
+    A cached query answers a narrower one when each of its cuts is also a cut of
+    the narrower query, and its drilldowns include the narrower query's
+    drilldowns and the refs of the narrower query's remaining cuts.
+    """
+
+    def __init__(self, max_queries_per_cube=256):
+        self.max_queries_per_cube = max_queries_per_cube
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def add(self, cube_url, cuts, drilldowns, url):
+        try:
+            cut_set = frozenset(AggregateQuery.build(cuts=cuts).cuts)
+        except InvalidCut:
+            return
+        with self._lock:
+            queries = self._queries.setdefault(
+                cube_url, deque(maxlen=self.max_queries_per_cube)
+            )
+            if not any(query[2] == url for query in queries):
+                queries.append((cut_set, frozenset(drilldowns or []), url))
+
+    def find_superset(self, cube_url, cuts, drilldowns):
+        """
+        Returns (url, cached entry, cuts still to apply) for a cached query
+        that can answer the given one, or None.
+        """
+        if settings.BUST_OPENSPENDING_CACHE:
+            return None
+        try:
+            cut_set = frozenset(AggregateQuery.build(cuts=cuts).cuts)
+        except InvalidCut:
+            return None
+        drilldowns = set(drilldowns or [])
+        with self._lock:
+            queries = list(self._queries.get(cube_url, []))
+
+        for cached_cut_set, cached_drilldowns, url in reversed(queries):
+            if not cached_cut_set <= cut_set:
+                continue
+            extra_cuts = cut_set - cached_cut_set
+            needed_refs = drilldowns | {cut.ref for cut in extra_cuts}
+            if not needed_refs <= cached_drilldowns:
+                continue
+            cached_entry = get_cached_entry(cache_key(url))
+            if cached_entry is not None and can_reaggregate(
+                cached_entry["result"], cached_drilldowns
+            ):
+                return url, cached_entry, extra_cuts
+        return None
+
+
+def can_reaggregate(aggregate_result, drilldowns):
+    """
+    Whether aggregate_by_refs can regroup all the cells of the result, i.e. it
+    is complete and its cells hold only the drilldowns and summable measures.
+    """
+    if aggregate_page_count(aggregate_result) != 1:
+        return False
+    measures = {"value.sum", "_count"}
+    for cell in aggregate_result["cells"]:
+        if set(cell) - drilldowns - measures or cell["value.sum"] is None:
+            return False
+    return True
+
+
+cached_queries = CachedQueryIndex()
+
+
+ModelEntry = namedtuple(
+    "ModelEntry", ["model", "version", "etag", "last_modified", "checked_at"]
+)
+
+
+class ModelRegistry:
+    """
+    Keeps the model JSON of each cube, keyed by model URL, for the life of the
+    process so that constructing a BabbageFiscalDataset doesn't fetch it again.
+
+    An entry is trusted for ttl seconds, or until it is asked for with a
+    different version, after which it is revalidated with a conditional request.
+    While OpenSpending is unavailable, entries are used without revalidation.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._fetches = SingleFlight()
+
+    @property
+    def ttl(self):
+        if self._ttl is None:
+            return settings.OPENSPENDING_MODEL_TTL
+        return self._ttl
+
+    def get(self, model_url, version=None, session=http_session):
+        now = time.monotonic()
+        entry = self._entries.get(model_url, None)
+        if (
+            entry is not None
+            and entry.version == version
+            and now - entry.checked_at < self.ttl
+        ):
+            return entry.model
+
+        return self._fetches.do(
+            model_url, lambda: self._revalidate(model_url, entry, version, session)
+        )
+
+    def _revalidate(self, model_url, entry, version, session):
+        now = time.monotonic()
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        try:
+            with get_upstream("openspending").guard(), instrumentation.timed(
+                "openspending", "model", "miss", detail=model_url
+            ) as outcome:
+                model_result = session.get(model_url, headers=headers)
+                if entry is not None and model_result.status_code == 304:
+                    outcome["cache"] = "revalidated"
+                else:
+                    model_result.raise_for_status()
+        except Exception as e:
+            if entry is None or not is_unavailable(e):
+                raise
+            logger.warning("using unrevalidated model %s", model_url, exc_info=True)
+            return entry.model
+        logger.info(
+            "request to %s took %dms",
+            model_url,
+            model_result.elapsed.total_seconds() * 1000,
+        )
+        if entry is not None and model_result.status_code == 304:
+            entry = entry._replace(version=version, checked_at=now)
+        else:
+            entry = ModelEntry(
+                model=model_result.json()["model"],
+                version=version,
+                etag=model_result.headers.get("ETag", None),
+                last_modified=model_result.headers.get("Last-Modified", None),
+                checked_at=now,
+            )
+        with self._lock:
+            self._entries[model_url] = entry
+        return entry.model
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+model_registry = ModelRegistry()
+aggregate_fetches = SingleFlight()
+
+
+def get_aggregate_page(url, session=http_session, cached_entry=None):
+    """
+    Returns the cached result for the aggregate url when there is one, queueing
+    a background refresh once it is older than OPENSPENDING_CACHE_SOFT_TTL.
+    Results older than OPENSPENDING_CACHE_HARD_TTL are fetched again before
+    returning, and are only served if OpenSpending is unavailable.
+
+    Callers that already read the cached entry for the url with
+    get_cached_entry can pass it as cached_entry to save reading it again.
+    """
+    key = cache_key(url)
+    start = time.perf_counter()
+    if cached_entry is None:
+        cached_entry = get_cached_entry(key)
+    if cached_entry:
+        age = time.time() - cached_entry["fetched_at"]
+        if age > settings.OPENSPENDING_CACHE_SOFT_TTL:
+            logger.info("cache STALE for %s (%ds old)", url, age)
+            queue_refresh(url)
+            outcome = "stale"
+        else:
+            logger.info("cache HIT for %s", url)
+            outcome = "hit"
+        instrumentation.record(
+            "openspending",
+            "aggregate",
+            (time.perf_counter() - start) * 1000,
+            outcome,
+            detail=url,
+        )
+        return cached_entry["result"]
+
+    logger.info("cache MISS for %s", url)
+    return aggregate_fetches.do(key, lambda: fetch_aggregate_page(url, session=session))
+
+
+def get_cached_entry(key, include_expired=False):
+    """
+    Returns the cached result with the time it was fetched, ignoring results
+    older than OPENSPENDING_CACHE_HARD_TTL unless include_expired is set.
+    """
+    cached_entry = cache.get(key)
+    # Ignore results cached before they were stored with the time of fetching
+    if not cached_entry or "fetched_at" not in cached_entry:
+        return None
+    age = time.time() - cached_entry["fetched_at"]
+    if age > settings.OPENSPENDING_CACHE_HARD_TTL and not include_expired:
+        return None
+    result = cached_entry["result"]
+    if is_compact(result):
+        result = expand_result(result)
+    return {"fetched_at": cached_entry["fetched_at"], "result": result}
+
+
+def queue_refresh(url):
+    """
+    Queues a background refresh of the aggregate url, unless one was queued in
+    the last OPENSPENDING_CACHE_SOFT_TTL seconds. Failing to queue it is only
+    logged, so that the stale result is still served.
+    """
+    refresh_key = cache_key(url) + ":refreshing"
+    try:
+        if cache.add(refresh_key, True, settings.OPENSPENDING_CACHE_SOFT_TTL):
+            try:
+                async_task(
+                    "budgetportal.tasks.refresh_aggregate_page",
+                    url,
+                    task_name="Refresh stale OpenSpending aggregate result",
+                )
+            except Exception:
+                # Let the next request for the url try again
+                cache.delete(refresh_key)
+                raise
+    except Exception:
+        logger.exception("Failed to queue a refresh of %s", url)
+
+
+def fetch_aggregate_page(url, session=http_session):
+    """
+    Fetches the aggregate url and caches the result, unless another worker
+    process holds the fetch lock for the url, in which case its result is
+    awaited in the cache for up to FETCH_LOCK_TIMEOUT seconds.
+
+    If OpenSpending is unavailable or fails, an expired cached result is
+    returned instead when there is one.
+    """
+    key = cache_key(url)
+    lock_key = key + ":fetching"
+    locked = cache.add(lock_key, True, FETCH_LOCK_TIMEOUT)
+    if not locked:
+        start = time.perf_counter()
+        deadline = time.monotonic() + FETCH_LOCK_TIMEOUT
+        while time.monotonic() < deadline and cache.get(lock_key):
+            time.sleep(FETCH_LOCK_POLL_INTERVAL)
+            cached_entry = get_cached_entry(key)
+            if cached_entry:
+                logger.info("cache HIT after waiting for %s", url)
+                instrumentation.record(
+                    "openspending",
+                    "aggregate",
+                    (time.perf_counter() - start) * 1000,
+                    "hit",
+                    detail=url,
+                )
+                return cached_entry["result"]
+    try:
+        try:
+            with get_upstream("openspending").guard(), instrumentation.timed(
+                "openspending", "aggregate", "miss", detail=url
+            ):
+                aggregate_result = session.get(url)
+                aggregate_result.raise_for_status()
+        except Exception as e:
+            if not is_unavailable(e):
+                raise
+            expired_entry = get_cached_entry(key, include_expired=True)
+            if expired_entry is None:
+                raise
+            logger.warning("serving expired cache for %s", url, exc_info=True)
+            return expired_entry["result"]
+        logger.info(
+            "request %s took %dms",
+            aggregate_result.url,
+            aggregate_result.elapsed.total_seconds() * 1000,
+        )
+        compact = compact_result(aggregate_result.json())
+        cache.set(
+            key,
+            {"fetched_at": time.time(), "result": compact},
+            settings.OPENSPENDING_CACHE_HARD_TTL
+            + settings.OPENSPENDING_CACHE_FALLBACK_TTL,
+        )
+        return expand_result(compact)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def request_aggregate_page(url, session=http_session):
+    """Fetches the aggregate url without reading or writing the cache"""
+    with get_upstream("openspending").guard(), instrumentation.timed(
+        "openspending", "aggregate", "uncached", detail=url
+    ):
+        response = session.get(url)
+        response.raise_for_status()
+    return response.json()
+
+
+def iter_aggregate_pages(url, session=http_session, cached_entry=None, use_cache=True):
+    """
+    Yields each page of results of the aggregate API call at url, starting
+    with the page the url refers to, which is cached_entry if it is given.
+    Without use_cache, pages are fetched without reading or writing the cache.
+    """
+    if use_cache:
+        get_page = get_aggregate_page
+        first_page = get_page(url, session=session, cached_entry=cached_entry)
+    else:
+        get_page = request_aggregate_page
+        first_page = get_page(url, session=session)
+    yield first_page
+
+    page_count = aggregate_page_count(first_page)
+    if page_count <= 1:
+        return
+    logger.info("%s has %d pages of results", url, page_count)
+    page_urls = [page_url(url, page) for page in range(2, page_count + 1)]
+    executor = get_executor(
+        "openspending-pages", settings.OPENSPENDING_PAGE_CONCURRENCY
+    )
+    yield from imap_ordered(
+        executor,
+        lambda u: get_page(u, session=session),
+        page_urls,
+        settings.OPENSPENDING_PAGE_CONCURRENCY,
+    )
+
+
+def iter_aggregate_cells(url, session=http_session, use_cache=True):
+    """
+    Returns an iterator over the cells of every page of the aggregate API call
+    at url. The first page is fetched before returning so that upstream errors
+    surface before the caller starts consuming cells.
+    """
+    pages = iter_aggregate_pages(url, session=session, use_cache=use_cache)
+    first_page = next(pages)
+    return chain(first_page["cells"], chain.from_iterable(p["cells"] for p in pages))
+
+
+def aggregate_page_count(aggregate_result):
+    page_size = aggregate_result.get("page_size") or PAGE_SIZE
+    total_cell_count = aggregate_result.get("total_cell_count")
+    if total_cell_count is None:
+        return 1
+    return max(1, int(math.ceil(total_cell_count / float(page_size))))
+
+
+def page_url(url, page):
+    """Returns the aggregate url with the page parameter set to page"""
+    if page == 1:
+        return url
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    params["page"] = page
+    sorted_params = OrderedDict(sorted(params.items(), key=lambda t: t[0]))
+    return urlunsplit((scheme, netloc, path, urlencode(sorted_params), fragment))
+
+
+def all_pages_url(url):
+    """
+    Returns the aggregate url without a page parameter and with pages of
+    PAGE_SIZE cells, so that its pages can be walked from the first.
+    """
+    scheme, netloc, path, query, fragment = urlsplit(url)
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    params.pop("page", None)
+    params["pagesize"] = PAGE_SIZE
+    sorted_params = OrderedDict(sorted(params.items(), key=lambda t: t[0]))
+    return urlunsplit((scheme, netloc, path, urlencode(sorted_params), fragment))
+
+
 def cube_url(model_url):
     return re.sub("model/?$", "", model_url)
 
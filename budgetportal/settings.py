@@ -20,7 +20,8 @@ import boto3
 import dj_database_url
 import environ
 import sentry_sdk
-from ckanapi import RemoteCKAN
+from budgetportal.ckan_client import CKANClient
+from budgetportal.http_client import PooledSession
 from sentry_sdk.integrations.django import DjangoIntegration
 
 # THINK VERY CAREFULY before using the TEST variable.
@@ -141,10 +142,16 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "wagtail.core.middleware.SiteMiddleware",
     "wagtail.contrib.redirects.middleware.RedirectMiddleware",
+    "budgetportal.middleware.UpstreamTimingMiddleware",
 ]
 
 if DEBUG_TOOLBAR:
     MIDDLEWARE.insert(0, "debug_toolbar.middleware.DebugToolbarMiddleware")
+    from debug_toolbar.settings import PANELS_DEFAULTS
+
+    DEBUG_TOOLBAR_PANELS = PANELS_DEFAULTS + [
+        "budgetportal.debug_panels.UpstreamCallsPanel"
+    ]
 
 SITE_ID = int(os.environ.get("DJANGO_SITE_ID", 1))
 
@@ -185,6 +192,10 @@ HAYSTACK_CONNECTIONS = {
 }
 
 # Caches
+# The "fallback" cache holds the last results of upstream calls, used while the
+# upstream is unavailable. It is kept apart so that those copies don't push the
+# page and aggregate results out of the default cache.
+UPSTREAM_FALLBACK_MAX_ENTRIES = env.int("UPSTREAM_FALLBACK_MAX_ENTRIES", 2000)
 if DEBUG:
     if os.environ.get("DEBUG_CACHE", "false").lower() == "true":
         print("\nDEBUG_CACHE=True: Django cache enabled.\n")
@@ -192,21 +203,69 @@ if DEBUG:
             "default": {
                 "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
                 "LOCATION": "unique-snowflake",
-            }
+            },
+            "fallback": {
+                "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                "LOCATION": "fallback",
+            },
         }
     else:
-        CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+        CACHES = {
+            "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            "fallback": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+        }
 else:
     CACHES = {
         "default": {
             "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
             "LOCATION": "/var/tmp/django_cache",
-        }
+        },
+        "fallback": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": "/var/tmp/django_cache_fallback",
+            "OPTIONS": {"MAX_ENTRIES": UPSTREAM_FALLBACK_MAX_ENTRIES},
+        },
     }
 
+# Each upstream service gets at most UPSTREAM_MAX_CONCURRENCY concurrent calls per
+# worker, waiting up to UPSTREAM_QUEUE_TIMEOUT seconds for a free slot. After
+# UPSTREAM_FAILURE_THRESHOLD consecutive failures, calls fail fast for
+# UPSTREAM_RESET_TIMEOUT seconds and last known results (kept for
+# UPSTREAM_FALLBACK_TTL seconds) are used where there are any.
+UPSTREAM_MAX_CONCURRENCY = env.int("UPSTREAM_MAX_CONCURRENCY", 16)
+UPSTREAM_QUEUE_TIMEOUT = env.float("UPSTREAM_QUEUE_TIMEOUT", 10)
+UPSTREAM_FAILURE_THRESHOLD = env.int("UPSTREAM_FAILURE_THRESHOLD", 5)
+UPSTREAM_RESET_TIMEOUT = env.int("UPSTREAM_RESET_TIMEOUT", 30)
+UPSTREAM_FALLBACK_TTL = env.int("UPSTREAM_FALLBACK_TTL", 60 * 60 * 24 * 7)
+
+# Outbound HTTP shares one pool of keep-alive connections per upstream host.
+# Timeouts are in seconds; retries cover connection errors and 502/503/504s and
+# are only started within HTTP_RETRY_BUDGET seconds of the start of a request.
+# The pools fit the ckan and ckan-datastore bulkheads, which share a host.
+HTTP_CONNECT_TIMEOUT = env.float("HTTP_CONNECT_TIMEOUT", 5)
+HTTP_READ_TIMEOUT = env.float("HTTP_READ_TIMEOUT", 60)
+HTTP_RETRIES = env.int("HTTP_RETRIES", 2)
+HTTP_RETRY_BUDGET = env.float("HTTP_RETRY_BUDGET", 10)
+HTTP_POOL_MAXSIZE = env.int("HTTP_POOL_MAXSIZE", 2 * UPSTREAM_MAX_CONCURRENCY)
+HTTP_SESSION = PooledSession(
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+    retries=HTTP_RETRIES,
+    pool_maxsize=HTTP_POOL_MAXSIZE,
+    retry_budget=HTTP_RETRY_BUDGET,
+)
+
 CKAN_URL = os.environ.get("CKAN_URL", "https://data.vulekamali.gov.za")
 CKAN_API_KEY = os.environ.get("CKAN_API_KEY", None)
-CKAN = RemoteCKAN(CKAN_URL, apikey=CKAN_API_KEY)
+# How long, in seconds, package_search, package_show and group_show results are
+# reused within a process. Our own writes to CKAN invalidate them immediately.
+CKAN_CACHE_TTL = env.int("CKAN_CACHE_TTL", 300)
+# How many independent package_search queries to run concurrently
+CKAN_QUERY_CONCURRENCY = env.int("CKAN_QUERY_CONCURRENCY", 6)
+# How long, in seconds, the directory of all CKAN organizations is reused
+CKAN_ORGANIZATIONS_TTL = env.int("CKAN_ORGANIZATIONS_TTL", 60 * 60)
+CKAN = CKANClient(
+    CKAN_URL, apikey=CKAN_API_KEY, session=HTTP_SESSION, cache_ttl=CKAN_CACHE_TTL
+)
 
 DISCOURSE_SSO_URLS = {
     "discourse": os.environ.get(
@@ -226,6 +285,39 @@ OPENSPENDING_API_KEY = os.environ.get("OPENSPENDING_API_KEY", "")
 OPENSPENDING_DATASET_CREATE_SUFFIX = os.environ.get(
     "OPENSPENDING_DATASET_CREATE_SUFFIX", ""
 )
+# How many further pages of a multi-page aggregate result to fetch concurrently
+OPENSPENDING_PAGE_CONCURRENCY = env.int("OPENSPENDING_PAGE_CONCURRENCY", 4)
+# How many independent aggregate queries to fetch concurrently with aggregate_many
+OPENSPENDING_QUERY_CONCURRENCY = env.int("OPENSPENDING_QUERY_CONCURRENCY", 6)
+# How many sections of a page like the department page to compute concurrently
+# for each request. Each concurrent section uses its own database connection.
+# With less than 2, sections are computed one after the other in the request's
+# thread.
+PAGE_SECTION_CONCURRENCY = env.int("PAGE_SECTION_CONCURRENCY", 8)
+# Sections not done within this many seconds of starting are left out of the page
+PAGE_SECTION_TIMEOUT = env.float("PAGE_SECTION_TIMEOUT", 20)
+# How long, in seconds, the data of a page section is cached. Cached sections are
+# also replaced as soon as the datasets they come from change.
+PAGE_SECTION_CACHE_TTL = env.int("PAGE_SECTION_CACHE_TTL", 60 * 60 * 6)
+# The cache warmer requests pages from this site, so that they are cached by the
+# hosts serving it. Caches are only warmed after uploads when it is set. How many
+# pages it requests at a time, and how many seconds it waits for each.
+CACHE_WARMER_BASE_URL = env.str("CACHE_WARMER_BASE_URL", None)
+CACHE_WARMER_CONCURRENCY = env.int("CACHE_WARMER_CONCURRENCY", 4)
+CACHE_WARMER_TIMEOUT = env.float("CACHE_WARMER_TIMEOUT", 120)
+# Cached aggregate results older than the soft TTL (seconds) are served while they
+# are refreshed in the background. After the hard TTL they are fetched again first.
+OPENSPENDING_CACHE_SOFT_TTL = env.int("OPENSPENDING_CACHE_SOFT_TTL", 60 * 60)
+OPENSPENDING_CACHE_HARD_TTL = env.int("OPENSPENDING_CACHE_HARD_TTL", 60 * 60 * 24 * 7)
+# How much longer results are kept to serve when OpenSpending is unavailable
+OPENSPENDING_CACHE_FALLBACK_TTL = env.int(
+    "OPENSPENDING_CACHE_FALLBACK_TTL", 60 * 60 * 24 * 30
+)
+# How long, in seconds, a cube's model is used before it is revalidated
+OPENSPENDING_MODEL_TTL = env.int("OPENSPENDING_MODEL_TTL", 300)
+# Dataset categories whose OpenSpending cubes are loaded into each worker process
+# and aggregated locally, e.g. "budgeted-and-actual-national-expenditure"
+OPENSPENDING_LOCAL_CUBE_CATEGORIES = env.list("OPENSPENDING_LOCAL_CUBE_CATEGORIES", [])
 
 # http://django-allauth.readthedocs.io/en/latest/configuration.html
 ACCOUNT_ADAPTER = "budgetportal.allauthadapters.AccountAdapter"
@@ -13,6 +13,7 @@ from .models import (
     FinancialYear,
 )
 from .models.government import csv_url
+from .openspending import aggregate_many
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +24,30 @@ PROV_EQ_SHARE_SUBPROG = "Provincial Equitable Share"
 def get_focus_area_preview(financial_year):
     """Returns data for the focus area preview pages."""
 
-    national_expenditure_results, national_os_api = get_focus_area_data(
-        financial_year, "national"
+    national_os_api = get_expenditure_time_series_dataset(
+        "national"
+    ).get_openspending_api()
+    provincial_os_api = get_expenditure_time_series_dataset(
+        "provincial"
+    ).get_openspending_api()
+    national_results, provincial_results, prov_eq_share_results = aggregate_many(
+        [
+            (
+                national_os_api,
+                focus_area_query(national_os_api, financial_year, "national"),
+            ),
+            (
+                provincial_os_api,
+                focus_area_query(provincial_os_api, financial_year, "provincial"),
+            ),
+            (national_os_api, prov_eq_share_query(national_os_api, financial_year)),
+        ]
     )
-    provincial_expenditure_results, provincial_os_api = get_focus_area_data(
-        financial_year, "provincial"
+    national_expenditure_results = focus_area_cells(national_os_api, national_results)
+    provincial_expenditure_results = focus_area_cells(
+        provincial_os_api, provincial_results
     )
+
     nat_function_ref = national_os_api.get_function_ref()
     prov_function_ref = provincial_os_api.get_function_ref()
 
@@ -37,6 +56,8 @@ def get_focus_area_preview(financial_year):
         cell[prov_function_ref] for cell in provincial_expenditure_results
     ]
     unique_functions = list(set(function_names))
+    if unique_functions:
+        prov_eq_share = get_prov_eq_share(national_os_api, prov_eq_share_results)
 
     function_objects = []
     for function in unique_functions:
@@ -49,6 +70,7 @@ def get_focus_area_preview(financial_year):
                     function,
                     national_os_api,
                     national_expenditure_results,
+                    prov_eq_share,
                 ),
                 "provincial": provincial_summary_for_function(
                     financial_year,
@@ -63,11 +85,7 @@ def get_focus_area_preview(financial_year):
     return {"data": {"items": function_objects}} if function_objects else None
 
 
-def get_focus_area_data(financial_year, sphere_slug):
-    dataset = get_expenditure_time_series_dataset(sphere_slug)
-    if not dataset:
-        return None, None
-    openspending_api = dataset.get_openspending_api()
+def focus_area_query(openspending_api, financial_year, sphere_slug):
     year_ref = openspending_api.get_financial_year_ref()
     dept_ref = openspending_api.get_department_name_ref()
     function_ref = openspending_api.get_function_ref()
@@ -84,17 +102,15 @@ def get_focus_area_data(financial_year, sphere_slug):
     if sphere_slug == "provincial":
         drilldowns.append(government_ref)
 
-    results = openspending_api.aggregate(cuts=cuts, drilldowns=drilldowns)
-    cells = results["cells"]
-    cells = [c for c in cells if c[function_ref] != ""]
-    return cells, openspending_api
+    return {"cuts": cuts, "drilldowns": drilldowns}
 
 
-def get_prov_eq_share(financial_year):
-    dataset = get_expenditure_time_series_dataset("national")
-    if not dataset:
-        return None, None
-    openspending_api = dataset.get_openspending_api()
+def focus_area_cells(openspending_api, results):
+    function_ref = openspending_api.get_function_ref()
+    return [c for c in results["cells"] if c[function_ref] != ""]
+
+
+def prov_eq_share_query(openspending_api, financial_year):
     year_ref = openspending_api.get_financial_year_ref()
     dept_ref = openspending_api.get_department_name_ref()
     function_ref = openspending_api.get_function_ref()
@@ -110,7 +126,11 @@ def get_prov_eq_share(financial_year):
 
     drilldowns = [function_ref]
 
-    results = openspending_api.aggregate(cuts=cuts, drilldowns=drilldowns)
+    return {"cuts": cuts, "drilldowns": drilldowns}
+
+
+def get_prov_eq_share(openspending_api, results):
+    function_ref = openspending_api.get_function_ref()
     count = len(results["cells"])
     if count != 1:
         raise Exception(
@@ -121,9 +141,9 @@ def get_prov_eq_share(financial_year):
 
 
 def national_summary_for_function(
-    financial_year, function, openspending_api, expenditure_results
+    financial_year, function, openspending_api, expenditure_results, prov_eq_share
 ):
-    eq_share_function, eq_share_amount = get_prov_eq_share(financial_year)
+    eq_share_function, eq_share_amount = prov_eq_share
 
     dept_ref = openspending_api.get_department_name_ref()
     function_ref = openspending_api.get_function_ref()
@@ -304,9 +324,6 @@ def get_preview_page(financial_year_id, phase_slug, government_slug, sphere_slug
         openspending_api.get_phase_ref() + ":" + '"{}"'.format(selected_phase),
     ]
     expenditure_drilldowns = [department_ref, geo_ref, programme_ref, function_ref]
-    expenditure_results = openspending_api.aggregate(
-        cuts=expenditure_cuts, drilldowns=expenditure_drilldowns
-    )
 
     # We do a separate call to always build focus area data from the main
     # appropriation phase
@@ -321,8 +338,14 @@ def get_preview_page(financial_year_id, phase_slug, government_slug, sphere_slug
     ]
     focus_drilldowns = [department_ref, geo_ref, function_ref]
 
-    focus_results = openspending_api.aggregate(
-        cuts=focus_cuts, drilldowns=focus_drilldowns
+    expenditure_results, focus_results = aggregate_many(
+        [
+            (
+                openspending_api,
+                {"cuts": expenditure_cuts, "drilldowns": expenditure_drilldowns},
+            ),
+            (openspending_api, {"cuts": focus_cuts, "drilldowns": focus_drilldowns}),
+        ]
     )
 
     # Filter departments that belong to the selected government
@@ -6,8 +6,8 @@ Tasks MUST be idempotent.
 import logging
 import traceback
 
-from budgetportal import infra_projects
-from budgetportal.models import Department, IRMSnapshot
+from budgetportal import cache_warmer, department_page, infra_projects, openspending
+from budgetportal.models import Department, FinancialYear, IRMSnapshot
 from django.conf import settings
 from django.core.management import call_command
 from django_q.tasks import async_task
@@ -17,6 +17,8 @@ logger = logging.getLogger(__name__)
 
 
 def create_dataset(department_id, name, title, group_name):
+    # Check what exists in CKAN itself rather than cached search results
+    ckan.invalidate_cache()
     department = Department.objects.get(pk=department_id)
     dataset = department.get_dataset(group_name, name)
     if dataset:
@@ -24,10 +26,12 @@ def create_dataset(department_id, name, title, group_name):
         return {"status": "Already exists", "package": dataset.package}
     else:
         dataset = department.create_dataset(name, title, group_name)
+        queue_department_page_materialization(department)
         return {"status": "Created", "package": dataset.package}
 
 
 def create_resource(department_id, group_name, dataset_name, name, format, url):
+    ckan.invalidate_cache()
     department = Department.objects.get(pk=department_id)
     dataset = department.get_dataset(group_name, dataset_name)
     resource = dataset.get_resource(format, name)
@@ -41,9 +45,71 @@ def create_resource(department_id, group_name, dataset_name, name, format, url):
         return {"status": "Already exists", "resource": resource}
     else:
         resource = dataset.create_resource(name, format, url)
+        queue_department_page_materialization(department)
         return {"status": "Created", "package": resource}
 
 
+def queue_department_page_materialization(department):
+    async_task(
+        materialize_department_page,
+        department_id=department.pk,
+        task_name="Materialize %s" % department.get_url_path(),
+    )
+
+
+def refresh_aggregate_page(url):
+    openspending.fetch_aggregate_page(url)
+
+
+def materialize_department_pages(financial_year_slug, force=False):
+    """
+    Rebuilds the stored page data of each department in a financial year whose
+    sources changed since it was built, or of all of them if force is set.
+    """
+    departments = Department.objects.filter(
+        government__sphere__financial_year__slug=financial_year_slug
+    )
+    statuses = {}
+    for department in departments:
+        try:
+            result = materialize_department_page(department.pk, force)
+            status = result["status"]
+        except Exception:
+            logger.exception("Failed to materialize %s", department.get_url_path())
+            status = "Failed"
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses
+
+
+def materialize_department_page(department_id, force=False):
+    department = Department.objects.get(pk=department_id)
+    financial_years = [
+        {"id": year.slug} for year in FinancialYear.get_available_years()
+    ]
+    return {"status": department_page.materialize(department, financial_years, force)}
+
+
+def warm_caches(priority=None, base_url=None):
+    """
+    Requests the sitemap pages and the JSON they load so that the first visitors
+    after a deploy or upload get cached pages. Returns a summary with the
+    slowest pages and those that failed.
+    """
+    results = list(cache_warmer.warm(base_url=base_url, priority=priority))
+    slowest = sorted(results, key=lambda r: r.duration_ms, reverse=True)
+    return {
+        "count": len(results),
+        "seconds": round(sum(r.duration_ms for r in results) / 1000, 1),
+        "failed": [r.path for r in results if r.status != 200],
+        "slowest": [[r.path, round(r.duration_ms)] for r in slowest[:20]],
+    }
+
+
+def queue_cache_warming():
+    if settings.CACHE_WARMER_BASE_URL:
+        async_task(warm_caches, task_name="Warm caches")
+
+
 class RowError(Exception):
     def __init__(self, message, row_result, row_num):
         super(Exception, self).__init__(message)
@@ -93,4 +159,6 @@ def import_irm_snapshot(snapshot_id):
 
 
 def index_irm_projects(snapshot_id):
-    return call_command("haystack_update_index", "-r")
+    result = call_command("haystack_update_index", "-r")
+    queue_cache_warming()
+    return result
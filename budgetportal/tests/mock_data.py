@@ -1,160 +1,166 @@
 from decimal import Decimal
 
-CPI_2019_20 = {
-    "1996": {
-        "CPI": "0.081341339073298",
-        "Year": "1996/97",
-        "financial_year_start": "1996",
-        "index": Decimal("29.15351953553183659377285178"),
-    },
-    "1997": {
-        "CPI": "0.075536930330016",
-        "Year": "1997/98",
-        "financial_year_start": "1997",
-        "index": Decimal("31.35568690956206535036618471"),
-    },
-    "1998": {
-        "CPI": "0.076173777518021",
-        "Year": "1998/99",
-        "financial_year_start": "1998",
-        "index": Decimal("33.74416802813576957260265599"),
-    },
-    "1999": {
-        "CPI": "0.037925416364953",
-        "Year": "1999/00",
-        "financial_year_start": "1999",
-        "index": Decimal("35.02392965049175369249598743"),
-    },
-    "2000": {
-        "CPI": "0.064969041597628",
-        "Year": "2000/01",
-        "financial_year_start": "2000",
-        "index": Decimal("37.29940079286694913746974641"),
-    },
-    "2001": {
-        "CPI": "0.052898788077301",
-        "Year": "2001/02",
-        "financial_year_start": "2001",
-        "index": Decimal("39.27249389081913077278894942"),
-    },
-    "2002": {
-        "CPI": "0.103981956758438",
-        "Year": "2002/03",
-        "financial_year_start": "2002",
-        "index": Decimal("43.35612465237030615432841586"),
-    },
-    "2003": {
-        "CPI": "0.033392039450511",
-        "Year": "2003/04",
-        "financial_year_start": "2003",
-        "index": Decimal("44.80387407718352793313968934"),
-    },
-    "2004": {
-        "CPI": "0.019905924057536",
-        "Year": "2004/05",
-        "financial_year_start": "2004",
-        "index": Decimal("45.69573659204734907313347654"),
-    },
-    "2005": {
-        "CPI": "0.036227524898069",
-        "Year": "2005/06",
-        "financial_year_start": "2005",
-        "index": Decimal("47.35118002717134708630016805"),
-    },
-    "2006": {
-        "CPI": "0.051860930142553",
-        "Year": "2006/07",
-        "financial_year_start": "2006",
-        "index": Decimal("49.80685626672793118196184207"),
-    },
-    "2007": {
-        "CPI": "0.081345434475992",
-        "Year": "2007/08",
-        "financial_year_start": "2007",
-        "index": Decimal("53.85841662962819963199302250"),
-    },
-    "2008": {
-        "CPI": "0.098760881277115",
-        "Year": "2008/09",
-        "financial_year_start": "2008",
-        "index": Decimal("59.17752132016030645441194773"),
-    },
-    "2009": {
-        "CPI": "0.064516129032258",
-        "Year": "2009/10",
-        "financial_year_start": "2009",
-        "index": Decimal("62.99542592146096756905005273"),
-    },
-    "2010": {
-        "CPI": "0.038181818181818",
-        "Year": "2010/11",
-        "financial_year_start": "2010",
-        "index": Decimal("65.40070582028037487706361448"),
-    },
-    "2011": {
-        "CPI": "0.055458260361938",
-        "Year": "2011/12",
-        "financial_year_start": "2011",
-        "index": Decimal("69.02771519151599784307391477"),
-    },
-    "2012": {
-        "CPI": "0.055420353982301",
-        "Year": "2012/13",
-        "financial_year_start": "2012",
-        "index": Decimal("72.85325560201927070902566593"),
-    },
-    "2013": {
-        "CPI": "0.058170003144324",
-        "Year": "2013/14",
-        "financial_year_start": "2013",
-        "index": Decimal("77.09112970946297175373333027"),
-    },
-    "2014": {
-        "CPI": "0.056259904912837",
-        "Year": "2014/15",
-        "financial_year_start": "2014",
-        "index": Decimal("81.42826933654054200675012982"),
-    },
-    "2015": {
-        "CPI": "0.051669167291823",
-        "Year": "2015/16",
-        "financial_year_start": "2015",
-        "index": Decimal("85.63560020717387631656468800"),
-    },
-    "2016": {
-        "CPI": "0.062951404369147",
-        "Year": "2016/17",
-        "financial_year_start": "2016",
-        "index": Decimal("91.02648150421028761249239849"),
-    },
-    "2017": {
-        "CPI": "0.047143695998659",
-        "Year": "2017/18",
-        "financial_year_start": "2017",
-        "index": Decimal("95.31780627607233362007115993"),
-    },
-    "2018": {
-        "CPI": "0.049121920728709",
-        "Year": "2018/19",
-        "financial_year_start": "2018",
-        "index": 100,
-    },
-    "2019": {
-        "CPI": "0.051581145336389",
-        "Year": "2019/20",
-        "financial_year_start": "2019",
-        "index": Decimal("105.158114533638900"),
-    },
-    "2020": {
-        "CPI": "0.054786768395168",
-        "Year": "2020/21",
-        "financial_year_start": "2020",
-        "index": Decimal("110.9193877994659244141042168"),
-    },
-    "2021": {
-        "CPI": "0.054285094208856",
-        "Year": "2021/22",
-        "financial_year_start": "2021",
-        "index": Decimal("116.9406572157485649289660142"),
-    },
-}
+from budgetportal.models.government import CPIIndex
+
+CPI_2019_20 = CPIIndex(
+    "cpi-2019-20",
+    2018,
+    {
+        "1996": {
+            "CPI": "0.081341339073298",
+            "Year": "1996/97",
+            "financial_year_start": "1996",
+            "index": Decimal("29.15351953553183659377285178"),
+        },
+        "1997": {
+            "CPI": "0.075536930330016",
+            "Year": "1997/98",
+            "financial_year_start": "1997",
+            "index": Decimal("31.35568690956206535036618471"),
+        },
+        "1998": {
+            "CPI": "0.076173777518021",
+            "Year": "1998/99",
+            "financial_year_start": "1998",
+            "index": Decimal("33.74416802813576957260265599"),
+        },
+        "1999": {
+            "CPI": "0.037925416364953",
+            "Year": "1999/00",
+            "financial_year_start": "1999",
+            "index": Decimal("35.02392965049175369249598743"),
+        },
+        "2000": {
+            "CPI": "0.064969041597628",
+            "Year": "2000/01",
+            "financial_year_start": "2000",
+            "index": Decimal("37.29940079286694913746974641"),
+        },
+        "2001": {
+            "CPI": "0.052898788077301",
+            "Year": "2001/02",
+            "financial_year_start": "2001",
+            "index": Decimal("39.27249389081913077278894942"),
+        },
+        "2002": {
+            "CPI": "0.103981956758438",
+            "Year": "2002/03",
+            "financial_year_start": "2002",
+            "index": Decimal("43.35612465237030615432841586"),
+        },
+        "2003": {
+            "CPI": "0.033392039450511",
+            "Year": "2003/04",
+            "financial_year_start": "2003",
+            "index": Decimal("44.80387407718352793313968934"),
+        },
+        "2004": {
+            "CPI": "0.019905924057536",
+            "Year": "2004/05",
+            "financial_year_start": "2004",
+            "index": Decimal("45.69573659204734907313347654"),
+        },
+        "2005": {
+            "CPI": "0.036227524898069",
+            "Year": "2005/06",
+            "financial_year_start": "2005",
+            "index": Decimal("47.35118002717134708630016805"),
+        },
+        "2006": {
+            "CPI": "0.051860930142553",
+            "Year": "2006/07",
+            "financial_year_start": "2006",
+            "index": Decimal("49.80685626672793118196184207"),
+        },
+        "2007": {
+            "CPI": "0.081345434475992",
+            "Year": "2007/08",
+            "financial_year_start": "2007",
+            "index": Decimal("53.85841662962819963199302250"),
+        },
+        "2008": {
+            "CPI": "0.098760881277115",
+            "Year": "2008/09",
+            "financial_year_start": "2008",
+            "index": Decimal("59.17752132016030645441194773"),
+        },
+        "2009": {
+            "CPI": "0.064516129032258",
+            "Year": "2009/10",
+            "financial_year_start": "2009",
+            "index": Decimal("62.99542592146096756905005273"),
+        },
+        "2010": {
+            "CPI": "0.038181818181818",
+            "Year": "2010/11",
+            "financial_year_start": "2010",
+            "index": Decimal("65.40070582028037487706361448"),
+        },
+        "2011": {
+            "CPI": "0.055458260361938",
+            "Year": "2011/12",
+            "financial_year_start": "2011",
+            "index": Decimal("69.02771519151599784307391477"),
+        },
+        "2012": {
+            "CPI": "0.055420353982301",
+            "Year": "2012/13",
+            "financial_year_start": "2012",
+            "index": Decimal("72.85325560201927070902566593"),
+        },
+        "2013": {
+            "CPI": "0.058170003144324",
+            "Year": "2013/14",
+            "financial_year_start": "2013",
+            "index": Decimal("77.09112970946297175373333027"),
+        },
+        "2014": {
+            "CPI": "0.056259904912837",
+            "Year": "2014/15",
+            "financial_year_start": "2014",
+            "index": Decimal("81.42826933654054200675012982"),
+        },
+        "2015": {
+            "CPI": "0.051669167291823",
+            "Year": "2015/16",
+            "financial_year_start": "2015",
+            "index": Decimal("85.63560020717387631656468800"),
+        },
+        "2016": {
+            "CPI": "0.062951404369147",
+            "Year": "2016/17",
+            "financial_year_start": "2016",
+            "index": Decimal("91.02648150421028761249239849"),
+        },
+        "2017": {
+            "CPI": "0.047143695998659",
+            "Year": "2017/18",
+            "financial_year_start": "2017",
+            "index": Decimal("95.31780627607233362007115993"),
+        },
+        "2018": {
+            "CPI": "0.049121920728709",
+            "Year": "2018/19",
+            "financial_year_start": "2018",
+            "index": 100,
+        },
+        "2019": {
+            "CPI": "0.051581145336389",
+            "Year": "2019/20",
+            "financial_year_start": "2019",
+            "index": Decimal("105.158114533638900"),
+        },
+        "2020": {
+            "CPI": "0.054786768395168",
+            "Year": "2020/21",
+            "financial_year_start": "2020",
+            "index": Decimal("110.9193877994659244141042168"),
+        },
+        "2021": {
+            "CPI": "0.054285094208856",
+            "Year": "2021/22",
+            "financial_year_start": "2021",
+            "index": Decimal("116.9406572157485649289660142"),
+        },
+    },
+)
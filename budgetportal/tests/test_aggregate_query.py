@@ -0,0 +1,72 @@
+"""
+Tests of budgetportal.aggregate_query
+"""
+from budgetportal.aggregate_query import (
+    AggregateQuery,
+    CanonicalKeyStats,
+    Cut,
+    InvalidCut,
+)
+from budgetportal.openspending import BabbageFiscalDataset
+from django.test import SimpleTestCase
+
+
+class CutTestCase(SimpleTestCase):
+    def test_quoting_is_normalised(self):
+        self.assertEqual(
+            Cut.parse('phase.phase:"Total"'), Cut.parse("phase.phase:Total")
+        )
+        self.assertEqual(str(Cut.parse("phase.phase:Total")), 'phase.phase:"Total"')
+        self.assertEqual(str(Cut.parse('year.year:"2019"')), "year.year:2019")
+
+    def test_value_sets(self):
+        cut = Cut.parse('dept.name:B;"A"')
+        self.assertEqual(str(cut), 'dept.name:"A";"B"')
+        self.assertTrue(cut.matches("A"))
+        self.assertFalse(cut.matches("C"))
+
+    def test_quoted_values_may_contain_semicolons(self):
+        cut = Cut.parse('dept.name:"A; B";C')
+        self.assertEqual(frozenset(["A; B", "C"]), cut.values)
+        self.assertTrue(cut.matches("A; B"))
+        self.assertEqual(cut, Cut.parse(str(cut)))
+
+    def test_matches_numbers_as_strings(self):
+        self.assertTrue(Cut.parse("year.year:2019").matches(2019))
+        self.assertTrue(Cut.parse("year.year:2019").matches(2019.0))
+
+    def test_invalid_cut(self):
+        with self.assertRaises(InvalidCut):
+            Cut.parse("year.year")
+
+
+class AggregateQueryTestCase(SimpleTestCase):
+    def test_equivalent_queries_share_a_url(self):
+        dataset = BabbageFiscalDataset.__new__(BabbageFiscalDataset)
+        dataset.cube_url = "https://openspending.org/api/3/cubes/abc/"
+        url = dataset.aggregate_url(
+            cuts=['phase.phase:"Total"', "year.year:2019"],
+            drilldowns=["dept.name", "programme.name"],
+        )
+        self.assertEqual(
+            url,
+            dataset.aggregate_url(
+                cuts=["year.year:2019", "phase.phase:Total", "year.year:2019"],
+                drilldowns=["dept.name", "programme.name", "dept.name"],
+            ),
+        )
+
+    def test_drilldown_order_is_kept(self):
+        query = AggregateQuery.build(drilldowns=["b", "a", "b"])
+        self.assertEqual(query.params(), {"drilldown": "b|a"})
+
+    def test_stats_count_collapsed_keys(self):
+        stats = CanonicalKeyStats()
+        stats.record("cut=a:1|b:2", "cut=a:1|b:2")
+        stats.record("cut=b:2|a:1", "cut=a:1|b:2")
+        stats.record("cut=b:2|a:1", "cut=a:1|b:2")
+        stats.record("cut=c:3", "cut=c:3")
+        self.assertEqual(
+            stats.summary(),
+            {"raw_keys": 3, "canonical_keys": 2, "collapsed_keys": 1},
+        )
@@ -0,0 +1,71 @@
+"""
+Tests of budgetportal.aggregate_result
+"""
+import json
+import pickle
+
+from budgetportal.aggregate_result import compact_result, expand_result
+from budgetportal.json_encoder import JSONEncoder
+from django.test import SimpleTestCase
+
+API_RESULT = {
+    "page": 1,
+    "page_size": 10000,
+    "total_cell_count": 2,
+    "summary": {"value.sum": 15, "_count": 2},
+    "attributes": ["dept.name"],
+    "cells": [
+        {"dept.name": "A", "value.sum": 10, "_count": 1},
+        {"dept.name": "B", "value.sum": 5.5, "_count": 1},
+    ],
+}
+
+
+class CompactResultTestCase(SimpleTestCase):
+    def setUp(self):
+        compact = pickle.loads(pickle.dumps(compact_result(API_RESULT)))
+        self.result = expand_result(compact)
+
+    def test_round_trip(self):
+        self.assertEqual(self.result["cells"], API_RESULT["cells"])
+        self.assertEqual(self.result["total_cell_count"], 2)
+        self.assertNotIn("summary", self.result)
+        self.assertEqual(
+            list(self.result["cells"][0].keys()), ["dept.name", "value.sum", "_count"]
+        )
+
+    def test_cells_can_be_changed(self):
+        cell = self.result["cells"][1]
+        cell["url"] = "/dept/b"
+        cell["value.sum"] = 6
+        del cell["_count"]
+        self.assertEqual(cell, {"dept.name": "B", "value.sum": 6, "url": "/dept/b"})
+        self.assertEqual(self.result["cells"][0]["value.sum"], 10)
+        self.assertEqual(cell.get("_count", "missing"), "missing")
+
+    def test_cells_serialise_like_dicts(self):
+        cell = self.result["cells"][0]
+        self.assertEqual(
+            json.loads(json.dumps(cell, cls=JSONEncoder)), API_RESULT["cells"][0]
+        )
+        self.assertEqual(pickle.loads(pickle.dumps(cell)), API_RESULT["cells"][0])
+
+    def test_equal_values_of_different_types_round_trip(self):
+        cells = [{"value.sum": 100}, {"value.sum": 100.0}, {"value.sum": True}]
+        result = expand_result(compact_result({"cells": cells}))
+        self.assertEqual(
+            [(int, 100), (float, 100.0), (bool, True)],
+            [(type(c["value.sum"]), c["value.sum"]) for c in result["cells"]],
+        )
+
+    def test_missing_keys_stay_missing(self):
+        cells = [{"a": 1, "b": None}, {"a": 2}]
+        result = expand_result(
+            pickle.loads(pickle.dumps(compact_result({"cells": cells})))
+        )
+        self.assertEqual(cells, [dict(c) for c in result["cells"]])
+        cell = result["cells"][1]
+        self.assertNotIn("b", cell)
+        self.assertEqual("default", cell.get("b", "default"))
+        cell["b"] = 3
+        self.assertEqual({"a": 2, "b": 3}, cell)
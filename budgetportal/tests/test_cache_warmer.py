@@ -0,0 +1,81 @@
+"""
+Tests of budgetportal.cache_warmer
+"""
+from budgetportal import cache_warmer
+from django.test import SimpleTestCase, override_settings
+from mock import Mock, patch
+
+
+class FakeSitemap:
+    paths = []
+
+    def items(self):
+        return self.paths
+
+    def location(self, item):
+        return item
+
+
+class PagesSitemap(FakeSitemap):
+    paths = ["/", "/about"]
+
+
+class DepartmentsSitemap(FakeSitemap):
+    paths = ["/2019-20/national/departments/a/", "/"]
+
+
+@override_settings(CACHE_WARMER_CONCURRENCY=2, CACHE_WARMER_TIMEOUT=1)
+class CacheWarmerTestCase(SimpleTestCase):
+    def setUp(self):
+        sitemaps_patch = patch(
+            "budgetportal.cache_warmer.sitemaps",
+            {"static": PagesSitemap, "national_departments": DepartmentsSitemap},
+        )
+        sitemaps_patch.start()
+        self.addCleanup(sitemaps_patch.stop)
+        json_patch = patch(
+            "budgetportal.cache_warmer.iter_json_paths",
+            return_value=iter(["/json/2019-20/consolidated.json"]),
+        )
+        json_patch.start()
+        self.addCleanup(json_patch.stop)
+
+    def test_paths_are_warmed_once_in_priority_order(self):
+        paths = list(
+            cache_warmer.iter_paths(["national_departments", "json", "static"])
+        )
+        self.assertEqual(
+            [
+                "/2019-20/national/departments/a/",
+                "/",
+                "/json/2019-20/consolidated.json",
+                "/about",
+            ],
+            paths,
+        )
+
+    def test_unknown_section(self):
+        with self.assertRaises(ValueError):
+            list(cache_warmer.iter_paths(["nope"]))
+
+    def test_each_path_is_requested_and_timed(self):
+        session = Mock()
+        session.get.side_effect = lambda url, timeout: Mock(
+            status_code=404 if url.endswith("/about") else 200
+        )
+        with self.settings(HTTP_SESSION=session):
+            results = list(
+                cache_warmer.warm("https://example.com/", priority=["static"])
+            )
+        self.assertEqual(
+            [("/", 200), ("/about", 404)], [(r.path, r.status) for r in results]
+        )
+        session.get.assert_any_call("https://example.com/about", timeout=1)
+        self.assertTrue(all(r.duration_ms >= 0 for r in results))
+
+    def test_failed_request_has_no_status(self):
+        session = Mock()
+        session.get.side_effect = ConnectionError()
+        with self.settings(HTTP_SESSION=session):
+            results = list(cache_warmer.warm("https://example.com", ["static"]))
+        self.assertEqual([None, None], [r.status for r in results])
@@ -0,0 +1,93 @@
+"""
+Tests of budgetportal.ckan_client
+"""
+import requests
+from budgetportal.ckan_client import CKANClient, SharedGeneration
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+from mock import patch
+
+CKAN_URL = "https://data.vulekamali.gov.za"
+
+
+@patch("ckanapi.RemoteCKAN.call_action")
+class CKANClientCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = CKANClient(CKAN_URL, cache_ttl=60)
+
+    def test_search_is_cached_by_normalised_query(self, call_action):
+        call_action.return_value = {"count": 1, "results": [{"name": "a"}]}
+        first = self.client.call_action("package_search", {"q": "", "rows": 1})
+        first["results"].append({"name": "b"})
+        second = self.client.call_action("package_search", {"rows": 1, "q": ""})
+
+        self.assertEqual(1, call_action.call_count)
+        self.assertEqual([{"name": "a"}], second["results"])
+
+    def test_invalidate_cache(self, call_action):
+        call_action.return_value = {"name": "a"}
+        self.client.call_action("package_show", {"id": "a"})
+        self.client.invalidate_cache()
+        self.client.call_action("package_show", {"id": "a"})
+
+        self.assertEqual(2, call_action.call_count)
+
+    def test_writes_and_uncached_actions_are_not_cached(self, call_action):
+        call_action.return_value = {"name": "a"}
+        self.client.call_action("package_create", {"name": "a"})
+        self.client.call_action("package_create", {"name": "a"})
+        self.client.call_action("organization_show", {"id": "a"})
+        self.client.call_action("organization_show", {"id": "a"})
+
+        self.assertEqual(4, call_action.call_count)
+
+    def test_no_caching_without_ttl(self, call_action):
+        client = CKANClient(CKAN_URL)
+        call_action.return_value = {"name": "a"}
+        client.call_action("package_show", {"id": "a"})
+        client.call_action("package_show", {"id": "a"})
+
+        self.assertEqual(2, call_action.call_count)
+
+
+@patch("ckanapi.RemoteCKAN.call_action")
+class CKANClientFallbackTestCase(SimpleTestCase):
+    def setUp(self):
+        fallback_cache = LocMemCache("ckan-fallback-test", {})
+        fallback_cache.clear()
+        caches_patch = patch(
+            "budgetportal.ckan_client.caches", {"fallback": fallback_cache}
+        )
+        caches_patch.start()
+        self.addCleanup(caches_patch.stop)
+        self.client = CKANClient(CKAN_URL)
+
+    def test_last_result_is_used_while_ckan_is_unavailable(self, call_action):
+        call_action.return_value = {"name": "a"}
+        self.client.call_action("organization_show", {"id": "a"})
+        call_action.side_effect = requests.ConnectionError()
+        result = self.client.call_action("organization_show", {"id": "a"})
+        self.assertEqual({"name": "a"}, result)
+        with self.assertRaises(requests.ConnectionError):
+            self.client.call_action("organization_show", {"id": "b"})
+
+
+class SharedGenerationTestCase(SimpleTestCase):
+    @patch("budgetportal.ckan_client.cache")
+    def test_generation_is_read_once_per_interval(self, cache):
+        generation = SharedGeneration()
+        generation.get()
+        generation.get()
+        self.assertEqual(1, cache.get.call_count)
+
+        with patch("budgetportal.ckan_client.GENERATION_CHECK_INTERVAL", 0):
+            generation.get()
+        self.assertEqual(2, cache.get.call_count)
+
+    @patch("budgetportal.ckan_client.cache")
+    def test_change_is_seen_at_once_in_this_process(self, cache):
+        generation = SharedGeneration()
+        before = generation.get()
+        generation.change()
+        self.assertNotEqual(before, generation.get())
+        self.assertEqual(1, cache.get.call_count)
@@ -0,0 +1,59 @@
+"""
+Tests of budgetportal.concurrency
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from budgetportal.concurrency import SingleFlight
+from django.test import SimpleTestCase
+
+
+class SingleFlightTestCase(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "result"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(single_flight.do, "key", fetch)]
+            started.wait()
+            futures += [
+                executor.submit(single_flight.do, "key", fetch) for i in range(4)
+            ]
+            # Give the followers time to start waiting on the leader
+            time.sleep(0.1)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(single_flight.do("key", lambda: "again"), "again")
+
+    def test_waiters_see_the_error(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fail():
+            started.set()
+            release.wait()
+            raise ValueError("upstream failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(single_flight.do, "key", fail)
+            started.wait()
+            follower = executor.submit(single_flight.do, "key", lambda: "unused")
+            time.sleep(0.1)
+            release.set()
+            with self.assertRaises(ValueError):
+                leader.result()
+            with self.assertRaises(ValueError):
+                follower.result()
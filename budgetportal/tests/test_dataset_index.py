@@ -0,0 +1,75 @@
+"""
+Tests of budgetportal.datasets.DepartmentDatasetIndex
+"""
+from budgetportal.datasets import DepartmentDatasetIndex
+from django.test import SimpleTestCase
+from mock import patch
+
+
+def package(name, government_slug, department_slug, group, modified):
+    return {
+        "name": name,
+        "metadata_modified": modified,
+        "extras": [
+            {"key": "geographic_region_slug", "value": government_slug},
+            {"key": "department_name_slug", "value": department_slug},
+        ],
+        "groups": [{"name": group}],
+    }
+
+
+class FakePackageSearch:
+    def __init__(self, packages):
+        self.packages = packages
+        self.calls = []
+
+    def __call__(self, rows, start=0, **query):
+        self.calls.append((rows, start))
+        return {
+            "count": len(self.packages),
+            "results": self.packages[start : start + rows],
+        }
+
+
+class DepartmentDatasetIndexTestCase(SimpleTestCase):
+    def setUp(self):
+        ckan_patch = patch("budgetportal.datasets.ckan")
+        self.ckan = ckan_patch.start()
+        self.addCleanup(ckan_patch.stop)
+        page_size_patch = patch("budgetportal.datasets.PACKAGE_PAGE_SIZE", 2)
+        page_size_patch.start()
+        self.addCleanup(page_size_patch.stop)
+        self.search = FakePackageSearch(
+            [
+                package("a-budget", "south-africa", "a", "budget-vote-documents", "3"),
+                package("b-budget", "south-africa", "b", "budget-vote-documents", "2"),
+                package("a-ppt", "south-africa", "a", "performance", "1"),
+            ]
+        )
+        self.ckan.action.package_search.side_effect = self.search
+        self.index = DepartmentDatasetIndex()
+
+    def get_packages(self, department_slug, group):
+        return self.index.get_packages(
+            "2019-20", "national", "south-africa", department_slug, group
+        )
+
+    def test_packages_are_found_by_department_and_group(self):
+        packages = self.get_packages("a", "budget-vote-documents")
+        self.assertEqual(["a-budget"], [p["name"] for p in packages])
+        self.assertEqual([], self.get_packages("c", "budget-vote-documents"))
+
+    def test_index_is_fetched_page_by_page_once(self):
+        self.get_packages("a", "budget-vote-documents")
+        self.get_packages("b", "budget-vote-documents")
+        self.get_packages("a", "performance")
+        page_calls = [call for call in self.search.calls if call[0] == 2]
+        self.assertEqual([(2, 0), (2, 2)], page_calls)
+
+    def test_index_is_rebuilt_when_packages_change(self):
+        self.assertEqual([], self.get_packages("c", "budget-vote-documents"))
+        self.search.packages.insert(
+            0, package("c-budget", "south-africa", "c", "budget-vote-documents", "4")
+        )
+        packages = self.get_packages("c", "budget-vote-documents")
+        self.assertEqual(["c-budget"], [p["name"] for p in packages])
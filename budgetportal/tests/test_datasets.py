@@ -1,9 +1,16 @@
 import json
+import threading
+import time
 
-from budgetportal.datasets import Dataset
+from budgetportal.datasets import (
+    Category,
+    Dataset,
+    organization_directory,
+    package_search_many,
+)
 from budgetportal.models import FinancialYear
 from django.conf import settings
-from django.test import Client, TestCase
+from django.test import Client, SimpleTestCase, TestCase, override_settings
 from mock import patch
 
 with open("budgetportal/tests/test_data/test_contributed_datasets_list.json", "r") as f:
@@ -84,15 +91,19 @@ class TestDataset(TestCase):
             )
 
     @patch(
-        "budgetportal.datasets.ckan.action.organization_show",
-        return_value=CONTRIBUTED_DATASET_MOCK_DATA,
+        "budgetportal.datasets.ckan.action.organization_list",
+        return_value=[
+            dict(CONTRIBUTED_DATASET_MOCK_DATA, name="basic-organization-slug")
+        ],
     )
     @patch(
         "budgetportal.datasets.ckan.action.package_show",
         return_value=CONTRIBUTED_DATASET_MOCK_DATA,
     )
-    def test_contributed_dataset(self, mock_package_show, mock_organization_show):
+    def test_contributed_dataset(self, mock_package_show, mock_organization_list):
         """Test that it loads and that some text is present"""
+        organization_directory.clear()
+        self.addCleanup(organization_directory.clear)
         c = Client()
         response = c.get(
             "/datasets/contributed/people-s-guide-to-the-adjusted-budget-2018-19"
@@ -104,3 +115,65 @@ class TestDataset(TestCase):
         self.assertContains(response, "Contributed Data and Analysis")
         self.assertContains(response, "About this dataset")
         self.assertContains(response, "Last updated on 03 December 2018")
+
+
+class CategoryDatasetsTestCase(SimpleTestCase):
+    def setUp(self):
+        ckan_patch = patch("budgetportal.datasets.ckan")
+        self.ckan = ckan_patch.start()
+        self.addCleanup(ckan_patch.stop)
+        page_size_patch = patch("budgetportal.datasets.PACKAGE_PAGE_SIZE", 2)
+        page_size_patch.start()
+        self.addCleanup(page_size_patch.stop)
+        # CKAN's sort order differs from Python's for "b" and "B"
+        titles = ["A", "b", "B", "C", "D"]
+        packages = [
+            dict(CONTRIBUTED_DATASET_MOCK_DATA, name="dataset-%d" % i, title=title)
+            for i, title in enumerate(titles)
+        ]
+
+        def package_search(rows, start, **query):
+            return {"count": len(packages), "results": packages[start : start + rows]}
+
+        self.ckan.action.package_search.side_effect = package_search
+
+    def test_datasets_are_paged_and_sorted_by_name(self):
+        category = Category(slug="budget", name="Budget", description="")
+        datasets = category.get_datasets()
+        self.assertEqual(["A", "B", "C", "D", "b"], [d.name for d in datasets])
+        for call in self.ckan.action.package_search.call_args_list:
+            self.assertEqual('+groups:"budget"', call[1]["fq"])
+            self.assertEqual(2, call[1]["rows"])
+
+
+@override_settings(CKAN_QUERY_CONCURRENCY=1)
+class PackageSearchManyTestCase(SimpleTestCase):
+    def setUp(self):
+        ckan_patch = patch("budgetportal.datasets.ckan")
+        self.ckan = ckan_patch.start()
+        self.addCleanup(ckan_patch.stop)
+        self.release = threading.Event()
+
+        def package_search(q):
+            if q == "slow":
+                self.release.wait(5)
+            return {"results": [q]}
+
+        self.ckan.action.package_search.side_effect = package_search
+
+    def test_responses_in_query_order(self):
+        self.release.set()
+        responses = package_search_many([{"q": "a"}, {"q": "slow"}, {"q": "b"}])
+        self.assertEqual([["a"], ["slow"], ["b"]], [r["results"] for r in responses])
+
+    def test_calls_dont_wait_for_each_others_queries(self):
+        slow_call = threading.Thread(target=package_search_many, args=[[{"q": "slow"}]])
+        slow_call.start()
+        try:
+            start = time.monotonic()
+            responses = package_search_many([{"q": "fast"}])
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual([{"results": ["fast"]}], responses)
+        finally:
+            self.release.set()
+            slow_call.join()
@@ -5,8 +5,10 @@ import json
 
 import mock
 from budgetportal import models
+from budgetportal.department_page import build_department_page_data, cached_section
 from budgetportal.models import Department, FinancialYear, Government, Sphere
 from budgetportal.tests import mock_data
+from django.core.cache.backends.locmem import LocMemCache
 from django.test import TestCase
 from mock import Mock, patch
 
@@ -82,9 +84,13 @@ class AdjustedBudgetTestCase(TestCase):
         mock_dataset = Mock()
         mock_openspending_api = Mock()
         self.mock_openspending_api = mock_openspending_api
-        mock_openspending_api.get_adjustment_kind_ref = Mock
-        mock_openspending_api.get_phase_ref = Mock
-        mock_openspending_api.get_programme_name_ref = Mock
+        mock_openspending_api.get_adjustment_kind_ref = Mock(
+            return_value="adjustment_kind_ref"
+        )
+        mock_openspending_api.get_phase_ref = Mock(return_value="phase_ref")
+        mock_openspending_api.get_programme_name_ref = Mock(
+            return_value="programme_name_ref"
+        )
         mock_openspending_api.get_department_name_ref = Mock(
             return_value="department_name_ref"
         )
@@ -121,6 +127,40 @@ class AdjustedBudgetTestCase(TestCase):
         self.assertEqual(result["total_change"]["amount"], 11)
         self.assertEqual(result["total_change"]["percentage"], 11)
 
+    @patch("budgetportal.department_page.cache", LocMemCache("sections", {}))
+    def test_direct_charges_can_be_cached(self):
+        self.mock_openspending_api.get_subprogramme_name_ref = Mock(
+            return_value="subprogramme_ref"
+        )
+        self.mock_openspending_api.filter_dept = Mock(
+            side_effect=lambda result, name: result
+        )
+        cells = [
+            {
+                "adjustment_kind_ref": kind,
+                "phase_ref": phase,
+                "subprogramme_ref": "Salaries",
+                "value.sum": amount,
+            }
+            for kind, phase, amount in [
+                ("Adjustments - Total adjustments", "Adjusted appropriation", 10),
+                ("Total", "Voted (Main appropriation)", 100),
+            ]
+        ]
+
+        def get_direct_charges():
+            return self.department._get_budget_direct_charges(
+                self.mock_openspending_api, {"cells": cells}
+            )
+
+        section = cached_section(
+            self.department, "direct_charges", get_direct_charges, lambda: []
+        )
+        expected = [{"amount": 10, "label": "Salaries", "percentage": 10.0}]
+        self.assertEqual(expected, section())
+        self.assertEqual(expected, section())
+        self.assertEqual(1, self.mock_openspending_api.filter_dept.call_count)
+
 
 class BudgetedAndActualExpenditureProgrammeTestCase(TestCase):
     """tests of budgeted and actual expenditure summary for a department"""
@@ -186,6 +226,51 @@ class BudgetedAndActualExpenditureProgrammeTestCase(TestCase):
         result = self.department.get_expenditure_time_series_by_programme()
         self.assertEqual(result["notices"], [])
 
+    @mock.patch("budgetportal.department_page.cache", LocMemCache("sections", {}))
+    @mock.patch("budgetportal.models.government.get_expenditure_time_series_dataset")
+    @mock.patch(
+        "budgetportal.models.government.get_cpi", return_value=mock_data.CPI_2019_20
+    )
+    def test_section_can_be_cached(self, mock_get_cpi, mock_get_dataset):
+        self.mock_dataset.get_url_path = Mock(return_value="/datasets/time-series")
+        mock_get_dataset.return_value = self.mock_dataset
+        section = cached_section(
+            self.department,
+            "budget_actual_programmes",
+            self.department.get_expenditure_time_series_by_programme,
+            lambda: [],
+        )
+
+        result = section()
+        self.assertEqual(result, section())
+        self.assertEqual(1, self.mock_openspending_api.filter_dept.call_count)
+        self.assertTrue(result["programmes"])
+
+    @mock.patch("budgetportal.models.government.get_expenditure_time_series_dataset")
+    @mock.patch(
+        "budgetportal.models.government.get_cpi", return_value=mock_data.CPI_2019_20
+    )
+    def test_page_data_can_be_built(self, mock_get_cpi, mock_get_dataset):
+        self.mock_dataset.get_url_path = Mock(return_value="/datasets/time-series")
+        mock_get_dataset.return_value = self.mock_dataset
+        other_sections = mock.patch.multiple(
+            self.department,
+            get_expenditure_over_time=Mock(return_value=None),
+            get_expenditure_time_series_summary=Mock(return_value=None),
+            get_adjusted_budget_summary=Mock(return_value=None),
+            get_contributed_datasets=Mock(return_value=[]),
+            get_dataset=Mock(return_value=None),
+        )
+        with other_sections:
+            data = json.loads(build_department_page_data(self.department, []))
+
+        programmes = data["budget_actual_programmes"]["programmes"]
+        self.assertEqual(
+            self.department.get_expenditure_time_series_by_programme()["programmes"],
+            programmes,
+        )
+        self.assertEqual({}, data["budgeted_and_actual_comparison"])
+
     @mock.patch("budgetportal.models.government.get_expenditure_time_series_dataset")
     @mock.patch(
         "budgetportal.models.government.get_cpi", return_value=mock_data.CPI_2019_20
@@ -377,6 +462,39 @@ class DepartmentWebsiteUrlTestCase(TestCase):
         self.assertEqual(self.department.get_latest_website_url(), new_url)
 
 
+class ClosestMatchPathsTestCase(TestCase):
+    def setUp(self):
+        self.years = [
+            FinancialYear.objects.create(slug=slug)
+            for slug in ["2017-18", "2018-19", "2019-20"]
+        ]
+        for year in self.years[1:]:
+            sphere = Sphere.objects.create(financial_year=year, name="Provincial")
+            government = Government.objects.create(sphere=sphere, name="Gauteng")
+            if year.slug == "2019-20":
+                Department.objects.create(
+                    government=government,
+                    name="Health",
+                    vote_number=1,
+                    is_vote_primary=True,
+                    intro="",
+                )
+
+    def test_closest_match_of_each_year_in_one_query(self):
+        with self.assertNumQueries(1):
+            matches = FinancialYear.get_closest_match_paths(
+                self.years, "provincial", "gauteng", "health"
+            )
+        self.assertEqual(
+            {
+                "2017-18": ("/2017-18", False),
+                "2018-19": ("/2018-19/provincial/gauteng", False),
+                "2019-20": ("/2019-20/provincial/gauteng/departments/health", True),
+            },
+            matches,
+        )
+
+
 class NationalTreemapExpenditureByDepartmentTestCase(TestCase):
     """Unit tests for the treemap expenditure by department function."""
 
@@ -468,3 +586,79 @@ class NationalTreemapExpenditureByDepartmentTestCase(TestCase):
         self.assertIn("percentage_of_total", expenditure_keys)
         self.assertIn("url", expenditure_keys)
         self.assertIn("province", expenditure_keys)
+
+
+class CPITestCase(TestCase):
+    def setUp(self):
+        records = [
+            {"Year": "2016/17", "CPI": "0.05"},
+            {"Year": "2017/18", "CPI": "0.04"},
+            {"Year": "2018/19", "CPI": "0.1"},
+        ]
+        datastore_patch = patch(
+            "budgetportal.models.government.datastore_search_sql",
+            side_effect=lambda sql: [dict(record) for record in records],
+        )
+        self.mock_datastore_search_sql = datastore_patch.start()
+        self.addCleanup(datastore_patch.stop)
+        cpi_resource_patch = patch(
+            "budgetportal.datasets.Dataset.get_latest_cpi_resource",
+            return_value=("2018-19", "cpi-resource"),
+        )
+        self.mock_get_latest_cpi_resource = cpi_resource_patch.start()
+        self.addCleanup(cpi_resource_patch.stop)
+        index_patch = patch("budgetportal.models.government._cpi_index", None)
+        index_patch.start()
+        self.addCleanup(index_patch.stop)
+
+    def test_index_is_computed_once_per_resource(self):
+        cpi = models.government.get_cpi()
+        self.assertIs(cpi, models.government.get_cpi())
+        self.assertEqual(1, self.mock_datastore_search_sql.call_count)
+        self.assertEqual("2017-18", cpi.base_financial_year)
+
+        self.mock_get_latest_cpi_resource.return_value = ("2018-19", "new-resource")
+        self.assertEqual("new-resource", models.government.get_cpi().resource_id)
+        self.assertEqual(2, self.mock_datastore_search_sql.call_count)
+
+    def test_deflate(self):
+        cpi = models.government.get_cpi()
+        self.assertAlmostEqual(100 / 1.04, float(cpi["2016"]["index"]))
+        self.assertEqual(
+            [100, 200, 250], cpi.deflate([100, 220, 250], ["2017", "2018", "2017"])
+        )
+
+
+class BudgetVirementsTestCase(TestCase):
+    def setUp(self):
+        ckan_patch = patch("budgetportal.models.government.ckan")
+        self.mock_ckan = ckan_patch.start()
+        self.addCleanup(ckan_patch.stop)
+        self.mock_ckan.action.datastore_search.return_value = {
+            "records": [
+                {"department_name": "Health", "Value of Virements": "250"},
+                {"department_name": "Education", "Value of Virements": "100"},
+            ]
+        }
+        self.department = Mock(spec=Department)
+        self.department.name = "Education"
+
+    def get_budget_virements(self):
+        return Department._get_budget_virements(
+            self.department, None, {"id": "virements-resource"}, None, 1000
+        )
+
+    def test_virements_from_resource(self):
+        virements = self.get_budget_virements()
+        self.assertEqual(100, virements["amount"])
+        self.assertEqual(10, virements["percentage"])
+        self.mock_ckan.action.datastore_search.assert_called_once_with(
+            resource_id="virements-resource",
+            fields=["department_name", "Value of Virements"],
+            limit=models.government.DATASTORE_PAGE_SIZE,
+            offset=0,
+        )
+
+    def test_department_missing_from_resource(self):
+        self.department.name = "Tourism"
+        self.assertEqual(None, self.get_budget_virements())
@@ -9,13 +9,11 @@ from budgetportal.models import (
     ProcurementResourceLink,
     Sphere,
 )
-from django.test import Client, TestCase
+from django.test import Client, TestCase, TransactionTestCase, override_settings
 from mock import MagicMock, patch
 
 
-class DepartmentPageTestCase(TestCase):
-    dataset_year_note = "Budget (Main appropriation) 2018-19"
-
+class DepartmentPageFixtures:
     def setUp(self):
         self.mock_openspending_api = MagicMock()
         self.mock_openspending_api.get_adjustment_kind_ref.return_value = (
@@ -68,6 +66,13 @@ class DepartmentPageTestCase(TestCase):
         dataset_patch.start()
         self.addCleanup(dataset_patch.stop)
 
+
+# Page sections would otherwise use database connections that can't see the
+# test's uncommitted data
+@override_settings(PAGE_SECTION_CONCURRENCY=1)
+class DepartmentPageTestCase(DepartmentPageFixtures, TestCase):
+    dataset_year_note = "Budget (Main appropriation) 2018-19"
+
     def test_no_resource_links(self):
         """Test that the page loads with no resource links existing"""
         ProcurementResourceLink.objects.all().delete()
@@ -163,3 +168,19 @@ class DepartmentPageTestCase(TestCase):
         self.assertContains(
             response, "/2018-19/national/departments/the-presidency/viz/subprog-treemap"
         )
+
+
+# Page sections run on their own threads and database connections, which
+# only see committed data
+@override_settings(PAGE_SECTION_CONCURRENCY=4)
+class DepartmentPageConcurrentSectionsTestCase(
+    DepartmentPageFixtures, TransactionTestCase
+):
+    def test_page_with_concurrent_sections(self):
+        c = Client()
+        response = c.get("/2018-19/national/departments/the-presidency/")
+
+        self.assertContains(
+            response, "The Presidency budget data for the 2018-19 financial year"
+        )
+        self.assertContains(response, "Data not available")
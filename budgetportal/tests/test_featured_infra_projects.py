@@ -118,14 +118,14 @@ class ProvinceTestCase(TestCase):
         self.test_coordinates_one = {"longitude": 25.312526, "latitude": -27.515232}
         self.test_coordinates_two = {"longitude": 24.312526, "latitude": -26.515232}
 
-    @mock.patch("requests.get", side_effect=mocked_requests_get)
+    @mock.patch("budgetportal.models.http_session.get", side_effect=mocked_requests_get)
     def test_success_one_result(self, mock_get):
         province = InfrastructureProjectPart._get_province_from_coord(
             self.test_coordinates_one
         )
         self.assertEqual(province, "Fake Province 1")
 
-    @mock.patch("requests.get", side_effect=mocked_requests_get)
+    @mock.patch("budgetportal.models.http_session.get", side_effect=mocked_requests_get)
     def test_success_no_results(self, mock_get):
         province = InfrastructureProjectPart._get_province_from_coord(
             self.test_coordinates_two
@@ -150,7 +150,9 @@ class OverviewIntegrationTest(WagtailHackLiveServerTestCase):
             project_name="Standard fake project"
         ).first()
 
-    @mock.patch("requests.get", return_value=empty_ckan_response)
+    @mock.patch(
+        "budgetportal.models.http_session.get", return_value=empty_ckan_response
+    )
     def test_success_empty_projects(self, mock_get):
         """Test that it exists and that the correct years are linked."""
         InfrastructureProjectPart.objects.all().delete()
@@ -168,7 +170,7 @@ class OverviewIntegrationTest(WagtailHackLiveServerTestCase):
         self.assertEqual(content["slug"], "infrastructure-projects")
         self.assertEqual(content["title"], "Infrastructure Projects - vulekamali")
 
-    @mock.patch("requests.get", side_effect=mocked_requests_get)
+    @mock.patch("budgetportal.models.http_session.get", side_effect=mocked_requests_get)
     def test_success_with_projects(self, mock_get):
         """Test that it exists and that the correct years are linked."""
         c = Client()
@@ -240,7 +242,7 @@ class DetailIntegrationTest(WagtailHackLiveServerTestCase):
     def setUp(self):
         self.project = InfrastructureProjectPart.objects.all().first()
 
-    @mock.patch("requests.get", side_effect=mocked_requests_get)
+    @mock.patch("budgetportal.models.http_session.get", side_effect=mocked_requests_get)
     def test_success_with_projects(self, mock_get):
         """Test that it exists and that the correct years are linked."""
         c = Client()
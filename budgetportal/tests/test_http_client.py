@@ -0,0 +1,56 @@
+"""
+Tests of budgetportal.http_client
+"""
+import time
+from http.client import HTTPMessage
+
+from budgetportal import http_client
+from budgetportal.http_client import RETRY_STATUSES, PooledSession
+from django.test import SimpleTestCase
+from mock import Mock, patch
+from requests import Request
+from requests.cookies import extract_cookies_to_jar
+from urllib3.exceptions import MaxRetryError
+
+
+class PooledSessionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.session = PooledSession(
+            timeout=(1, 2), retries=3, pool_maxsize=5, retry_budget=10
+        )
+
+    @patch("requests.Session.request")
+    def test_default_timeout(self, mock_request):
+        self.session.get("https://openspending.org/api/3/cubes")
+        self.assertEqual((1, 2), mock_request.call_args[1]["timeout"])
+
+        self.session.get("https://openspending.org/api/3/cubes", timeout=10)
+        self.assertEqual(10, mock_request.call_args[1]["timeout"])
+
+    def test_pooled_adapter(self):
+        adapter = self.session.get_adapter("https://data.vulekamali.gov.za/")
+        self.assertEqual(5, adapter._pool_maxsize)
+        self.assertTrue(adapter._pool_block)
+        self.assertEqual(3, adapter.max_retries.total)
+        self.assertEqual(set(RETRY_STATUSES), set(adapter.max_retries.status_forcelist))
+        self.assertFalse(adapter.max_retries.is_retry("POST", 503))
+        self.assertTrue(adapter.max_retries.is_retry("GET", 503))
+
+    def test_cookies_are_not_kept(self):
+        headers = HTTPMessage()
+        headers["Set-Cookie"] = "session=abc; Path=/"
+        response = Mock()
+        response._original_response.msg = headers
+        request = Request("GET", "https://data.vulekamali.gov.za/").prepare()
+        extract_cookies_to_jar(self.session.cookies, request, response)
+        self.assertEqual(0, len(self.session.cookies))
+
+    def test_no_retries_after_the_budget(self):
+        retry = self.session.get_adapter("https://data.vulekamali.gov.za/").max_retries
+        token = http_client._retry_deadline.set(time.monotonic() + 10)
+        self.addCleanup(http_client._retry_deadline.reset, token)
+        self.assertFalse(retry.is_exhausted())
+        http_client._retry_deadline.set(time.monotonic())
+        self.assertTrue(retry.is_exhausted())
+        with self.assertRaises(MaxRetryError):
+            retry.increment("GET", "/")
@@ -0,0 +1,85 @@
+"""
+Tests of budgetportal.instrumentation
+"""
+from budgetportal import instrumentation
+from budgetportal.concurrency import get_executor
+from budgetportal.middleware import UpstreamTimingMiddleware
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+from mock import Mock
+
+
+class InstrumentationTestCase(SimpleTestCase):
+    def setUp(self):
+        instrumentation.latency_windows.clear()
+
+    def test_calls_are_collected_per_request(self):
+        instrumentation.record("ckan", "package_show", 5)
+        token = instrumentation.start_request()
+        instrumentation.record("ckan", "package_show", 10)
+        with instrumentation.timed("openspending", "aggregate", "miss") as outcome:
+            outcome["cache"] = "hit"
+        calls = instrumentation.end_request(token)
+
+        self.assertEqual(["ckan", "openspending"], [call.service for call in calls])
+        self.assertEqual("hit", calls[1].cache)
+        summary = instrumentation.latency_windows.summary()
+        self.assertEqual(2, summary["ckan"]["calls"])
+        self.assertEqual(1, summary["openspending"]["cached"])
+
+    def test_calls_in_executor_threads_are_collected(self):
+        token = instrumentation.start_request()
+        executor = get_executor("test-instrumentation", 2)
+        futures = [
+            executor.submit(instrumentation.record, "openspending", "aggregate", i)
+            for i in range(4)
+        ]
+        for future in futures:
+            future.result()
+        calls = instrumentation.end_request(token)
+
+        self.assertEqual(4, len(calls))
+
+    def test_percentiles(self):
+        for duration in range(1, 101):
+            instrumentation.record("mapit", "point", duration)
+        summary = instrumentation.latency_windows.summary()["mapit"]
+
+        self.assertEqual(50, summary["p50"])
+        self.assertEqual(95, summary["p95"])
+        self.assertEqual(99, summary["p99"])
+        self.assertEqual(100, summary["window"])
+
+    def test_server_timing(self):
+        calls = [
+            instrumentation.UpstreamCall("openspending", "aggregate", "hit", 1.5, None),
+            instrumentation.UpstreamCall(
+                "openspending", "aggregate", "miss", 200, None
+            ),
+            instrumentation.UpstreamCall("ckan", "package_show", None, 30.25, None),
+        ]
+        self.assertEqual(
+            'openspending;dur=201.5;desc="2 calls, 1 cached", '
+            'ckan;dur=30.2;desc="1 calls, 0 cached"',
+            instrumentation.server_timing(calls),
+        )
+
+
+class UpstreamTimingMiddlewareTestCase(SimpleTestCase):
+    def test_server_timing_header(self):
+        def view(request):
+            instrumentation.record("ckan", "group_show", 12)
+            return HttpResponse()
+
+        request = Mock()
+        response = UpstreamTimingMiddleware(view)(request)
+
+        self.assertEqual(
+            'ckan;dur=12.0;desc="1 calls, 0 cached"', response["Server-Timing"]
+        )
+        self.assertEqual(1, len(request.upstream_calls))
+
+    def test_no_header_without_upstream_calls(self):
+        response = UpstreamTimingMiddleware(lambda request: HttpResponse())(Mock())
+
+        self.assertFalse(response.has_header("Server-Timing"))
@@ -3,9 +3,18 @@ from tempfile import NamedTemporaryFile
 
 import yaml
 
-from budgetportal.models import Department, FinancialYear, Government, Programme, Sphere
+from budgetportal.models import (
+    Department,
+    DepartmentPageData,
+    FinancialYear,
+    Government,
+    Programme,
+    Sphere,
+)
+from budgetportal.department_page import get_materialized_sections
 from django.core.management import call_command
 from django.test import TestCase
+from mock import patch
 
 
 class BasicPagesTestCase(TestCase):
@@ -198,3 +207,69 @@ class ExportImportDepartmentsTestCase(TestCase):
                 )
                 self.assertEqual("Some Department 1", dept_1.name)
                 self.assertEqual("Some Department 2", dept_2.name)
+
+
+class MaterializeDepartmentPagesTestCase(TestCase):
+    def setUp(self):
+        year = FinancialYear.objects.create(slug="2030-31", published=True)
+        national = Sphere.objects.create(financial_year=year, name="National")
+        government = Government.objects.create(sphere=national, name="South Africa")
+        self.department = Department.objects.create(
+            government=government, name="The Presidency", vote_number=1, intro=""
+        )
+
+        source_version_patch = patch(
+            "budgetportal.department_page.department_page_source_version",
+            return_value="v1",
+        )
+        self.mock_source_version = source_version_patch.start()
+        self.addCleanup(source_version_patch.stop)
+        build_patch = patch(
+            "budgetportal.department_page.build_department_page_data",
+            return_value='{"contributed_datasets": null}',
+        )
+        self.mock_build = build_patch.start()
+        self.addCleanup(build_patch.stop)
+        async_task_patch = patch("budgetportal.department_page.async_task")
+        self.mock_async_task = async_task_patch.start()
+        self.addCleanup(async_task_patch.stop)
+
+    def test_departments_are_rebuilt_when_sources_change(self):
+        out = StringIO()
+        call_command("materialize_department_pages", "2030-31", stdout=out)
+        self.assertIn("Built: 1", out.getvalue())
+        page_data = DepartmentPageData.objects.get(department=self.department)
+        self.assertEqual("v1", page_data.source_version)
+
+        out = StringIO()
+        call_command("materialize_department_pages", stdout=out)
+        self.assertIn("Current: 1", out.getvalue())
+        self.assertEqual(1, self.mock_build.call_count)
+
+        self.mock_source_version.return_value = "v2"
+        out = StringIO()
+        call_command("materialize_department_pages", stdout=out)
+        self.assertIn("Built: 1", out.getvalue())
+        self.assertEqual(2, self.mock_build.call_count)
+
+    def test_stored_sections_are_served_and_revalidated_in_background(self):
+        call_command("materialize_department_pages", "2030-31", stdout=StringIO())
+        self.mock_source_version.reset_mock()
+
+        self.assertEqual(
+            {"contributed_datasets": None},
+            get_materialized_sections(self.department),
+        )
+        self.mock_source_version.assert_not_called()
+        self.mock_async_task.assert_called_once_with(
+            "budgetportal.tasks.materialize_department_page",
+            department_id=self.department.pk,
+            task_name="Materialize %s" % self.department.get_url_path(),
+        )
+
+    def test_sections_in_an_old_format_are_not_served(self):
+        call_command("materialize_department_pages", "2030-31", stdout=StringIO())
+        DepartmentPageData.objects.update(
+            format_version=DepartmentPageData.FORMAT_VERSION - 1
+        )
+        self.assertEqual(None, get_materialized_sections(self.department))
@@ -0,0 +1,501 @@
+"""
+Tests of budgetportal.openspending
+"""
+import threading
+import time
+from datetime import timedelta
+from unittest import skipIf
+from urllib.parse import parse_qs, urlsplit
+
+from budgetportal import olap, openspending
+from budgetportal.openspending import (
+    BabbageFiscalDataset,
+    CachedQueryIndex,
+    ModelRegistry,
+    aggregate_by_refs_numpy,
+    aggregate_many,
+    all_pages_url,
+    iter_aggregate_cells,
+)
+from budgetportal.upstreams import UpstreamUnavailable
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from mock import Mock, patch
+
+AGGREGATE_URL = "https://openspending.org/api/3/cubes/abc/aggregate/?pagesize=10"
+
+
+def mock_paged_session(total_cell_count, page_size):
+    def get(url):
+        query = parse_qs(urlsplit(url).query)
+        page = int(query.get("page", ["1"])[0])
+        start = (page - 1) * page_size
+        end = min(page * page_size, total_cell_count)
+        response = Mock()
+        response.url = url
+        response.elapsed = timedelta(milliseconds=5)
+        response.json.return_value = {
+            "total_cell_count": total_cell_count,
+            "page": page,
+            "page_size": page_size,
+            "cells": [{"value.sum": i, "_count": 1} for i in range(start, end)],
+        }
+        return response
+
+    session = Mock()
+    session.get = Mock(side_effect=get)
+    return session
+
+
+class AggregatePagingTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_single_page(self):
+        session = mock_paged_session(total_cell_count=7, page_size=10)
+        cells = list(iter_aggregate_cells(AGGREGATE_URL, session=session))
+        self.assertEqual([c["value.sum"] for c in cells], list(range(7)))
+        session.get.assert_called_once_with(AGGREGATE_URL)
+
+    def test_walks_all_pages_in_order(self):
+        session = mock_paged_session(total_cell_count=25, page_size=10)
+        cells = list(iter_aggregate_cells(AGGREGATE_URL, session=session))
+        self.assertEqual([c["value.sum"] for c in cells], list(range(25)))
+        self.assertEqual(session.get.call_count, 3)
+
+    def test_pages_can_bypass_the_cache(self):
+        session = mock_paged_session(total_cell_count=25, page_size=10)
+        for _ in range(2):
+            cells = list(
+                iter_aggregate_cells(AGGREGATE_URL, session=session, use_cache=False)
+            )
+            self.assertEqual([c["value.sum"] for c in cells], list(range(25)))
+        self.assertEqual(session.get.call_count, 6)
+        self.assertIsNone(cache.get(openspending.cache_key(AGGREGATE_URL)))
+
+    def test_all_pages_url_starts_from_the_first_page(self):
+        url = AGGREGATE_URL.replace("pagesize=10", "page=3&pagesize=5")
+        self.assertEqual(
+            "https://openspending.org/api/3/cubes/abc/aggregate/?pagesize=10000",
+            all_pages_url(url),
+        )
+
+    @patch("budgetportal.openspending.FETCH_LOCK_POLL_INTERVAL", 0)
+    @patch("budgetportal.openspending.cache")
+    def test_waits_for_another_worker_fetching_the_same_url(self, cache):
+        cached_page = {"cells": [], "total_cell_count": 0}
+        cache.add.return_value = False
+        cache.get.side_effect = [
+            None,
+            True,
+            {"fetched_at": time.time(), "result": cached_page},
+        ]
+        session = mock_paged_session(total_cell_count=7, page_size=10)
+        result = openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+        self.assertIs(result, cached_page)
+        session.get.assert_not_called()
+        cache.delete.assert_not_called()
+
+    @patch("budgetportal.openspending.async_task")
+    @patch("budgetportal.openspending.cache")
+    def test_stale_result_is_served_and_refreshed(self, cache, async_task):
+        cached_page = {"cells": [], "total_cell_count": 0}
+        fetched_at = time.time() - settings.OPENSPENDING_CACHE_SOFT_TTL - 60
+        cache.get.return_value = {"fetched_at": fetched_at, "result": cached_page}
+        cache.add.return_value = True
+        session = mock_paged_session(total_cell_count=7, page_size=10)
+        result = openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+        self.assertIs(result, cached_page)
+        session.get.assert_not_called()
+        async_task.assert_called_once()
+        self.assertEqual(async_task.call_args[0][1], AGGREGATE_URL)
+
+        async_task.reset_mock()
+        cache.get.return_value = {"fetched_at": time.time(), "result": cached_page}
+        openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+        async_task.assert_not_called()
+
+    @patch("budgetportal.openspending.async_task", side_effect=Exception)
+    @patch("budgetportal.openspending.cache")
+    def test_stale_result_is_served_when_refresh_cannot_be_queued(
+        self, cache, async_task
+    ):
+        cached_page = {"cells": [], "total_cell_count": 0}
+        fetched_at = time.time() - settings.OPENSPENDING_CACHE_SOFT_TTL - 60
+        cache.get.return_value = {"fetched_at": fetched_at, "result": cached_page}
+        cache.add.return_value = True
+        session = mock_paged_session(total_cell_count=7, page_size=10)
+        result = openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+        self.assertIs(result, cached_page)
+        async_task.assert_called_once()
+        cache.delete.assert_called_once()
+
+    @patch("budgetportal.openspending.get_upstream")
+    @patch("budgetportal.openspending.cache")
+    def test_expired_result_is_served_when_openspending_is_unavailable(
+        self, cache, get_upstream
+    ):
+        cached_page = {"cells": [], "total_cell_count": 0}
+        fetched_at = time.time() - settings.OPENSPENDING_CACHE_HARD_TTL - 60
+        cache.get.return_value = {"fetched_at": fetched_at, "result": cached_page}
+        cache.add.return_value = True
+        get_upstream.return_value.guard.side_effect = UpstreamUnavailable
+        session = mock_paged_session(total_cell_count=7, page_size=10)
+        result = openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+        self.assertIs(result, cached_page)
+        session.get.assert_not_called()
+
+        cache.get.return_value = None
+        with self.assertRaises(UpstreamUnavailable):
+            openspending.get_aggregate_page(AGGREGATE_URL, session=session)
+
+    def test_aggregate_concatenates_pages(self):
+        dataset = BabbageFiscalDataset.__new__(BabbageFiscalDataset)
+        dataset.session = mock_paged_session(total_cell_count=25, page_size=10)
+        dataset.cube_url = "https://openspending.org/api/3/cubes/abc/"
+        dataset.local_cube = False
+        result = dataset.aggregate(cuts=["a.a:1"], drilldowns=["b.b"])
+        self.assertEqual(len(result["cells"]), 25)
+
+
+class AggregateManyTestCase(SimpleTestCase):
+    def test_results_in_query_order(self):
+        cached_api = Mock()
+        cached_api.cached_aggregate = Mock(return_value={"cells": ["cached"]})
+        remote_api = Mock()
+        remote_api.cached_aggregate = Mock(return_value=None)
+        remote_api.aggregate = Mock(side_effect=lambda cuts: {"cells": cuts})
+
+        results = aggregate_many(
+            [
+                (remote_api, {"cuts": ["a"]}),
+                (cached_api, {"cuts": ["b"]}),
+                (remote_api, {"cuts": ["c"]}),
+            ]
+        )
+        self.assertEqual([r["cells"] for r in results], [["a"], ["cached"], ["c"]])
+        self.assertEqual(remote_api.aggregate.call_count, 2)
+        cached_api.aggregate.assert_not_called()
+
+    @override_settings(OPENSPENDING_QUERY_CONCURRENCY=1)
+    def test_calls_dont_wait_for_each_others_queries(self):
+        release = threading.Event()
+        slow_api = Mock()
+        slow_api.cached_aggregate = Mock(return_value=None)
+        slow_api.aggregate = Mock(side_effect=lambda: release.wait(5))
+        fast_api = Mock()
+        fast_api.cached_aggregate = Mock(return_value=None)
+        fast_api.aggregate = Mock(return_value={"cells": []})
+
+        slow_call = threading.Thread(target=aggregate_many, args=[[(slow_api, {})]])
+        slow_call.start()
+        try:
+            start = time.monotonic()
+            results = aggregate_many([(fast_api, {})])
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual([{"cells": []}], results)
+        finally:
+            release.set()
+            slow_call.join()
+
+
+AGGREGATE_BY_REFS_CELLS = [
+    {"dept": "A", "phase": "Main", "prog": "1", "value.sum": 10, "_count": 1},
+    {"dept": "B", "phase": "Main", "prog": "1", "value.sum": 5, "_count": 2},
+    {"dept": "A", "phase": "Main", "prog": "2", "value.sum": 7, "_count": 1},
+    {"dept": "A", "phase": "Adjusted", "prog": "1", "value.sum": 3, "_count": 1},
+    {"dept": "B", "phase": "Main", "prog": "2", "value.sum": -1, "_count": 1},
+]
+
+AGGREGATE_BY_REFS_EXPECTED = [
+    {"dept": "A", "phase": "Main", "value.sum": 17, "_count": 2},
+    {"dept": "B", "phase": "Main", "value.sum": 4, "_count": 3},
+    {"dept": "A", "phase": "Adjusted", "value.sum": 3, "_count": 1},
+]
+
+
+class AggregateByRefsTestCase(SimpleTestCase):
+    def test_groups_in_order_of_first_appearance(self):
+        result = BabbageFiscalDataset.aggregate_by_refs(
+            ["dept", "phase"], AGGREGATE_BY_REFS_CELLS
+        )
+        self.assertEqual(result, AGGREGATE_BY_REFS_EXPECTED)
+        self.assertEqual(
+            [list(c.keys()) for c in result],
+            [["dept", "phase", "value.sum", "_count"]] * 3,
+        )
+
+    def test_no_refs_totals_everything(self):
+        result = BabbageFiscalDataset.aggregate_by_refs([], AGGREGATE_BY_REFS_CELLS)
+        self.assertEqual(result, [{"value.sum": 24, "_count": 6}])
+
+    @skipIf(openspending.numpy is None, "NumPy is not installed")
+    def test_numpy_path_matches(self):
+        result = aggregate_by_refs_numpy(["dept", "phase"], AGGREGATE_BY_REFS_CELLS)
+        self.assertEqual(result, AGGREGATE_BY_REFS_EXPECTED)
+        self.assertEqual(type(result[0]["value.sum"]), int)
+
+    @skipIf(openspending.numpy is None, "NumPy is not installed")
+    def test_numpy_path_declines_mixed_types(self):
+        cells = [dict(c) for c in AGGREGATE_BY_REFS_CELLS]
+        cells[0]["value.sum"] = 10.5
+        self.assertIsNone(aggregate_by_refs_numpy(["dept"], cells))
+
+
+FACTS = [
+    {"dept.name": "A", "year.year": 2019, "phase.phase": "Main", "value": 10},
+    {"dept.name": "B", "year.year": 2019, "phase.phase": "Main", "value": 5},
+    {"dept.name": "A", "year.year": 2020, "phase.phase": "Main", "value": 7},
+    {"dept.name": "A", "year.year": 2019, "phase.phase": "Adjusted", "value": 3},
+    {"dept.name": "B", "year.year": 2020, "phase.phase": "Main", "value": -1},
+]
+
+FACTS_MODEL = {
+    "dimensions": {
+        "dept": {"attributes": {"name": {"ref": "dept.name"}}},
+        "year": {"attributes": {"year": {"ref": "year.year"}}},
+        "phase": {"attributes": {"phase": {"ref": "phase.phase"}}},
+    },
+    "measures": {"value": {"ref": "value"}},
+}
+
+
+def mock_facts_session(facts, page_size):
+    def get(url, params):
+        page = params["page"]
+        response = Mock()
+        response.json.return_value = {
+            "total_fact_count": len(facts),
+            "page": page,
+            "page_size": page_size,
+            "data": facts[(page - 1) * page_size : page * page_size],
+        }
+        return response
+
+    session = Mock()
+    session.get = Mock(side_effect=get)
+    return session
+
+
+class LocalCubeTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cube = olap.LocalCube(["dept.name", "phase.phase", "year.year"], ["value"])
+        self.cube.extend(FACTS)
+        self.cube.freeze()
+
+    def test_cuts_and_drilldowns(self):
+        result = self.cube.aggregate(
+            cuts=["year.year:2019", 'phase.phase:"Main"'], drilldowns=["dept.name"]
+        )
+        self.assertEqual(
+            result["cells"],
+            [
+                {"dept.name": "A", "value.sum": 10, "_count": 1},
+                {"dept.name": "B", "value.sum": 5, "_count": 1},
+            ],
+        )
+        self.assertEqual(result["total_cell_count"], 2)
+
+    def test_order_desc_and_value_sets(self):
+        result = self.cube.aggregate(
+            cuts=["dept.name:A;B"],
+            drilldowns=["year.year", "dept.name"],
+            order=["year.year:desc", "dept.name"],
+        )
+        self.assertEqual(
+            [(c["year.year"], c["dept.name"], c["value.sum"]) for c in result["cells"]],
+            [(2020, "A", 7), (2020, "B", -1), (2019, "A", 13), (2019, "B", 5)],
+        )
+
+    def test_total_without_drilldowns(self):
+        result = self.cube.aggregate(cuts=["dept.name:A"])
+        self.assertEqual(result["cells"], [{"value.sum": 20, "_count": 3}])
+        result = self.cube.aggregate(cuts=["dept.name:C"])
+        self.assertEqual(result["cells"], [{"value.sum": None, "_count": 0}])
+
+    def test_unknown_ref_is_unsupported(self):
+        with self.assertRaises(olap.UnsupportedQuery):
+            self.cube.aggregate(drilldowns=["programme.name"])
+
+    def test_unknown_order_ref_is_unsupported(self):
+        with self.assertRaises(olap.UnsupportedQuery):
+            self.cube.aggregate(drilldowns=["dept.name"], order=["programme.name"])
+
+    def test_null_measures_are_skipped(self):
+        cube = olap.LocalCube(["dept.name"], ["value"])
+        cube.extend(
+            [
+                {"dept.name": "A", "value": None},
+                {"dept.name": "A", "value": None},
+                {"dept.name": "B", "value": None},
+                {"dept.name": "B", "value": 4},
+            ]
+        )
+        cube.freeze()
+        result = cube.aggregate(drilldowns=["dept.name"])
+        self.assertEqual(
+            [(c["dept.name"], c["value.sum"]) for c in result["cells"]],
+            [("A", None), ("B", 4)],
+        )
+
+    def test_load_cube_pages_through_facts(self):
+        api = BabbageFiscalDataset.__new__(BabbageFiscalDataset)
+        api.cube_url = "https://openspending.org/api/3/cubes/abc/"
+        api.model = FACTS_MODEL
+        session = mock_facts_session(FACTS, page_size=2)
+        cube = olap.load_cube(api, session=session)
+        self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(cube.fact_count, 5)
+        self.assertEqual(
+            cube.aggregate(drilldowns=["phase.phase"])["cells"],
+            [
+                {"phase.phase": "Adjusted", "value.sum": 3, "_count": 1},
+                {"phase.phase": "Main", "value.sum": 21, "_count": 4},
+            ],
+        )
+
+
+MODEL_URL = "https://openspending.org/api/3/cubes/abc/model/"
+
+
+def mock_model_session(etag):
+    def get(url, headers):
+        response = Mock()
+        response.elapsed = timedelta(milliseconds=5)
+        if headers.get("If-None-Match", None) == etag:
+            response.status_code = 304
+        else:
+            response.status_code = 200
+            response.headers = {"ETag": etag}
+            response.json.return_value = {"model": {"etag": etag}}
+        return response
+
+    session = Mock()
+    session.get = Mock(side_effect=get)
+    return session
+
+
+class ModelRegistryTestCase(SimpleTestCase):
+    def test_model_is_fetched_once_within_ttl(self):
+        registry = ModelRegistry(ttl=60)
+        session = mock_model_session(etag='"1"')
+        registry.get(MODEL_URL, "2020-01-01", session=session)
+        model = registry.get(MODEL_URL, "2020-01-01", session=session)
+        self.assertEqual(model, {"etag": '"1"'})
+        self.assertEqual(session.get.call_count, 1)
+
+    def test_new_version_is_revalidated(self):
+        registry = ModelRegistry(ttl=60)
+        session = mock_model_session(etag='"1"')
+        model = registry.get(MODEL_URL, "2020-01-01", session=session)
+        self.assertIs(registry.get(MODEL_URL, "2020-02-01", session=session), model)
+        session.get.assert_called_with(MODEL_URL, headers={"If-None-Match": '"1"'})
+
+        changed_session = mock_model_session(etag='"2"')
+        model = registry.get(MODEL_URL, "2020-03-01", session=changed_session)
+        self.assertEqual(model, {"etag": '"2"'})
+
+    def test_expired_entry_is_revalidated(self):
+        registry = ModelRegistry(ttl=0)
+        session = mock_model_session(etag='"1"')
+        registry.get(MODEL_URL, session=session)
+        registry.get(MODEL_URL, session=session)
+        self.assertEqual(session.get.call_count, 2)
+
+
+BROAD_CELLS = [
+    {"dept.name": "A", "phase.phase": "Main", "value.sum": 10, "_count": 1},
+    {"dept.name": "B", "phase.phase": "Main", "value.sum": 5, "_count": 1},
+    {"dept.name": "A", "phase.phase": "Adjusted", "value.sum": 3, "_count": 2},
+]
+
+
+class QueryContainmentTestCase(SimpleTestCase):
+    def setUp(self):
+        cached = {}
+        cache_patcher = patch("budgetportal.openspending.cache")
+        self.cache = cache = cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        cache.get.side_effect = lambda key, default=None: cached.get(key, default)
+        cache.set.side_effect = lambda key, value, timeout: cached.update({key: value})
+        cache.add.return_value = True
+        index_patcher = patch(
+            "budgetportal.openspending.cached_queries", CachedQueryIndex()
+        )
+        index_patcher.start()
+        self.addCleanup(index_patcher.stop)
+
+        response = Mock()
+        response.elapsed = timedelta(milliseconds=5)
+        response.json.side_effect = lambda: {
+            "total_cell_count": len(BROAD_CELLS),
+            "page_size": 10,
+            "cells": [dict(c) for c in BROAD_CELLS],
+        }
+        self.dataset = BabbageFiscalDataset.__new__(BabbageFiscalDataset)
+        self.dataset.local_cube = False
+        self.dataset.cube_url = "https://openspending.org/api/3/cubes/abc/"
+        self.dataset.session = Mock()
+        self.dataset.session.get = Mock(return_value=response)
+        self.dataset.aggregate(
+            cuts=["year.year:2019"], drilldowns=["dept.name", "phase.phase"]
+        )
+
+    def test_narrower_query_is_derived(self):
+        result = self.dataset.aggregate(
+            cuts=['dept.name:"A"', "year.year:2019"],
+            drilldowns=["phase.phase"],
+            order=["value.sum"],
+        )
+        self.assertEqual(
+            result["cells"],
+            [
+                {"phase.phase": "Adjusted", "value.sum": 3, "_count": 2},
+                {"phase.phase": "Main", "value.sum": 10, "_count": 1},
+            ],
+        )
+        self.assertEqual(self.dataset.session.get.call_count, 1)
+
+    def test_query_ordered_by_text_is_fetched(self):
+        self.dataset.aggregate(
+            cuts=['dept.name:"A"', "year.year:2019"],
+            drilldowns=["phase.phase"],
+            order=["phase.phase"],
+        )
+        self.assertEqual(self.dataset.session.get.call_count, 2)
+
+    def test_derived_cells_are_in_drilldown_order(self):
+        result = self.dataset.aggregate(
+            cuts=["year.year:2019"], drilldowns=["phase.phase"]
+        )
+        self.assertEqual(
+            [c["phase.phase"] for c in result["cells"]], ["Adjusted", "Main"]
+        )
+
+    def test_cached_result_is_read_once(self):
+        self.cache.get.reset_mock()
+        self.dataset.aggregate(
+            cuts=["year.year:2019"], drilldowns=["dept.name", "phase.phase"]
+        )
+        self.assertEqual(self.cache.get.call_count, 1)
+        self.assertEqual(self.dataset.session.get.call_count, 1)
+
+    def test_cached_query_is_answered_from_one_read(self):
+        self.cache.get.reset_mock()
+        result = self.dataset.cached_aggregate(
+            cuts=["year.year:2019"], drilldowns=["dept.name", "phase.phase"]
+        )
+        self.assertEqual(len(result["cells"]), 3)
+        self.assertEqual(self.cache.get.call_count, 1)
+        self.assertIsNone(self.dataset.cached_aggregate(cuts=["year.year:2020"]))
+
+    def test_total_is_derived(self):
+        result = self.dataset.aggregate(cuts=["year.year:2019", "phase.phase:Main"])
+        self.assertEqual(result["cells"], [{"value.sum": 15, "_count": 2}])
+        self.assertEqual(self.dataset.session.get.call_count, 1)
+
+    def test_query_outside_cached_cuts_is_fetched(self):
+        self.dataset.aggregate(cuts=["year.year:2020"], drilldowns=["phase.phase"])
+        self.dataset.aggregate(cuts=["dept.name:A"], drilldowns=["phase.phase"])
+        self.assertEqual(self.dataset.session.get.call_count, 3)
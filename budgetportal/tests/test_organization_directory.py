@@ -0,0 +1,49 @@
+"""
+Tests of budgetportal.datasets.OrganizationDirectory
+"""
+from budgetportal.datasets import OrganizationDirectory
+from django.test import SimpleTestCase
+from mock import patch
+
+
+def organization(slug):
+    return {
+        "name": slug,
+        "title": slug.title(),
+        "image_display_url": "https://example.com/%s.png" % slug,
+        "extras": [{"key": "telephone", "value": "012 345 6789"}],
+    }
+
+
+class OrganizationDirectoryTestCase(SimpleTestCase):
+    def setUp(self):
+        ckan_patch = patch("budgetportal.datasets.ckan")
+        self.ckan = ckan_patch.start()
+        self.addCleanup(ckan_patch.stop)
+        page_size_patch = patch("budgetportal.datasets.ORGANIZATION_PAGE_SIZE", 2)
+        page_size_patch.start()
+        self.addCleanup(page_size_patch.stop)
+        organizations = [organization(slug) for slug in ["a", "b", "c"]]
+        self.ckan.action.organization_list.side_effect = (
+            lambda limit, offset, **kwargs: organizations[offset : offset + limit]
+        )
+        self.directory = OrganizationDirectory()
+
+    def test_organizations_are_listed_once(self):
+        for slug in ["a", "b", "c", "a"]:
+            self.assertEqual(slug, self.directory.get(slug)["slug"])
+        self.assertEqual(2, self.ckan.action.organization_list.call_count)
+        self.ckan.action.organization_show.assert_not_called()
+
+    def test_extras_are_included(self):
+        self.assertEqual("012 345 6789", self.directory.get("b")["telephone"])
+
+    def test_missing_organization_is_shown_once(self):
+        self.ckan.action.organization_show.return_value = {
+            "name": "d",
+            "title": "D",
+            "image_display_url": "https://example.com/d.png",
+        }
+        self.assertEqual("D", self.directory.get("d")["name"])
+        self.assertEqual("D", self.directory.get("d")["name"])
+        self.ckan.action.organization_show.assert_called_once_with(id="d")
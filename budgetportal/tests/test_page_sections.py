@@ -0,0 +1,179 @@
+"""
+Tests of budgetportal.views.get_sections and the department page sections
+"""
+import threading
+import time
+
+from budgetportal import views
+from budgetportal.department_page import (
+    Section,
+    cached_section,
+    department_page_source_version,
+)
+from budgetportal.views import get_sections
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+from mock import Mock, patch
+
+
+@override_settings(PAGE_SECTION_CONCURRENCY=4, PAGE_SECTION_TIMEOUT=1)
+class GetSectionsTestCase(SimpleTestCase):
+    def test_sections_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=1)
+
+        def section(value):
+            barrier.wait()
+            return value
+
+        sections = get_sections(a=lambda: section("a"), b=lambda: section("b"))
+        self.assertEqual({"a": "a", "b": "b"}, sections)
+
+    @patch("budgetportal.views.connections")
+    def test_section_threads_close_their_connections(self, connections):
+        section_threads = []
+        closing_threads = []
+        connections.close_all.side_effect = lambda: closing_threads.append(
+            threading.current_thread()
+        )
+
+        def section():
+            section_threads.append(threading.current_thread())
+
+        get_sections(a=section, b=section)
+        self.assertEqual(2, len(section_threads))
+        for thread in section_threads:
+            self.assertIn(thread, closing_threads)
+
+    def test_failed_section_is_left_out(self):
+        def failing_section():
+            raise ValueError()
+
+        sections = get_sections(a=lambda: "a", b=failing_section)
+        self.assertEqual({"a": "a", "b": None}, sections)
+
+    def test_slow_section_is_left_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        sections = get_sections(a=lambda: "a", b=lambda: release.wait(5))
+        self.assertEqual({"a": "a", "b": None}, sections)
+
+    @override_settings(PAGE_SECTION_CONCURRENCY=2)
+    def test_timeout_starts_when_a_section_starts(self):
+        def section(value):
+            time.sleep(0.6)
+            return value
+
+        sections = get_sections(
+            a=lambda: section("a"), b=lambda: section("b"), c=lambda: section("c")
+        )
+        self.assertEqual({"a": "a", "b": "b", "c": "c"}, sections)
+
+    @override_settings(PAGE_SECTION_CONCURRENCY=2)
+    def test_section_that_never_starts_is_left_out(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        c = Mock(return_value="c")
+        sections = get_sections(
+            a=lambda: release.wait(5), b=lambda: release.wait(5), c=c
+        )
+        self.assertEqual({"a": None, "b": None, "c": None}, sections)
+        release.set()
+        c.assert_not_called()
+
+    def test_slow_sections_of_one_call_dont_hold_up_another(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        slow_call = threading.Thread(
+            target=get_sections,
+            kwargs={name: lambda: release.wait(5) for name in "abcd"},
+        )
+        slow_call.start()
+        start = time.monotonic()
+        self.assertEqual({"e": "e"}, get_sections(e=lambda: "e"))
+        self.assertLess(time.monotonic() - start, 0.5)
+        release.set()
+        slow_call.join()
+
+    def test_left_out_sections_are_counted(self):
+        before = views.left_out_sections["b:failed"]
+
+        def failing_section():
+            raise ValueError()
+
+        get_sections(a=lambda: "a", b=failing_section)
+        self.assertEqual(before + 1, views.left_out_sections["b:failed"])
+
+
+class CachedSectionTestCase(SimpleTestCase):
+    def setUp(self):
+        cache_patch = patch(
+            "budgetportal.department_page.cache", LocMemCache("sections", {})
+        )
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.department = Mock(pk=1)
+        self.department.name = "The Presidency"
+        self.department.get_financial_year.return_value.slug = "2019-20"
+        self.get_section = Mock(return_value=None)
+        self.sources = ["source 1"]
+
+    def get_cached_section(self, name="section"):
+        return cached_section(
+            self.department, name, self.get_section, lambda: self.sources
+        )()
+
+    def test_section_is_cached_until_its_sources_change(self):
+        self.get_cached_section()
+        self.get_cached_section()
+        self.assertEqual(1, self.get_section.call_count)
+
+        self.sources = ["source 2"]
+        self.get_cached_section()
+        self.assertEqual(2, self.get_section.call_count)
+
+    def test_sections_are_cached_separately(self):
+        self.get_cached_section("section 1")
+        self.get_cached_section("section 2")
+        self.assertEqual(2, self.get_section.call_count)
+
+
+class DepartmentPageSourceVersionTestCase(SimpleTestCase):
+    def setUp(self):
+        self.sources = {}
+        sections_patch = patch(
+            "budgetportal.department_page.department_page_sections",
+            side_effect=lambda department, financial_years: {
+                "section": Section(None, lambda: self.sources[department.name])
+            },
+        )
+        sections_patch.start()
+        self.addCleanup(sections_patch.stop)
+        config_patch = patch("budgetportal.department_page.config")
+        self.config = config_patch.start()
+        self.addCleanup(config_patch.stop)
+        self.config.IN_YEAR_SPENDING_ENABLED = False
+        self.departments = []
+        for name in ["The Presidency", "Health"]:
+            department = Mock()
+            department.name = name
+            self.departments.append(department)
+            self.sources[name] = ["%s source 1" % name]
+
+    def versions(self):
+        return [
+            department_page_source_version(department, [{"id": "2019-20"}])
+            for department in self.departments
+        ]
+
+    def test_version_changes_with_the_department_sources(self):
+        presidency, health = self.versions()
+        self.sources["Health"] = ["Health source 2"]
+        self.assertEqual([presidency], self.versions()[:1])
+        self.assertNotEqual(health, self.versions()[1])
+
+    def test_version_changes_with_in_year_spending_enabled(self):
+        before = self.versions()
+        self.config.IN_YEAR_SPENDING_ENABLED = True
+        after = self.versions()
+        self.assertNotEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
@@ -6,10 +6,14 @@ from budgetportal.models import (
     Notice,
     Sphere,
 )
-from django.test import Client, TestCase
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
 from mock import MagicMock, patch
 
 
+# Page sections would otherwise use database connections that can't see the
+# test's uncommitted data
+@override_settings(PAGE_SECTION_CONCURRENCY=1)
 class BasicPagesTestCase(TestCase):
     fixtures = ["video-language", "faq", "homepage", "menu", "test-guides-pages"]
 
@@ -300,3 +304,21 @@ class BasicPagesTestCase(TestCase):
             response,
             '<div data-webapp="infrastructure-pages" class="infrastructure-projects"></div>',
         )
+
+
+class UpstreamMetricsTestCase(TestCase):
+    path = "/json/metrics/upstreams.json"
+
+    def test_anonymous_users_are_sent_to_log_in(self):
+        response = Client().get(self.path)
+        self.assertEqual(302, response.status_code)
+
+    def test_staff_can_see_metrics(self):
+        user = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        client = Client()
+        client.force_login(user)
+        response = client.get(self.path)
+        self.assertEqual(200, response.status_code)
+        self.assertIn("upstreams", response.json())
@@ -134,26 +134,26 @@ class FocusAreaPagesTestCase(TestCase):
         self.mock_openspending_api.get_subprogramme_name_ref = Mock(
             return_value="subprogramme.subprogramme"
         )
+        self.mock_openspending_api.get_phase_ref = Mock(
+            return_value="budget_phase.budget_phase"
+        )
         self.mock_dataset.get_openspending_api = Mock(
             return_value=self.mock_openspending_api
         )
 
-        def mock_get_focus_area_data(__, sphere):
-            if sphere == "provincial":
-                cells = FOCUS_AREA_PROVINCIAL_MOCK_DATA
-            elif sphere == "national":
-                cells = FOCUS_AREA_NATIONAL_MOCK_DATA
-            return cells, self.mock_openspending_api
-
-        self.mock_get_focus_area_data = mock_get_focus_area_data
-
-    @patch("budgetportal.summaries.get_prov_eq_share")
-    @patch("budgetportal.summaries.get_focus_area_data")
-    def test_get_focus_area_preview(
-        self, mock_get_focus_area_data, mock_get_prov_eq_share
-    ):
-        mock_get_focus_area_data.side_effect = self.mock_get_focus_area_data
-        mock_get_prov_eq_share.return_value = ("untested", 123)
+    @patch("budgetportal.summaries.aggregate_many")
+    @patch("budgetportal.summaries.get_expenditure_time_series_dataset")
+    def test_get_focus_area_preview(self, mock_get_dataset, mock_aggregate_many):
+        mock_get_dataset.return_value = self.mock_dataset
+        mock_aggregate_many.return_value = [
+            {"cells": FOCUS_AREA_NATIONAL_MOCK_DATA},
+            {"cells": FOCUS_AREA_PROVINCIAL_MOCK_DATA},
+            {
+                "cells": [
+                    {"function_group.function_group": "untested", "value.sum": 123}
+                ]
+            },
+        ]
 
         result = get_focus_area_preview(self.year)
         focus_areas = result["data"]["items"]
@@ -0,0 +1,121 @@
+"""
+Tests of budgetportal.upstreams
+"""
+import threading
+
+import requests
+from budgetportal.upstreams import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    Upstream,
+    UpstreamUnavailable,
+)
+from django.test import SimpleTestCase
+from mock import Mock
+
+
+def server_error():
+    return requests.HTTPError(response=Mock(status_code=502))
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(CLOSED, breaker.state)
+        breaker.record_failure()
+        self.assertEqual(OPEN, breaker.state)
+        self.assertFalse(breaker.allow_request())
+
+    def test_one_trial_call_after_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(HALF_OPEN, breaker.state)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(CLOSED, breaker.state)
+        self.assertTrue(breaker.allow_request())
+
+
+class UpstreamTestCase(SimpleTestCase):
+    def upstream(self, **kwargs):
+        options = dict(
+            max_concurrency=1, queue_timeout=0, failure_threshold=1, reset_timeout=60
+        )
+        options.update(kwargs)
+        return Upstream("test", **options)
+
+    def test_server_errors_open_the_circuit(self):
+        upstream = self.upstream()
+        with self.assertRaises(requests.HTTPError):
+            with upstream.guard():
+                raise server_error()
+        with self.assertRaises(UpstreamUnavailable):
+            with upstream.guard():
+                self.fail("Called an upstream with an open circuit")
+
+    def test_client_errors_dont_open_the_circuit(self):
+        upstream = self.upstream()
+        with self.assertRaises(requests.HTTPError):
+            with upstream.guard():
+                raise requests.HTTPError(response=Mock(status_code=404))
+        self.assertEqual(CLOSED, upstream.breaker.state)
+
+    def test_calls_beyond_max_concurrency_are_rejected(self):
+        upstream = self.upstream()
+        entered = threading.Event()
+        release = threading.Event()
+
+        def call():
+            with upstream.guard():
+                entered.set()
+                release.wait()
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        entered.wait()
+        try:
+            with self.assertRaises(UpstreamUnavailable):
+                with upstream.guard():
+                    pass
+        finally:
+            release.set()
+            thread.join()
+        with upstream.guard():
+            pass
+
+    def test_call_without_a_slot_doesnt_free_another_calls_trial(self):
+        upstream = self.upstream(queue_timeout=0.5, reset_timeout=0)
+        entered = threading.Event()
+        release = threading.Event()
+
+        def call():
+            with upstream.guard():
+                entered.set()
+                release.wait()
+
+        def start_trial():
+            upstream.breaker.record_failure()
+            self.assertTrue(upstream.breaker.allow_request())
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        entered.wait()
+        # The circuit opens and another call starts a trial while this call
+        # waits for the only slot
+        timer = threading.Timer(0.1, start_trial)
+        timer.start()
+        try:
+            with self.assertRaises(UpstreamUnavailable):
+                with upstream.guard():
+                    pass
+            self.assertTrue(upstream.breaker.trial_in_flight)
+        finally:
+            timer.join()
+            release.set()
+            thread.join()
@@ -0,0 +1,167 @@
+"""
+Bulkheads and circuit breakers for the upstream services we depend on.
+
+Each upstream (openspending, ckan, ckan-datastore) admits a limited number of
+concurrent calls per worker process, so a slow upstream can't tie up every
+greenlet. After a run of consecutive failures its circuit opens and calls fail
+fast with UpstreamUnavailable until a trial call succeeds, so that callers can
+fall back to the last value they cached instead of waiting on timeouts.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from ckanapi.errors import CKANAPIError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. Once reset_timeout
+    seconds have passed, one trial call is let through, which closes the
+    circuit if it succeeds and opens it again if it fails.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def allow_request(self):
+        return self.admit()[0]
+
+    def admit(self):
+        """Returns whether a call may go ahead, and whether it is the trial call"""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True, False
+            if state == HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True, True
+            return False, False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def record_release(self):
+        """Frees the trial slot when a trial call ended neither way"""
+        with self._lock:
+            self.trial_in_flight = False
+
+
+class Upstream:
+    def __init__(
+        self, name, max_concurrency, queue_timeout, failure_threshold, reset_timeout
+    ):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @contextmanager
+    def guard(self):
+        """
+        Runs the with block as a call to this upstream, raising
+        UpstreamUnavailable instead if the circuit is open or no slot frees up
+        within queue_timeout seconds.
+        """
+        allowed, trial = self.breaker.admit()
+        if not allowed:
+            raise UpstreamUnavailable("%s circuit is open" % self.name)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            if trial:
+                self.breaker.record_release()
+            raise UpstreamUnavailable("%s has no free call slots" % self.name)
+        failed = False
+        try:
+            yield
+            self.breaker.record_success()
+        except Exception as e:
+            failed = is_failure(e)
+            if failed:
+                self.breaker.record_failure()
+                if self.breaker.state != CLOSED:
+                    logger.warning("%s circuit opened after %r", self.name, e)
+            raise
+        finally:
+            if trial and not failed:
+                self.breaker.record_release()
+            self._slots.release()
+
+
+def get_upstream(name):
+    with _upstreams_lock:
+        upstream = _upstreams.get(name, None)
+        if upstream is None:
+            upstream = Upstream(
+                name,
+                max_concurrency=settings.UPSTREAM_MAX_CONCURRENCY,
+                queue_timeout=settings.UPSTREAM_QUEUE_TIMEOUT,
+                failure_threshold=settings.UPSTREAM_FAILURE_THRESHOLD,
+                reset_timeout=settings.UPSTREAM_RESET_TIMEOUT,
+            )
+            _upstreams[name] = upstream
+        return upstream
+
+
+def circuit_states():
+    with _upstreams_lock:
+        return {name: upstream.breaker.state for name, upstream in _upstreams.items()}
+
+
+def is_failure(exception):
+    """
+    Whether an exception means the upstream is unhealthy, rather than that the
+    call asked for something it doesn't have.
+    """
+    if isinstance(exception, requests.HTTPError):
+        response = exception.response
+        return response is None or response.status_code >= 500
+    if isinstance(exception, requests.RequestException):
+        return True
+    # ckanapi raises CKANAPIError itself for responses it can't parse, like
+    # the error pages of a failing server, and subclasses like NotFound for
+    # errors reported by the API.
+    return type(exception) is CKANAPIError
+
+
+def is_unavailable(exception):
+    """Whether a caller should fall back to a cached value after an exception"""
+    return isinstance(exception, UpstreamUnavailable) or is_failure(exception)
@@ -3,11 +3,12 @@ from discourse.views import sso
 from django.conf import settings
 from django.conf.urls import include, static, url
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.sitemaps import views as sitemap_views
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import redirect
 from django.urls import include, path, re_path
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import cache_page, never_cache
 from wagtail.admin import urls as wagtailadmin_urls
 from wagtail.core import urls as wagtail_urls
 from wagtail.documents import urls as wagtaildocs_urls
@@ -31,9 +32,8 @@ def trigger_error(request):
 
 
 department_urlpatterns = [
-    url(
-        r"^$", cache_page(CACHE_MINUTES_SECS)(views.department_page), name="department"
-    ),
+    # Sections of the page are cached individually, see department_page.cached_section
+    url(r"^$", views.department_page, name="department"),
     url(
         r"^viz/subprog-treemap$",
         cache_page(CACHE_MINUTES_SECS)(views.department_viz_subprog_treemap),
@@ -69,6 +69,7 @@ urlpatterns = [
         "/(?P<sphere_slug>[\w-]+)"
         "/(?P<phase_slug>[\w-]+).json",
         cache_page(CACHE_MINUTES_SECS)(views.treemaps_json),
+        name="treemaps-json",
     ),
     # Preview pages
     url(
@@ -102,6 +103,12 @@ urlpatterns = [
         r"^json/static-search.json",
         cache_page(CACHE_MINUTES_SECS)(views.static_search_data),
     ),
+    # Upstream call latencies of this worker process, for staff only
+    url(
+        r"^json/metrics/upstreams\.json$",
+        never_cache(staff_member_required(views.upstream_metrics_json)),
+        name="upstream-metrics-json",
+    ),
     # Department list as CSV
     url(
         r"^(?P<financial_year_id>\d{4}-\d{2})" "/departments.csv$",
@@ -1,18 +1,25 @@
 import json
 import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
 from csv import DictWriter
 from datetime import datetime
 from urllib.parse import unquote, urlparse
 
-import requests
 import yaml
 from slugify import slugify
 
+from budgetportal import instrumentation, upstreams
+from budgetportal.aggregate_query import canonical_key_stats
+from budgetportal.concurrency import ContextExecutor
 from budgetportal.csv_gen import generate_csv_response
-from budgetportal.openspending import PAGE_SIZE
+from budgetportal.openspending import all_pages_url, iter_aggregate_cells
 from django.conf import settings
 from django.core.serializers import serialize
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
 from django.db.models import Count
 from django.forms.models import model_to_dict
 from django.http import Http404, HttpResponse
@@ -21,7 +28,8 @@ from django.urls import reverse
 from haystack.query import SearchQuerySet
 from constance import config
 
-from .datasets import Category, Dataset
+from .datasets import Category, Dataset, resource_fields
+from .department_page import get_materialized_sections, page_section_functions
 from .models import (
     FAQ,
     CategoryGuide,
@@ -291,70 +299,29 @@ def department_page(
             government = sphere.governments.filter(slug=government_slug).first()
             department = government.departments.filter(slug=department_slug).first()
 
+    closest_matches = FinancialYear.get_closest_match_paths(
+        years, sphere_slug, government_slug, department_slug
+    )
     financial_years_context = []
     for year in years:
-        closest_match, closest_is_exact = year.get_closest_match(department)
+        url_path, is_exact_match = closest_matches[year.slug]
         financial_years_context.append(
             {
                 "id": year.slug,
                 "is_selected": year.slug == financial_year_id,
                 "closest_match": {
-                    "url_path": closest_match.get_url_path(),
-                    "is_exact_match": closest_is_exact,
+                    "url_path": url_path,
+                    "is_exact_match": is_exact_match,
                 },
             }
         )
 
-    contributed_datasets = []
-    for dataset in department.get_contributed_datasets():
-        contributed_datasets.append(
-            {
-                "name": dataset.name,
-                "contributor": dataset.get_organization()["name"],
-                "url_path": dataset.get_url_path(),
-            }
+    sections = get_materialized_sections(department)
+    if sections is None:
+        sections = get_sections(
+            **page_section_functions(department, financial_years_context)
         )
 
-    # ======= main budget docs =========================
-    budget_dataset = department.get_dataset(group_name="budget-vote-documents")
-    if budget_dataset:
-        document_resource = budget_dataset.get_resource(format="PDF")
-        if document_resource:
-            document_resource = resource_fields(document_resource)
-        tables_resource = budget_dataset.get_resource(
-            format="XLS"
-        ) or budget_dataset.get_resource(format="XLSX")
-        if tables_resource:
-            tables_resource = resource_fields(tables_resource)
-        department_budget = {
-            "name": budget_dataset.name,
-            "document": document_resource,
-            "tables": tables_resource,
-        }
-    else:
-        department_budget = None
-
-    # ======= adjusted budget docs =========================
-    adjusted_budget_dataset = department.get_dataset(
-        group_name="adjusted-budget-vote-documents"
-    )
-    if adjusted_budget_dataset:
-        document_resource = adjusted_budget_dataset.get_resource(format="PDF")
-        if document_resource:
-            document_resource = resource_fields(document_resource)
-        tables_resource = adjusted_budget_dataset.get_resource(
-            format="XLS"
-        ) or adjusted_budget_dataset.get_resource(format="XLSX")
-        if tables_resource:
-            tables_resource = resource_fields(tables_resource)
-        department_adjusted_budget = {
-            "name": adjusted_budget_dataset.name,
-            "document": document_resource,
-            "tables": tables_resource,
-        }
-    else:
-        department_adjusted_budget = None
-
     primary_department = department.get_primary_department()
 
     if department.government.sphere.slug == "national":
@@ -376,11 +343,6 @@ def department_page(
         "subprog_econ4_bars_url": get_viz_url(
             department, "department-viz-subprog-econ4-bars"
         ),
-        "expenditure_over_time": department.get_expenditure_over_time(),
-        "budget_actual": department.get_expenditure_time_series_summary(),
-        "budget_actual_programmes": department.get_expenditure_time_series_by_programme(),
-        "adjusted_budget_summary": department.get_adjusted_budget_summary(),
-        "contributed_datasets": contributed_datasets if contributed_datasets else None,
         "financial_years": financial_years_context,
         "government": {
             "name": department.government.name,
@@ -410,8 +372,6 @@ def department_page(
             selected_year.slug,
             COMMON_DESCRIPTION_ENDING,
         ),
-        "department_budget": department_budget,
-        "department_adjusted_budget": department_adjusted_budget,
         "procurement_resource_links": ProcurementResourceLink.objects.filter(
             sphere_slug__in=(
                 "all",
@@ -448,27 +408,109 @@ def department_page(
     )
     context["eqprs_data_enabled"] = config.EQPRS_DATA_ENABLED
     context["in_year_spending_enabled"] = config.IN_YEAR_SPENDING_ENABLED
-    context["budgeted_and_actual_comparison"] = get_in_year_spending_urls(
-        department, financial_years_context
-    )
+    context.update(sections)
 
     return render(request, "department.html", context)
 
 
-def get_in_year_spending_urls(department, financial_years):
-    urls = {}
+def get_sections(**sections):
+    """
+    Computes independent page sections, given as functions by name, and
+    returns their data by name. The sections of each call run concurrently on
+    their own pool of up to PAGE_SECTION_CONCURRENCY threads, so that one
+    request's slow sections don't hold up another's. A section that fails or
+    isn't done within PAGE_SECTION_TIMEOUT seconds of starting is None, so that
+    only its panel is left out.
+    """
+    if settings.PAGE_SECTION_CONCURRENCY < 2:
+        return {
+            name: section_or_none(name, get_section)
+            for name, get_section in sections.items()
+        }
+    executor = ContextExecutor(
+        max_workers=min(len(sections), settings.PAGE_SECTION_CONCURRENCY),
+        thread_name_prefix="page-sections",
+    )
+    started_at = {}
 
-    for fy in financial_years:
-        department_obj = Department.objects.filter(
-            name=department.name,
-            government__sphere__slug="national",
-            government__sphere__financial_year__slug=fy["id"],
-        ).first()
-        year = fy["id"]
-        comparison_obj = InYearSpending(department_obj)
-        urls[year] = comparison_obj.get_detail_csv_url()
+    def run(name, get_section):
+        started_at[name] = time.monotonic()
+        return run_section(name, get_section)
 
-    return urls
+    futures = {
+        executor.submit(run, name, get_section): name
+        for name, get_section in sections.items()
+    }
+    # Sections still queued behind this call's other sections time out from
+    # when the call started
+    call_started_at = time.monotonic()
+
+    def deadline(future):
+        name = futures[future]
+        return started_at.get(name, call_started_at) + settings.PAGE_SECTION_TIMEOUT
+
+    results = {name: None for name in sections}
+    pending = set(futures)
+    try:
+        while pending:
+            now = time.monotonic()
+            for future in [f for f in pending if deadline(f) <= now]:
+                pending.discard(future)
+                future.cancel()
+                count_left_out(futures[future], "timeout")
+                logger.warning("Leaving out %s which timed out", futures[future])
+            if not pending:
+                break
+            done, pending = wait(
+                pending,
+                timeout=min(deadline(f) for f in pending) - now,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                results[futures[future]] = future.result()
+    finally:
+        executor.shutdown(wait=False)
+    return results
+
+
+def run_section(name, get_section):
+    """
+    Runs a section on an executor thread, with its own database connection.
+    The executor's threads exit after the call, so the connection is closed
+    rather than left open until the database drops it.
+    """
+    try:
+        return section_or_none(name, get_section)
+    finally:
+        connections.close_all()
+
+
+def section_or_none(name, get_section):
+    """
+    Returns the data for a page section, or None to leave the section out when
+    it fails, e.g. because an upstream service it needs is unavailable and
+    nothing is cached for it.
+    """
+    try:
+        return get_section()
+    except upstreams.UpstreamUnavailable:
+        count_left_out(name, "unavailable")
+        logger.warning("Leaving out %s", name, exc_info=True)
+        return None
+    except Exception:
+        count_left_out(name, "failed")
+        logger.exception("Leaving out %s which failed", name)
+        return None
+
+
+left_out_sections = Counter()
+_left_out_sections_lock = threading.Lock()
+
+
+def count_left_out(name, reason):
+    """Counts the page sections left out by this worker process, for the metrics"""
+    with _left_out_sections_lock:
+        left_out_sections["%s:%s" % (name, reason)] += 1
 
 
 def get_department_project_summary(government_label, department):
@@ -608,6 +650,28 @@ def infrastructure_projects_overview_json(request):
     return HttpResponse(response_json, content_type="application/json")
 
 
+def upstream_metrics_json(request):
+    """
+    Latency percentiles over the recent calls to each upstream service, and
+    counts of the page sections left out, for the worker process that handles
+    the request.
+    """
+    with _left_out_sections_lock:
+        left_out = dict(left_out_sections)
+    response_json = json.dumps(
+        {
+            "upstreams": instrumentation.latency_windows.summary(),
+            "circuits": upstreams.circuit_states(),
+            "aggregate_queries": canonical_key_stats.summary(),
+            "left_out_sections": left_out,
+        },
+        sort_keys=True,
+        indent=4,
+        separators=(",", ": "),
+    )
+    return HttpResponse(response_json, content_type="application/json")
+
+
 def infrastructure_project_list(request):
     context = {
         "page": {"layout": "about", "data_key": "about"},
@@ -708,8 +772,8 @@ def infrastructure_project_detail(request, project_slug):
 def openspending_csv(request):
     """
     Ensure that API call is to OpenSpending *
-    Get result from API call
-    Feed dict result to CSV generator
+    Walk the pages of the API call result lazily, bypassing the cache
+    Feed the cells to the CSV generator as they arrive
     Return streaming http response
     :param request: HttpRequest
     :return: StreamingHttpResponse
@@ -729,12 +793,10 @@ def openspending_csv(request):
             status=403,
         )
 
-    result = requests.get(api_url)
-    logger.info("request %s took %dms", api_url, result.elapsed.microseconds / 1000)
-    result.raise_for_status()
-    if result.json()["total_cell_count"] > PAGE_SIZE:
-        raise Exception("More cells than expected - perhaps we should start paging")
-    return generate_csv_response(result.json())
+    # Arbitrary URLs aren't cached, so that they can't push out the cached
+    # aggregates the pages use
+    cells = iter_aggregate_cells(all_pages_url(api_url), use_cache=False)
+    return generate_csv_response({"cells": cells})
 
 
 def dataset_fields(dataset):
@@ -759,15 +821,6 @@ def dataset_fields(dataset):
     }
 
 
-def resource_fields(resource):
-    return {
-        "name": resource["name"],
-        "url": resource["url"],
-        "description": resource["description"],
-        "format": resource["format"],
-    }
-
-
 def category_fields(category):
     return {
         "name": category.name,
@@ -13,7 +13,6 @@ import logging
 import os
 import csv
 import tempfile
-import requests
 import hashlib
 import base64
 import json
@@ -24,6 +23,7 @@ import datetime
 
 logger = logging.getLogger(__name__)
 ckan = settings.CKAN
+http_session = settings.HTTP_SESSION
 
 RE_END_YEAR = re.compile(r"/\d+")
 
@@ -78,7 +78,7 @@ def authorise_upload(path, filename, userid, data_package_name, datastore_token)
         },
     }
     authorize_upload_headers = {"auth-token": datastore_token}
-    r = requests.post(
+    r = http_session.post(
         authorize_upload_url,
         json=authorize_upload_payload,
         headers=authorize_upload_headers,
@@ -97,7 +97,7 @@ def upload(path, authorisation):
         "Content-MD5": authorisation["md5"],
     }
     with open(path, "rb") as file:
-        r = requests.put(upload_url, data=file, headers=upload_headers)
+        r = http_session.put(upload_url, data=file, headers=upload_headers)
     r.raise_for_status()
 
 
@@ -147,7 +147,7 @@ def tidy_csv_table(original_csv_path, composite_key):
 def authenticate_openspending():
     headers = {"x-api-key": settings.OPENSPENDING_API_KEY}
     url = f"{settings.OPENSPENDING_HOST}/user/authenticate_api_key"
-    r = requests.post(url, headers=headers)
+    r = http_session.post(url, headers=headers)
     r.raise_for_status()
     return r.json()["token"]
 
@@ -176,7 +176,7 @@ def create_data_package(
         authorize_url = (
             f"{settings.OPENSPENDING_HOST}/user/authorize?{urlencode(authorize_query)}"
         )
-        r = requests.get(authorize_url)
+        r = http_session.get(authorize_url)
 
         r.raise_for_status()
 
@@ -242,7 +242,7 @@ def import_uploaded_package(data_package_url, datastore_token, obj_to_update):
     import_url = (
         f"{settings.OPENSPENDING_HOST}/package/upload?{urlencode(import_query)}"
     )
-    r = requests.post(import_url)
+    r = http_session.post(import_url)
     update_import_report(obj_to_update, f"Initial status: {r.text}")
 
     r.raise_for_status()
@@ -270,7 +270,7 @@ def check_and_update_status(status, data_package_url, obj_to_update):
     )
     while status not in ["done", "fail"]:
         time.sleep(5)
-        r = requests.get(status_url)
+        r = http_session.get(status_url)
         r.raise_for_status()
         status_result = r.json()
         new_progress = int(float(status_result["progress"]) * 100)
@@ -389,6 +389,8 @@ def create_or_update_dataset(
         "extras": [{"key": "latest_quarter", "value": latest_quarter}],
     }
 
+    # Look for the dataset in CKAN itself rather than a cached search result
+    ckan.invalidate_cache()
     query = {"fq": (f"+name:{dataset_fields['name']}")}
     search_response = ckan.action.package_search(**query)
 
@@ -402,6 +404,7 @@ def create_or_update_dataset(
         dataset_fields["id"] = search_response["results"][0]["id"]
         update_import_report(obj_to_update, "Updating the dataset in CKAN")
         response = update_dataset(dataset_fields)
+    ckan.invalidate_cache()
 
 
 def add_resource(response, dataset_fields, userid, data_package_name):
@@ -123,9 +123,9 @@ class IYMFileUploadTestCase(TestCase):
     def tearDown(self):
         self.zip_file.close()
 
-    @mock.patch("requests.get", side_effect=mocked_requests_get)
-    @mock.patch("requests.post", side_effect=mocked_requests_post)
-    @mock.patch("requests.put", side_effect=mocked_requests_put)
+    @mock.patch("iym.tasks.http_session.get", side_effect=mocked_requests_get)
+    @mock.patch("iym.tasks.http_session.post", side_effect=mocked_requests_post)
+    @mock.patch("iym.tasks.http_session.put", side_effect=mocked_requests_put)
     def test_uploading(self, mock_get, mock_post, mock_put):
         financial_year = FinancialYear.objects.create(slug="2021-22")
         test_element = IYMFileUpload.objects.create(
@@ -155,9 +155,9 @@ class IYMFileUploadTestCase(TestCase):
         )
         assert test_element.status == "done"
 
-    @mock.patch("requests.get", side_effect=mocked_wrong_requests_get)
-    @mock.patch("requests.post", side_effect=mocked_requests_post)
-    @mock.patch("requests.put", side_effect=mocked_requests_put)
+    @mock.patch("iym.tasks.http_session.get", side_effect=mocked_wrong_requests_get)
+    @mock.patch("iym.tasks.http_session.post", side_effect=mocked_requests_post)
+    @mock.patch("iym.tasks.http_session.put", side_effect=mocked_requests_put)
     def test_uploading_with_wrong_token(self, mock_get, mock_post, mock_put):
         financial_year = FinancialYear.objects.create(slug="2021-22")
         test_element = IYMFileUpload.objects.create(